@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+import base64
+import math
+import os
+import random
+import time
+from typing import Dict
+from typing import List
+
+import attr
+
+from virtualenv_cache import Cache
+
+SIZE_DISTRIBUTIONS = ("constant", "uniform", "lognormal")
+
+# Spread of file sizes in the lognormal distribution, most files are small and a few are much larger.
+_LOGNORMAL_SIGMA = 1.5
+_MAX_SIZE_FACTOR = 64
+
+
+@attr.s(slots=True)
+class VirtualenvSpec:
+    """Parameters of a synthetic virtual environment."""
+
+    files = attr.ib(type=int, default=1000, validator=attr.validators.ge(1))
+    mean_size = attr.ib(type=int, default=8 * 1024, validator=attr.validators.ge(0))
+    size_distribution = attr.ib(
+        type=str,
+        default="lognormal",
+        validator=attr.validators.in_(SIZE_DISTRIBUTIONS),
+    )
+    symlink_ratio = attr.ib(type=float, default=0.01)
+    files_per_directory = attr.ib(type=int, default=20, validator=attr.validators.ge(1))
+    seed = attr.ib(type=int, default=0)
+
+    @symlink_ratio.validator
+    def _check_symlink_ratio(self, _: "attr.Attribute[float]", value: float) -> None:
+        if not 0.0 <= value <= 1.0:
+            raise ValueError(f"'symlink_ratio' must be in [0, 1] (got {value!r})")
+
+    def sample_size(self, rng: random.Random) -> int:
+        """Draw a file size from the configured distribution."""
+        if self.size_distribution == "constant" or self.mean_size == 0:
+            return self.mean_size
+
+        if self.size_distribution == "uniform":
+            return rng.randint(0, 2 * self.mean_size)
+
+        mu = math.log(self.mean_size) - _LOGNORMAL_SIGMA**2 / 2
+        return min(
+            int(rng.lognormvariate(mu, _LOGNORMAL_SIGMA)),
+            _MAX_SIZE_FACTOR * self.mean_size,
+        )
+
+
+def _content(rng: random.Random, size: int) -> bytes:
+    """Generate text-like content of the given size, it compresses roughly as source code does."""
+    raw = rng.getrandbits(8 * (size * 3 // 4 + 3)).to_bytes(size * 3 // 4 + 3, "big")
+    return base64.b64encode(raw)[:size]
+
+
+def generate_virtualenv(path: str, spec: VirtualenvSpec) -> Dict[str, int]:
+    """Create a synthetic virtual environment in the given directory, return numbers of files, symlinks and bytes."""
+    rng = random.Random(spec.seed)
+    site_packages = os.path.join(path, "lib", "python3", "site-packages")
+    bin_dir = os.path.join(path, "bin")
+    os.makedirs(site_packages)
+    os.makedirs(bin_dir)
+
+    with open(os.path.join(path, "pyvenv.cfg"), "w") as f:
+        f.write("home = /usr/bin\ninclude-system-site-packages = false\n")
+
+    file_paths: List[str] = []
+    total_size = 0
+    for i in range(spec.files):
+        package_dir = os.path.join(
+            site_packages, f"package_{i // spec.files_per_directory:05d}"
+        )
+        if i % spec.files_per_directory == 0:
+            os.mkdir(package_dir)
+
+        file_path = os.path.join(package_dir, f"module_{i:06d}.py")
+        size = spec.sample_size(rng)
+        with open(file_path, "wb") as f:
+            f.write(_content(rng, size))
+
+        file_paths.append(file_path)
+        total_size += size
+
+    symlinks = round(spec.files * spec.symlink_ratio)
+    for i in range(symlinks):
+        target = rng.choice(file_paths)
+        os.symlink(
+            os.path.relpath(target, bin_dir), os.path.join(bin_dir, f"link_{i:06d}")
+        )
+
+    return {"files": spec.files, "symlinks": symlinks, "bytes": total_size}
+
+
+def generate_lock_files(
+    directory: str, count: int, packages: int, *, seed: int = 0
+) -> List[str]:
+    """Create the given number of requirements lock files stating packages with hashes, return their paths."""
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"requirements-{i:03d}.txt")
+        with open(path, "w") as f:
+            for j in range(packages):
+                f.write(
+                    f"package-{i}-{j}=={rng.randint(0, 9)}.{rng.randint(0, 99)}.0 \\\n"
+                    f"    --hash=sha256:{rng.getrandbits(256):064x}\n"
+                )
+        paths.append(path)
+
+    # Lock files modified recently are not memoized, see LockFileHasher.
+    past = time.time() - 60
+    for path in paths:
+        os.utime(path, (past, past))
+
+    return paths
+
+
+def populate_cache(cache: Cache, spec: VirtualenvSpec, entries: int) -> Dict[str, int]:
+    """Store the given number of entries into the cache, each for a different lock file content.
+
+    The virtual environment is generated once, each entry differs from the previous one in a single file.
+    The configured lock files are rewritten, the cache size has to allow keeping all the entries.
+    """
+    venv_path = cache.config.expanded_virtualenv_path
+    stats = generate_virtualenv(venv_path, spec)
+    marker_path = os.path.join(
+        venv_path, "lib", "python3", "site-packages", "entry.txt"
+    )
+    for i in range(entries):
+        for lock_path in cache.config.requirements_lock_paths:
+            with open(lock_path, "w") as f:
+                f.write(f"package-{i}==1.0.0\n")
+
+        with open(marker_path, "w") as f:
+            f.write(str(i))
+
+        cache.store()
+        cache.wait()
+
+    return stats
@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from queue import Empty
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+
+import attr
+import click
+
+from virtualenv_cache import Cache
+from virtualenv_cache import Config
+from virtualenv_cache import __version__
+from virtualenv_cache._copy import COPY_STRATEGIES
+
+from .generate import SIZE_DISTRIBUTIONS
+from .generate import VirtualenvSpec
+from .generate import generate_lock_files
+from .generate import generate_virtualenv
+from .generate import populate_cache
+
+_LOGGER = logging.getLogger(__name__)
+
+OPERATIONS = ("store", "restore", "list", "trim", "hash", "hash_memoized")
+
+
+def _get_max_rss() -> Optional[int]:
+    """Get peak resident set size of the current process in bytes, None if not available on the platform."""
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in kilobytes on Linux, in bytes on macOS.
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def _measure(
+    operation: str,
+    config_kwargs: Dict[str, Any],
+    queue: "multiprocessing.Queue[Dict[str, Any]]",
+) -> None:
+    """Run the operation once in a fresh process, report wall time and peak RSS."""
+    config = Config(**config_kwargs)
+    cache = Cache(config=config)
+    operations: Dict[str, Callable[[], Any]] = {
+        "store": cache.store,
+        "restore": cache.restore,
+        "list": cache.list,
+        "trim": cache._trim_cache,
+        "hash": cache._hash_all_lock_files,
+        "hash_memoized": cache._hash_all_lock_files,
+    }
+
+    baseline_rss = _get_max_rss()
+    start = time.perf_counter()
+    operations[operation]()
+    cache.wait()
+    wall_time = time.perf_counter() - start
+    queue.put(
+        {
+            "wall_time": wall_time,
+            "baseline_rss": baseline_rss,
+            "peak_rss": _get_max_rss(),
+        }
+    )
+
+
+@attr.s(slots=True)
+class BenchmarkRunner:
+    """Prepare synthetic workloads on disk and measure cache operations on them."""
+
+    work_dir = attr.ib(type=str)
+    spec = attr.ib(type=VirtualenvSpec)
+    entries = attr.ib(type=int, default=20, kw_only=True)
+    lock_files = attr.ib(type=int, default=4, kw_only=True)
+    lock_file_packages = attr.ib(type=int, default=200, kw_only=True)
+    repeat = attr.ib(type=int, default=3, kw_only=True)
+    config_overrides = attr.ib(type=Dict[str, Any], factory=dict, kw_only=True)
+
+    def _config(self, name: str, **kwargs: Any) -> Dict[str, Any]:
+        """Create configuration for a workload of the given name, all paths are absolute."""
+        workload_dir = os.path.join(self.work_dir, name)
+        os.makedirs(workload_dir, exist_ok=True)
+        config = {
+            "cache_path": os.path.join(workload_dir, "cache"),
+            "virtualenv_path": os.path.join(workload_dir, "venv"),
+            "requirements_lock_paths": [os.path.join(workload_dir, "requirements.txt")],
+            "cache_size": self.entries + 1,
+            **self.config_overrides,
+            **kwargs,
+        }
+        # Validate early rather than in each child process.
+        Config(**config)
+        return config
+
+    def _run(
+        self,
+        operation: str,
+        config: Dict[str, Any],
+        *,
+        items: int,
+        size: int,
+        prepare: Optional[Callable[[], None]] = None,
+    ) -> Dict[str, Any]:
+        """Run the operation repeatedly, each run in a new process prepared using the given function."""
+        context = multiprocessing.get_context("spawn")
+        runs = []
+        for _ in range(self.repeat):
+            if prepare is not None:
+                prepare()
+
+            queue = context.Queue()
+            process = context.Process(target=_measure, args=(operation, config, queue))
+            process.start()
+            # Read the result before joining, the child could block on a full pipe otherwise.
+            result = None
+            while result is None:
+                try:
+                    result = queue.get(timeout=0.1)
+                except Empty:
+                    if not process.is_alive():
+                        break
+            process.join()
+            if process.exitcode != 0 or result is None:
+                raise RuntimeError(
+                    f"Benchmark of {operation!r} failed with exit code {process.exitcode}"
+                )
+            runs.append(result)
+
+        wall_times = [r["wall_time"] for r in runs]
+        best = min(wall_times)
+        peak_rss = [r["peak_rss"] for r in runs if r["peak_rss"] is not None]
+        baseline_rss = [
+            r["baseline_rss"] for r in runs if r["baseline_rss"] is not None
+        ]
+        _LOGGER.info("Benchmark %r took %.3fs at best", operation, best)
+        return {
+            "operation": operation,
+            "runs": len(runs),
+            "wall_time": {
+                "min": best,
+                "median": statistics.median(wall_times),
+                "max": max(wall_times),
+            },
+            "items": items,
+            "bytes": size,
+            "items_per_second": items / best if best else None,
+            "bytes_per_second": size / best if best else None,
+            "peak_rss_bytes": max(peak_rss) if peak_rss else None,
+            "baseline_rss_bytes": min(baseline_rss) if baseline_rss else None,
+        }
+
+    def bench_store(self) -> Dict[str, Any]:
+        """Measure storing a virtual environment into an empty cache."""
+        config = self._config("store")
+        stats = generate_virtualenv(config["virtualenv_path"], self.spec)
+        with open(config["requirements_lock_paths"][0], "w") as f:
+            f.write("package==1.0.0\n")
+
+        def _prepare() -> None:
+            shutil.rmtree(config["cache_path"], ignore_errors=True)
+            # Force a full store, the manifest written on store would make it incremental.
+            manifest_path = os.path.join(
+                config["virtualenv_path"], ".virtualenv-cache-manifest.json"
+            )
+            if os.path.exists(manifest_path):
+                os.remove(manifest_path)
+
+        return self._run(
+            "store",
+            config,
+            items=stats["files"] + stats["symlinks"],
+            size=stats["bytes"],
+            prepare=_prepare,
+        )
+
+    def bench_restore(self) -> Dict[str, Any]:
+        """Measure restoring a virtual environment from the cache, the virtual environment does not exist."""
+        config = self._config("restore")
+        cache = Cache(config=Config(**config))
+        stats = populate_cache(cache, self.spec, 1)
+
+        def _prepare() -> None:
+            shutil.rmtree(config["virtualenv_path"], ignore_errors=True)
+
+        return self._run(
+            "restore",
+            config,
+            items=stats["files"] + stats["symlinks"],
+            size=stats["bytes"],
+            prepare=_prepare,
+        )
+
+    def _populated_cache(self) -> Dict[str, Any]:
+        """Get configuration of a cache holding the configured number of entries, created on first use."""
+        config = self._config("populated")
+        if not os.path.isdir(config["cache_path"]):
+            populate_cache(Cache(config=Config(**config)), self.spec, self.entries)
+        return config
+
+    def bench_list(self) -> Dict[str, Any]:
+        """Measure listing a cache with the configured number of entries."""
+        config = self._populated_cache()
+        return self._run("list", config, items=self.entries, size=0)
+
+    def bench_trim(self) -> Dict[str, Any]:
+        """Measure removing half of the entries from a cache with the configured number of entries."""
+        template = self._populated_cache()
+        config = self._config("trim", cache_size=max(self.entries // 2, 1))
+
+        def _prepare() -> None:
+            shutil.rmtree(config["cache_path"], ignore_errors=True)
+            shutil.copytree(template["cache_path"], config["cache_path"], symlinks=True)
+
+        return self._run(
+            "trim",
+            config,
+            items=self.entries - config["cache_size"],
+            size=0,
+            prepare=_prepare,
+        )
+
+    def _bench_hash(self, operation: str) -> Dict[str, Any]:
+        """Measure hashing of lock files, the memo of digests is removed before each run unless memoized."""
+        workload_dir = os.path.join(self.work_dir, operation)
+        os.makedirs(workload_dir, exist_ok=True)
+        paths = generate_lock_files(
+            workload_dir, self.lock_files, self.lock_file_packages, seed=self.spec.seed
+        )
+        config = self._config(operation, requirements_lock_paths=paths)
+        os.makedirs(config["cache_path"], exist_ok=True)
+        cache = Cache(config=Config(**config))
+        memo_path = cache._get_lock_file_hasher().memo_path
+
+        def _prepare() -> None:
+            if operation == "hash" and memo_path and os.path.exists(memo_path):
+                os.remove(memo_path)
+
+        if operation == "hash_memoized":
+            cache._hash_all_lock_files()
+
+        return self._run(
+            operation,
+            config,
+            items=len(paths),
+            size=sum(os.path.getsize(p) for p in paths),
+            prepare=_prepare,
+        )
+
+    def run(self, operations: List[str]) -> List[Dict[str, Any]]:
+        """Run benchmarks of the given operations."""
+        benchmarks: Dict[str, Callable[[], Dict[str, Any]]] = {
+            "store": self.bench_store,
+            "restore": self.bench_restore,
+            "list": self.bench_list,
+            "trim": self.bench_trim,
+            "hash": lambda: self._bench_hash("hash"),
+            "hash_memoized": lambda: self._bench_hash("hash_memoized"),
+        }
+        return [benchmarks[operation]() for operation in operations]
+
+
+def run_benchmarks(
+    spec: VirtualenvSpec,
+    *,
+    operations: List[str],
+    work_dir: Optional[str] = None,
+    **kwargs: Any,
+) -> Dict[str, Any]:
+    """Run the benchmarks in a temporary directory, return a report serializable to JSON."""
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp_dir:
+        runner = BenchmarkRunner(tmp_dir, spec, **kwargs)
+        results = runner.run(operations)
+
+    return {
+        "version": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "parameters": {
+            "virtualenv": attr.asdict(spec),
+            "entries": runner.entries,
+            "lock_files": runner.lock_files,
+            "lock_file_packages": runner.lock_file_packages,
+            "repeat": runner.repeat,
+            "config": runner.config_overrides,
+        },
+        "results": results,
+    }
+
+
+@click.command()
+@click.option(
+    "--files",
+    type=int,
+    default=1000,
+    show_default=True,
+    help="Number of files in the virtual environment.",
+)
+@click.option(
+    "--mean-size",
+    type=int,
+    default=8 * 1024,
+    show_default=True,
+    help="Mean file size in bytes.",
+)
+@click.option(
+    "--size-distribution",
+    type=click.Choice(SIZE_DISTRIBUTIONS),
+    default="lognormal",
+    show_default=True,
+    help="Distribution of file sizes.",
+)
+@click.option(
+    "--symlink-ratio",
+    type=float,
+    default=0.01,
+    show_default=True,
+    help="Number of symlinks relative to files.",
+)
+@click.option(
+    "--seed",
+    type=int,
+    default=0,
+    show_default=True,
+    help="Seed of the generated content.",
+)
+@click.option(
+    "--entries",
+    type=int,
+    default=20,
+    show_default=True,
+    help="Number of entries in the cache for list and trim.",
+)
+@click.option(
+    "--lock-files",
+    type=int,
+    default=4,
+    show_default=True,
+    help="Number of lock files to hash.",
+)
+@click.option(
+    "--lock-file-packages",
+    type=int,
+    default=200,
+    show_default=True,
+    help="Number of packages in each lock file.",
+)
+@click.option(
+    "--entry-format",
+    type=click.Choice(Config.ENTRY_FORMATS),
+    default="tree",
+    show_default=True,
+)
+@click.option(
+    "--copy-strategy",
+    type=click.Choice(COPY_STRATEGIES),
+    default="copy",
+    show_default=True,
+)
+@click.option("--copy-workers", type=int, default=8, show_default=True)
+@click.option(
+    "--repeat",
+    type=int,
+    default=3,
+    show_default=True,
+    help="Number of runs of each operation.",
+)
+@click.option(
+    "--operation",
+    "operations",
+    type=click.Choice(OPERATIONS),
+    multiple=True,
+    help="Operations to benchmark, all by default.",
+)
+@click.option(
+    "--work-dir",
+    type=click.Path(file_okay=False),
+    help="Directory to create workloads in.",
+)
+@click.option(
+    "--output",
+    type=click.File("w"),
+    default="-",
+    help="File to write the JSON report to.",
+)
+def cli(
+    files: int,
+    mean_size: int,
+    size_distribution: str,
+    symlink_ratio: float,
+    seed: int,
+    entries: int,
+    lock_files: int,
+    lock_file_packages: int,
+    entry_format: str,
+    copy_strategy: str,
+    copy_workers: int,
+    repeat: int,
+    operations: List[str],
+    work_dir: Optional[str],
+    output: Any,
+) -> None:
+    """Benchmark cache operations on synthetic virtual environments and caches."""
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    spec = VirtualenvSpec(
+        files=files,
+        mean_size=mean_size,
+        size_distribution=size_distribution,
+        symlink_ratio=symlink_ratio,
+        seed=seed,
+    )
+    report = run_benchmarks(
+        spec,
+        operations=list(operations or OPERATIONS),
+        work_dir=work_dir,
+        entries=entries,
+        lock_files=lock_files,
+        lock_file_packages=lock_file_packages,
+        repeat=repeat,
+        config_overrides={
+            "entry_format": entry_format,
+            "copy_strategy": copy_strategy,
+            "copy_workers": copy_workers,
+        },
+    )
+    json.dump(report, output, indent=2)
+    output.write("\n")
+
+
+if __name__ == "__main__":
+    cli()
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import os
+from typing import Set
 
 import attr
 
@@ -23,3 +24,52 @@ class ProjectInfo:
     project_dir = attr.ib(type=str, kw_only=True)
     cache_dir = attr.ib(type=str, kw_only=True)
     config_path = attr.ib(type=str, kw_only=True)
+
+
+def write_file(venv_path: str, path: str, content: str) -> None:
+    """Write the given file of the virtual environment, parent directories are created."""
+    file_path = os.path.join(venv_path, *path.split("/"))
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "w") as f:
+        f.write(content)
+
+
+def read_file(venv_path: str, path: str) -> str:
+    """Read the given file of the virtual environment."""
+    with open(os.path.join(venv_path, *path.split("/"))) as f:
+        return f.read()
+
+
+def list_files(path: str) -> Set[str]:
+    """List files in the given directory tree as relative paths."""
+    return {
+        os.path.relpath(os.path.join(root, file_name), path)
+        for root, _, file_names in os.walk(path)
+        for file_name in file_names
+    }
+
+
+def create_virtualenv(venv_path: str, *, scripts: bool = False) -> None:
+    """Create a fake virtual environment with a few files.
+
+    If requested, scripts and configuration stating the path to the virtual environment are created as well.
+    """
+    for name in ("foo/a.py", "foo/b.py", "bar/c.py"):
+        write_file(venv_path, f"lib/{name}", f"# {name}\n")
+
+    if not scripts:
+        return
+
+    files = {
+        "pyvenv.cfg": f"home = /usr/bin\ncommand = /usr/bin/python3 -m venv {venv_path}\n",
+        "bin/pip": f"#!{venv_path}/bin/python\nimport pip\n",
+        "bin/activate": f'VIRTUAL_ENV="{venv_path}"\nexport VIRTUAL_ENV\n',
+        "lib/foo/__init__.py": f"# {venv_path} is not rewritten outside of scripts\n",
+    }
+    for path, content in files.items():
+        write_file(venv_path, path, content)
+    os.chmod(os.path.join(venv_path, "bin", "pip"), 0o755)
+    os.symlink("/usr/bin/python3", os.path.join(venv_path, "bin", "python"))
+    os.symlink(
+        os.path.join(venv_path, "bin", "pip"), os.path.join(venv_path, "bin", "pip3")
+    )
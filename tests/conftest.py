@@ -2,16 +2,58 @@
 import os
 import shutil
 import tempfile
+import threading
+import time
 from typing import Generator
 
 from base import BaseTestcase
 from base import ProjectInfo
+from s3_server import S3Server
+
+import virtualenv_cache._cache
+from virtualenv_cache._daemon import CacheDaemon
 
 import tomli
 import tomli_w
 import pytest
 
 
+@pytest.fixture(autouse=True)
+def daemon_socket_path(monkeypatch: pytest.MonkeyPatch) -> Generator[str, None, None]:
+    """Point clients to a socket no daemon listens on, so that a daemon running on the machine is not used."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        socket_path = os.path.join(tmp_dir, "daemon.sock")
+        monkeypatch.setenv("VIRTUALENV_CACHE_SOCKET", socket_path)
+        yield socket_path
+
+
+@pytest.fixture(autouse=True)
+def wait_for_purge(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Wait for trash to be purged in background, so that nothing is removed once a test finishes."""
+    spawn_purge = virtualenv_cache._cache.spawn_purge
+    monkeypatch.setattr(
+        virtualenv_cache._cache,
+        "spawn_purge",
+        lambda *args, **kwargs: spawn_purge(*args, **kwargs).wait(),
+    )
+
+
+@pytest.fixture
+def cache_daemon(daemon_socket_path: str) -> Generator[CacheDaemon, None, None]:
+    """Yield a daemon listening on the socket clients use."""
+    daemon = CacheDaemon(daemon_socket_path)
+    thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+    thread.start()
+    while not os.path.exists(daemon_socket_path):
+        time.sleep(0.01)
+
+    try:
+        yield daemon
+    finally:
+        daemon.shutdown()
+        thread.join()
+
+
 @pytest.fixture
 def project_info() -> Generator[ProjectInfo, None, None]:
     """Yield a project directory with a cache set up."""
@@ -37,3 +79,22 @@ def project_info() -> Generator[ProjectInfo, None, None]:
             cache_dir=tmp_cache_project_dir,
             config_path=config_path,
         )
+
+
+@pytest.fixture
+def s3_server(monkeypatch: pytest.MonkeyPatch) -> Generator[S3Server, None, None]:
+    """Yield a local stand-in for an S3-compatible object store, requests are signed using test credentials."""
+    server = S3Server(access_key="AKIDTEST", secret_key="test-secret")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", server.access_key)
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", server.secret_key)
+    monkeypatch.delenv("AWS_SESSION_TOKEN", raising=False)
+
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+    )
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+import datetime
+import hashlib
+import threading
+import urllib.parse
+import uuid
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Tuple
+from xml.etree import ElementTree
+
+from virtualenv_cache._s3 import sign_request
+
+_XML_NAMESPACE = "http://s3.amazonaws.com/doc/2006-03-01/"
+
+
+class S3Server(ThreadingHTTPServer):
+    """A local stand-in for an S3-compatible object store keeping objects in memory.
+
+    Only requests used by the S3 backend are supported, signatures are verified if credentials are set.
+    """
+
+    daemon_threads = True
+    # Keep listing pages small so that pagination is exercised.
+    PAGE_SIZE = 3
+
+    def __init__(self, access_key: str = "", secret_key: str = "") -> None:
+        """Bind to a free port on localhost."""
+        super().__init__(("127.0.0.1", 0), _S3RequestHandler)
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.objects: Dict[Tuple[str, str], bytes] = {}
+        self.modified: Dict[Tuple[str, str], datetime.datetime] = {}
+        self.uploads: Dict[str, Dict[int, bytes]] = {}
+        self.requests: List[Tuple[str, str, Dict[str, str]]] = []
+        self.lock = threading.Lock()
+
+    @property
+    def endpoint_url(self) -> str:
+        """Get URL the server listens on."""
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class _S3RequestHandler(BaseHTTPRequestHandler):
+    """Handle requests to the stand-in server."""
+
+    server: S3Server
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        """Do not log requests."""
+
+    def _respond(
+        self, status: int, body: bytes = b"", headers: Dict[str, str] = {}
+    ) -> None:
+        """Send a response."""
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    @staticmethod
+    def _xml(root: str, items: List[Tuple[str, Any]]) -> bytes:
+        """Create a simple XML document in the S3 namespace."""
+        content = "".join(f"<{k}>{v}</{k}>" for k, v in items)
+        return f'<{root} xmlns="{_XML_NAMESPACE}">{content}</{root}>'.encode()
+
+    def _put(self, bucket: str, key: str, body: bytes) -> None:
+        """Store the given object."""
+        self.server.objects[(bucket, key)] = body
+        self.server.modified[(bucket, key)] = datetime.datetime.now(
+            tz=datetime.timezone.utc
+        )
+
+    def _handle(self, method: str) -> None:
+        """Dispatch the request."""
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query, keep_blank_values=True))
+        path = urllib.parse.unquote(url.path)
+        bucket, _, key = path.lstrip("/").partition("/")
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+        with self.server.lock:
+            self.server.requests.append((method, key, query))
+
+        if self.server.access_key and not self._check_signature(
+            method, path, query, body
+        ):
+            self._respond(403, b"<Error><Code>SignatureDoesNotMatch</Code></Error>")
+            return
+
+        objects = self.server.objects
+        if method == "GET" and not key:
+            keys = sorted(
+                k for b, k in objects if b == bucket and k.startswith(query["prefix"])
+            )
+            start = int(query.get("continuation-token", 0))
+            page = keys[start : start + self.server.PAGE_SIZE]
+            items: List[Tuple[str, Any]] = [
+                (
+                    "Contents",
+                    f"<Key>{k}</Key><Size>{len(objects[(bucket, k)])}</Size>"
+                    f"<LastModified>{self.server.modified[(bucket, k)].strftime('%Y-%m-%dT%H:%M:%S.000Z')}"
+                    "</LastModified>",
+                )
+                for k in page
+            ]
+            truncated = start + len(page) < len(keys)
+            items.append(("IsTruncated", str(truncated).lower()))
+            if truncated:
+                items.append(("NextContinuationToken", start + len(page)))
+            self._respond(200, self._xml("ListBucketResult", items))
+        elif method == "GET":
+            content = objects.get((bucket, key))
+            if content is None:
+                self._respond(404, b"<Error><Code>NoSuchKey</Code></Error>")
+            elif "Range" in self.headers:
+                start, end = self.headers["Range"][len("bytes=") :].split("-")
+                self._respond(206, content[int(start) : int(end) + 1])
+            else:
+                self._respond(200, content)
+        elif method == "PUT" and "uploadId" in query:
+            self.server.uploads[query["uploadId"]][int(query["partNumber"])] = body
+            self._respond(200, headers={"ETag": f'"{uuid.uuid4().hex}"'})
+        elif method == "PUT":
+            self._put(bucket, key, body)
+            self._respond(200)
+        elif method == "POST" and "uploads" in query:
+            upload_id = uuid.uuid4().hex
+            self.server.uploads[upload_id] = {}
+            self._respond(
+                200,
+                self._xml("InitiateMultipartUploadResult", [("UploadId", upload_id)]),
+            )
+        elif method == "POST" and "uploadId" in query:
+            parts = self.server.uploads.pop(query["uploadId"])
+            numbers = [
+                int(e.text)  # type: ignore
+                for e in ElementTree.fromstring(body).iter("PartNumber")
+            ]
+            self._put(bucket, key, b"".join(parts[n] for n in numbers))
+            self._respond(200, self._xml("CompleteMultipartUploadResult", []))
+        elif method == "DELETE" and "uploadId" in query:
+            self.server.uploads.pop(query["uploadId"], None)
+            self._respond(204)
+        elif method == "DELETE":
+            objects.pop((bucket, key), None)
+            self.server.modified.pop((bucket, key), None)
+            self._respond(204)
+        else:
+            self._respond(400)
+
+    def _check_signature(
+        self, method: str, path: str, query: Dict[str, str], body: bytes
+    ) -> bool:
+        """Verify the request was signed using the configured credentials."""
+        authorization = self.headers.get("Authorization", "")
+        if not authorization.startswith(
+            f"AWS4-HMAC-SHA256 Credential={self.server.access_key}/"
+        ):
+            return False
+
+        signed_headers = authorization.split("SignedHeaders=")[1].split(",")[0]
+        payload_hash = hashlib.sha256(body).hexdigest()
+        if self.headers["x-amz-content-sha256"] != payload_hash:
+            return False
+
+        now = datetime.datetime.strptime(
+            self.headers["x-amz-date"], "%Y%m%dT%H%M%SZ"
+        ).replace(tzinfo=datetime.timezone.utc)
+        expected = sign_request(
+            method=method,
+            path=path,
+            query=query,
+            headers={h: self.headers[h] for h in signed_headers.split(";")},
+            payload_hash=payload_hash,
+            region=authorization.split("/")[2],
+            access_key=self.server.access_key,
+            secret_key=self.server.secret_key,
+            now=now,
+        )
+        return authorization == expected
+
+    def do_GET(self) -> None:
+        """Handle a GET request."""
+        self._handle("GET")
+
+    def do_PUT(self) -> None:
+        """Handle a PUT request."""
+        self._handle("PUT")
+
+    def do_POST(self) -> None:
+        """Handle a POST request."""
+        self._handle("POST")
+
+    def do_DELETE(self) -> None:
+        """Handle a DELETE request."""
+        self._handle("DELETE")
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import tempfile
+
+from click.testing import CliRunner
+
+from benchmarks.generate import VirtualenvSpec
+from benchmarks.generate import generate_virtualenv
+from benchmarks.run import OPERATIONS
+from benchmarks.run import cli
+
+from base import BaseTestcase
+
+
+class TestBenchmarks(BaseTestcase):
+    """Tests related to the benchmark suite."""
+
+    def test_generate_virtualenv(self) -> None:
+        """Test generating a synthetic virtual environment as specified."""
+        spec = VirtualenvSpec(
+            files=50, mean_size=100, size_distribution="constant", symlink_ratio=0.1
+        )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            venv_path = os.path.join(tmp_dir, "venv")
+            stats = generate_virtualenv(venv_path, spec)
+
+            files = symlinks = size = 0
+            for root, _, file_names in os.walk(venv_path):
+                for file_name in file_names:
+                    path = os.path.join(root, file_name)
+                    if os.path.islink(path):
+                        symlinks += 1
+                        assert os.path.isfile(path)
+                    elif file_name != "pyvenv.cfg":
+                        files += 1
+                        size += os.path.getsize(path)
+
+        assert stats == {"files": 50, "symlinks": 5, "bytes": 5000}
+        assert (files, symlinks, size) == (50, 5, 5000)
+
+    def test_generate_virtualenv_deterministic(self) -> None:
+        """Test the content generated depends only on the seed."""
+        spec = VirtualenvSpec(files=20, mean_size=1024, seed=42)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            first = generate_virtualenv(os.path.join(tmp_dir, "first"), spec)
+            second = generate_virtualenv(os.path.join(tmp_dir, "second"), spec)
+
+        assert first == second
+
+    def test_cli(self) -> None:
+        """Test running all the benchmarks on a small workload, results are reported in JSON."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_path = os.path.join(tmp_dir, "report.json")
+            result = CliRunner().invoke(
+                cli,
+                [
+                    "--files=20",
+                    "--entries=3",
+                    "--lock-files=2",
+                    "--repeat=1",
+                    f"--work-dir={tmp_dir}",
+                    f"--output={output_path}",
+                ],
+            )
+            assert result.exit_code == 0, result.output
+
+            with open(output_path) as f:
+                report = json.load(f)
+
+        assert report["parameters"]["entries"] == 3
+        assert [r["operation"] for r in report["results"]] == list(OPERATIONS)
+        for item in report["results"]:
+            assert item["runs"] == 1
+            assert item["wall_time"]["min"] > 0
+            assert item["peak_rss_bytes"] > 0
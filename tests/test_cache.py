@@ -3,18 +3,24 @@ import datetime
 import os
 import hashlib
 import json
+import shutil
 import socket
-from dateutil.parser import parse as parse_datetime
 
 from base import BaseTestcase
 
 import pytest
+from flexmock import flexmock
+import virtualenv_cache._cache
 from virtualenv_cache import Cache
 from virtualenv_cache import Config
 from virtualenv_cache import VirtualenvCacheMiss
+from virtualenv_cache import VirtualenvCachePartialHit
+from virtualenv_cache import VirtualenvCacheStorageError
+from virtualenv_cache._archive import get_archive_name
 from virtualenv_cache.utils import cwd
 
 from base import ProjectInfo
+from base import create_virtualenv
 
 
 class TestCache(BaseTestcase):
@@ -44,7 +50,7 @@ class TestCache(BaseTestcase):
         assert set(content.keys()) == {"hostname", "datetime"}
         assert content["hostname"] == socket.gethostname()
         assert content["datetime"] is not None
-        dt = parse_datetime(content["datetime"])
+        dt = datetime.datetime.fromisoformat(content["datetime"])
         assert dt <= datetime.datetime.now(tz=datetime.timezone.utc)
 
     def test_list_entries(self, project_info: ProjectInfo) -> None:
@@ -54,18 +60,24 @@ class TestCache(BaseTestcase):
         assert cache._list_entries() == [
             {
                 "datetime": "2023-08-28T18:18:13.486841+00:00",
+                "hits": 0,
                 "hostname": "masina",
                 "id": "6f741140d80b32fc7fc72313e411569f5af412e8f9e30ae1bc52ac0837157435",
+                "size": None,
             },
             {
                 "datetime": "2023-08-28T18:08:13.486841+00:00",
+                "hits": 0,
                 "hostname": "masina",
                 "id": "18648aedbe40f5e25f2fe09f80295ed1a4bc996d1b47fb8d24c4f08a6e565b47",
+                "size": None,
             },
             {
                 "datetime": "2023-08-28T18:07:56.370582+00:00",
+                "hits": 0,
                 "hostname": "masina",
                 "id": "b824faa77c86dd2019ef176a3be4af21b02274a7680c44fc75a6606421918154",
+                "size": None,
             },
         ]
 
@@ -78,8 +90,10 @@ class TestCache(BaseTestcase):
         assert cache._list_entries() == [
             {
                 "datetime": "2023-08-28T18:18:13.486841+00:00",
+                "hits": 0,
                 "hostname": "masina",
                 "id": "6f741140d80b32fc7fc72313e411569f5af412e8f9e30ae1bc52ac0837157435",
+                "size": None,
             }
         ]
 
@@ -142,18 +156,24 @@ class TestCache(BaseTestcase):
         assert cache._list_entries() == [
             {
                 "datetime": "2023-08-28T18:18:13.486841+00:00",
+                "hits": 0,
                 "hostname": "masina",
                 "id": "6f741140d80b32fc7fc72313e411569f5af412e8f9e30ae1bc52ac0837157435",
+                "size": None,
             },
             {
                 "datetime": "2023-08-28T18:08:13.486841+00:00",
+                "hits": 0,
                 "hostname": "masina",
                 "id": "18648aedbe40f5e25f2fe09f80295ed1a4bc996d1b47fb8d24c4f08a6e565b47",
+                "size": None,
             },
             {
                 "datetime": "2023-08-28T18:07:56.370582+00:00",
+                "hits": 0,
                 "hostname": "masina",
                 "id": "b824faa77c86dd2019ef176a3be4af21b02274a7680c44fc75a6606421918154",
+                "size": None,
             },
         ]
 
@@ -166,3 +186,521 @@ class TestCache(BaseTestcase):
         with cwd(project_info.project_dir):
             cache.erase()
         assert not os.path.exists(project_info.cache_dir)
+
+    @pytest.mark.parametrize("copy_strategy", ["copy", "hardlink"])
+    def test_store_restore_objects(
+        self, project_info: ProjectInfo, copy_strategy: str
+    ) -> None:
+        """Test storing and restoring a virtual environment using the object store."""
+        config = Config.load(project_info.config_path)
+        config.entry_format = "objects"
+        config.copy_strategy = copy_strategy
+        cache = Cache(config=config)
+
+        venv_path = os.path.join(project_info.project_dir, ".venv")
+        os.makedirs(os.path.join(venv_path, "bin"))
+        with open(os.path.join(venv_path, "bin", "activate"), "w") as f:
+            f.write("# activate\n")
+        os.chmod(os.path.join(venv_path, "bin", "activate"), 0o755)
+        with open(os.path.join(venv_path, "pyvenv.cfg"), "w") as f:
+            f.write("home = /usr/bin\n")
+        os.symlink("/usr/bin/python3", os.path.join(venv_path, "bin", "python"))
+
+        with cwd(project_info.project_dir):
+            cache.store()
+            shutil.rmtree(venv_path)
+            cache.restore()
+
+        assert (
+            os.readlink(os.path.join(venv_path, "bin", "python")) == "/usr/bin/python3"
+        )
+        with open(os.path.join(venv_path, "pyvenv.cfg")) as f:
+            assert f.read() == "home = /usr/bin\n"
+        assert os.stat(os.path.join(venv_path, "bin", "activate")).st_mode & 0o111
+
+        objects_dir = os.path.join(project_info.cache_dir, ".objects")
+        object_paths = [
+            os.path.join(objects_dir, prefix, name)
+            for prefix in os.listdir(objects_dir)
+            for name in os.listdir(os.path.join(objects_dir, prefix))
+        ]
+        assert len(object_paths) == 2
+        restored_inode = os.stat(os.path.join(venv_path, "pyvenv.cfg")).st_ino
+        linked = restored_inode in {os.stat(p).st_ino for p in object_paths}
+        assert linked == (copy_strategy == "hardlink")
+
+    def test_objects_deduplicated(self, project_info: ProjectInfo) -> None:
+        """Test files shared across cache entries are stored only once and garbage collected on trim."""
+        config = Config.load(project_info.config_path)
+        config.entry_format = "objects"
+        cache = Cache(config=config)
+
+        venv_path = os.path.join(project_info.project_dir, ".venv")
+        os.makedirs(venv_path)
+        with open(os.path.join(venv_path, "pyvenv.cfg"), "w") as f:
+            f.write("home = /usr/bin\n")
+
+        lock_file_path = os.path.join(
+            project_info.project_dir, config.requirements_lock_paths[0]
+        )
+        objects_dir = os.path.join(project_info.cache_dir, ".objects")
+        with cwd(project_info.project_dir):
+            for version in range(3):
+                with open(lock_file_path, "w") as f:
+                    f.write(f"requests==1.{version}.0\n")
+                for file_name in os.listdir(venv_path):
+                    if file_name.startswith("file"):
+                        os.unlink(os.path.join(venv_path, file_name))
+                with open(os.path.join(venv_path, f"file{version}.txt"), "w") as f:
+                    f.write(f"{version}\n")
+                cache.store()
+
+            assert sum(len(files) for _, _, files in os.walk(objects_dir)) == 4
+
+            config.cache_size = 1
+            cache._trim_cache()
+
+        assert len(cache._list_entries()) == 1
+        assert sum(len(files) for _, _, files in os.walk(objects_dir)) == 2
+
+    @pytest.mark.parametrize("compression", ["zstd", "gzip", "xz", "none"])
+    def test_store_restore_archive(
+        self, project_info: ProjectInfo, compression: str
+    ) -> None:
+        """Test storing and restoring a virtual environment as a compressed archive."""
+        if compression == "zstd":
+            pytest.importorskip("zstandard")
+
+        config = Config.load(project_info.config_path)
+        config.entry_format = "archive"
+        config.archive_compression = compression
+        cache = Cache(config=config)
+
+        venv_path = os.path.join(project_info.project_dir, ".venv")
+        os.makedirs(os.path.join(venv_path, "bin"))
+        with open(os.path.join(venv_path, "bin", "activate"), "w") as f:
+            f.write("# activate\n")
+        os.chmod(os.path.join(venv_path, "bin", "activate"), 0o755)
+        os.symlink("/usr/bin/python3", os.path.join(venv_path, "bin", "python"))
+
+        with cwd(project_info.project_dir):
+            entry_id = cache._hash_all_lock_files()
+            cache.store()
+            shutil.rmtree(venv_path)
+            cache.restore()
+
+        entry_path = os.path.join(project_info.cache_dir, entry_id)
+        assert set(os.listdir(entry_path)) == {
+            get_archive_name(compression),
+            "virtualenv-cache-manifest.json",
+            "virtualenv-cache-packages.json",
+            "virtualenv-cache-usage.json",
+        }
+        assert (
+            os.readlink(os.path.join(venv_path, "bin", "python")) == "/usr/bin/python3"
+        )
+        assert (
+            os.stat(os.path.join(venv_path, "bin", "activate")).st_mode & 0o777 == 0o755
+        )
+        with open(os.path.join(venv_path, "bin", "activate")) as f:
+            assert f.read() == "# activate\n"
+
+    @pytest.mark.parametrize("entry_format", ["tree", "objects", "archive"])
+    def test_store_unchanged(
+        self, project_info: ProjectInfo, entry_format: str
+    ) -> None:
+        """Test storing a restored virtual environment without any changes is skipped."""
+        config = Config.load(project_info.config_path)
+        config.entry_format = entry_format
+        config.archive_compression = "gzip"
+        cache = Cache(config=config)
+
+        venv_path = os.path.join(project_info.project_dir, ".venv")
+        create_virtualenv(venv_path)
+
+        with cwd(project_info.project_dir):
+            cache.store()
+            cache.restore()
+            assert ".virtualenv-cache-manifest.json" in os.listdir(venv_path)
+
+            flexmock(Cache).should_receive("_store_staged").never()
+            flexmock(Cache).should_receive("_store_objects").never()
+            flexmock(Cache).should_receive("_store_tree_changes").never()
+            cache.store()
+
+    @pytest.mark.parametrize("entry_format", ["tree", "objects"])
+    def test_store_incremental(
+        self, project_info: ProjectInfo, entry_format: str
+    ) -> None:
+        """Test storing only changes done to a restored virtual environment."""
+        config = Config.load(project_info.config_path)
+        config.entry_format = entry_format
+        cache = Cache(config=config)
+
+        venv_path = os.path.join(project_info.project_dir, ".venv")
+        create_virtualenv(venv_path)
+
+        with cwd(project_info.project_dir):
+            cache.store()
+            cache.restore()
+
+            shutil.rmtree(os.path.join(venv_path, "lib", "bar"))
+            os.unlink(os.path.join(venv_path, "lib", "foo", "a.py"))
+            with open(os.path.join(venv_path, "lib", "foo", "b.py"), "w") as f:
+                f.write("# modified content\n")
+            with open(os.path.join(venv_path, "lib", "foo", "d.py"), "w") as f:
+                f.write("# added\n")
+
+            flexmock(Cache).should_receive("_store_staged").never()
+            cache.store()
+
+            shutil.rmtree(venv_path)
+            cache.restore()
+
+        assert os.listdir(os.path.join(venv_path, "lib")) == ["foo"]
+        assert set(os.listdir(os.path.join(venv_path, "lib", "foo"))) == {
+            "b.py",
+            "d.py",
+        }
+        with open(os.path.join(venv_path, "lib", "foo", "b.py")) as f:
+            assert f.read() == "# modified content\n"
+
+    @pytest.mark.parametrize("entry_format", ["tree", "objects"])
+    def test_store_incremental_stored_meanwhile(
+        self, project_info: ProjectInfo, entry_format: str
+    ) -> None:
+        """Test changes are not stored incrementally if the entry was stored again since restored."""
+        config = Config.load(project_info.config_path)
+        config.entry_format = entry_format
+        cache = Cache(config=config)
+
+        venv_path = os.path.join(project_info.project_dir, ".venv")
+        restored_path = os.path.join(project_info.project_dir, "restored")
+        create_virtualenv(venv_path)
+
+        with cwd(project_info.project_dir):
+            cache.store()
+            cache.restore()
+            shutil.copytree(venv_path, restored_path, symlinks=True)
+
+            # Another job restored the same entry and stored it again.
+            with open(os.path.join(venv_path, "lib", "foo", "extra.py"), "w") as f:
+                f.write("# extra\n")
+            cache.store()
+
+            shutil.rmtree(venv_path)
+            os.rename(restored_path, venv_path)
+            with open(os.path.join(venv_path, "lib", "foo", "b.py"), "w") as f:
+                f.write("# modified content\n")
+            flexmock(Cache).should_call("_store_staged").once()
+            cache.store()
+
+            shutil.rmtree(venv_path)
+            cache.restore()
+
+        assert "extra.py" not in os.listdir(os.path.join(venv_path, "lib", "foo"))
+        with open(os.path.join(venv_path, "lib", "foo", "b.py")) as f:
+            assert f.read() == "# modified content\n"
+
+    @pytest.mark.parametrize("entry_format", ["tree", "objects"])
+    def test_store_incremental_interrupted(
+        self, project_info: ProjectInfo, entry_format: str
+    ) -> None:
+        """Test an entry left partially changed by an interrupted store is not restored and is stored again."""
+        config = Config.load(project_info.config_path)
+        config.entry_format = entry_format
+        cache = Cache(config=config)
+
+        venv_path = os.path.join(project_info.project_dir, ".venv")
+        create_virtualenv(venv_path)
+
+        with cwd(project_info.project_dir):
+            cache.store()
+            cache.restore()
+
+            with open(os.path.join(venv_path, "lib", "foo", "b.py"), "w") as f:
+                f.write("# modified content\n")
+            flexmock(Cache).should_receive("_record_entry_packages").and_raise(
+                KeyboardInterrupt
+            )
+            with pytest.raises(KeyboardInterrupt):
+                cache.store()
+            flexmock(Cache).should_call("_record_entry_packages")
+
+            shutil.rmtree(venv_path)
+            with pytest.raises(VirtualenvCacheMiss):
+                cache.restore()
+
+            create_virtualenv(venv_path)
+            with open(os.path.join(venv_path, "lib", "foo", "b.py"), "w") as f:
+                f.write("# modified content\n")
+            flexmock(Cache).should_call("_store_staged").once()
+            cache.store()
+
+            shutil.rmtree(venv_path)
+            cache.restore()
+
+        with open(os.path.join(venv_path, "lib", "foo", "b.py")) as f:
+            assert f.read() == "# modified content\n"
+
+    @pytest.mark.parametrize("entry_format", ["tree", "objects", "archive"])
+    @pytest.mark.parametrize("sync_check", ["metadata", "digest"])
+    def test_restore_sync(
+        self, project_info: ProjectInfo, entry_format: str, sync_check: str
+    ) -> None:
+        """Test restoring a virtual environment by synchronizing only differing files."""
+        config = Config.load(project_info.config_path)
+        config.entry_format = entry_format
+        config.archive_compression = "gzip"
+        config.restore_mode = "sync"
+        config.sync_check = sync_check
+        cache = Cache(config=config)
+
+        venv_path = os.path.join(project_info.project_dir, ".venv")
+        create_virtualenv(venv_path)
+        os.symlink("foo", os.path.join(venv_path, "lib", "baz"))
+
+        with cwd(project_info.project_dir):
+            cache.store()
+            cache.restore()
+
+            untouched_path = os.path.join(venv_path, "lib", "foo", "a.py")
+            untouched_inode = os.stat(untouched_path).st_ino
+
+            shutil.rmtree(os.path.join(venv_path, "lib", "bar"))
+            with open(os.path.join(venv_path, "lib", "foo", "b.py"), "w") as f:
+                f.write("# modified content\n")
+            with open(os.path.join(venv_path, "lib", "foo", "d.py"), "w") as f:
+                f.write("# added\n")
+            os.unlink(os.path.join(venv_path, "lib", "baz"))
+            os.symlink("bar", os.path.join(venv_path, "lib", "baz"))
+
+            flexmock(virtualenv_cache._cache).should_receive("copy_tree").never()
+            cache.restore()
+
+        assert os.stat(untouched_path).st_ino == untouched_inode
+        assert set(os.listdir(os.path.join(venv_path, "lib"))) == {"foo", "bar", "baz"}
+        assert set(os.listdir(os.path.join(venv_path, "lib", "foo"))) == {
+            "a.py",
+            "b.py",
+        }
+        assert os.readlink(os.path.join(venv_path, "lib", "baz")) == "foo"
+        for name in ("foo/a.py", "foo/b.py", "bar/c.py"):
+            with open(os.path.join(venv_path, "lib", name)) as f:
+                assert f.read() == f"# {name}\n"
+
+    def test_restore_nearest(self, project_info: ProjectInfo) -> None:
+        """Test restoring the cache entry with the smallest difference in packages on a cache miss."""
+        config = Config.load(project_info.config_path)
+        config.restore_fallback = "nearest"
+        cache = Cache(config=config)
+
+        venv_path = os.path.join(project_info.project_dir, ".venv")
+        create_virtualenv(venv_path)
+        requirements_path = os.path.join(project_info.project_dir, "requirements.txt")
+
+        with cwd(project_info.project_dir):
+            with open(requirements_path, "w") as f:
+                f.write("flask==2.3.3\nsix==1.16.0\n")
+            cache.store()
+            stored_entry_id = cache._hash_all_lock_files()
+
+            shutil.rmtree(venv_path)
+            with open(requirements_path, "w") as f:
+                f.write("flask==2.3.4\n")
+
+            with pytest.raises(VirtualenvCachePartialHit) as exc_info:
+                cache.restore()
+
+            assert cache._load_virtualenv_manifest().entry_id == stored_entry_id
+
+        assert exc_info.value.install == ["flask==2.3.4"]
+        assert exc_info.value.remove == ["six"]
+        assert set(os.listdir(os.path.join(venv_path, "lib"))) == {"foo", "bar"}
+
+    def test_restore_nearest_disabled(self, project_info: ProjectInfo) -> None:
+        """Test the nearest cache entry is not restored if not configured."""
+        config = Config.load(project_info.config_path)
+        cache = Cache(config=config)
+
+        venv_path = os.path.join(project_info.project_dir, ".venv")
+        create_virtualenv(venv_path)
+
+        with cwd(project_info.project_dir):
+            cache.store()
+            shutil.rmtree(venv_path)
+            with open("requirements.txt", "w") as f:
+                f.write("flask==2.3.4\n")
+
+            with pytest.raises(VirtualenvCacheMiss) as exc_info:
+                cache.restore()
+
+        assert not isinstance(exc_info.value, VirtualenvCachePartialHit)
+        assert not os.path.exists(venv_path)
+
+    def test_index(self, project_info: ProjectInfo) -> None:
+        """Test keeping size and hits of cache entries in the index."""
+        config = Config.load(project_info.config_path)
+        cache = Cache(config=config)
+
+        venv_path = os.path.join(project_info.project_dir, ".venv")
+        create_virtualenv(venv_path)
+
+        index_path = os.path.join(project_info.cache_dir, ".index.sqlite3")
+        assert not os.path.exists(index_path)
+        with cwd(project_info.project_dir):
+            entry_id = cache._hash_all_lock_files()
+            cache.store()
+            cache.restore()
+            cache.restore()
+
+        assert os.path.isfile(index_path)
+        entries = cache._list_entries()
+        assert [e["id"] for e in entries][0] == entry_id
+        assert entries[0]["hits"] == 2
+        assert entries[0]["size"] == 3 * len("# foo/a.py\n")
+        assert entries[0]["hostname"] == socket.gethostname()
+        assert len(entries) == 3
+
+    @pytest.mark.parametrize("corrupt", [True, False])
+    def test_index_rebuild(self, project_info: ProjectInfo, corrupt: bool) -> None:
+        """Test rebuilding a lost or corrupted index from cache entries."""
+        config = Config.load(project_info.config_path)
+        cache = Cache(config=config)
+
+        index_path = os.path.join(project_info.cache_dir, ".index.sqlite3")
+        cache._mark_cache_entry_usage(
+            os.path.join(project_info.cache_dir, cache._list_entries()[-1]["id"])
+        )
+        assert os.path.isfile(index_path)
+
+        if corrupt:
+            with open(index_path, "wb") as f:
+                f.write(b"garbage" * 1024)
+        else:
+            os.unlink(index_path)
+
+        config.cache_size = 1
+        cache._trim_cache()
+        assert [e["id"] for e in cache._list_entries()] == [
+            "b824faa77c86dd2019ef176a3be4af21b02274a7680c44fc75a6606421918154"
+        ]
+
+    def test_trim_cache_max_bytes(self, project_info: ProjectInfo) -> None:
+        """Test trimming a cache to respect the configured number of bytes."""
+        config = Config.load(project_info.config_path)
+        config.cache_max_bytes = 10
+        cache = Cache(config=config)
+
+        venv_path = os.path.join(project_info.project_dir, ".venv")
+        os.makedirs(venv_path)
+        with open(os.path.join(venv_path, "pyvenv.cfg"), "w") as f:
+            f.write("home = /usr/bin\n")
+
+        with cwd(project_info.project_dir):
+            entry_id = cache._hash_all_lock_files()
+            cache.store()
+
+        # Only the entry just stored is kept even though it exceeds the limit.
+        assert [e["id"] for e in cache._list_entries()] == [entry_id]
+
+    def test_trim_cache_gdsf(self, project_info: ProjectInfo) -> None:
+        """Test entries with more hits age out once entries used after an eviction catch up with them."""
+        config = Config.load(project_info.config_path)
+        config.eviction_policy = "gdsf"
+        cache = Cache(config=config)
+        old_id, evicted_id, new_id = (e["id"] for e in reversed(cache._list_entries()))
+
+        cache._mark_cache_entry_usage(
+            os.path.join(project_info.cache_dir, old_id), hit=True
+        )
+        config.cache_size = 2
+        cache._trim_cache()
+        assert {e["id"] for e in cache._list_entries()} == {old_id, new_id}
+
+        cache._mark_cache_entry_usage(os.path.join(project_info.cache_dir, new_id))
+        config.cache_size = 1
+        cache._trim_cache()
+        assert [e["id"] for e in cache._list_entries()] == [new_id]
+
+    @staticmethod
+    def _configure_shared_cache(config: Config, shared_cache_dir: str) -> None:
+        """Configure a shared cache tier, the local tier is configured with a limit of one entry."""
+        config.cache_size = 1
+        config.shared_cache_path = shared_cache_dir
+        config.shared_cache_size = 2
+
+    def test_shared_cache_store(self, project_info: ProjectInfo, tmpdir: str) -> None:
+        """Test storing a virtual environment to both cache tiers, each tier is trimmed on its own."""
+        config = Config.load(project_info.config_path)
+        shared_cache_dir = os.path.join(tmpdir, "shared")
+        self._configure_shared_cache(config, shared_cache_dir)
+        cache = Cache(config=config)
+
+        venv_path = os.path.join(project_info.project_dir, ".venv")
+        create_virtualenv(venv_path)
+
+        entry_ids = []
+        with cwd(project_info.project_dir):
+            for version in ("2.3.3", "2.3.4", "2.3.5"):
+                with open("requirements.txt", "w") as f:
+                    f.write(f"flask=={version}\n")
+                entry_ids.append(cache._hash_all_lock_files())
+                cache.store()
+                cache.wait()
+
+            # Snapshots used for background stores are removed.
+            assert os.listdir(project_info.project_dir).count(".venv") == 1
+            assert not [
+                p for p in os.listdir(".") if p.startswith(".virtualenv-cache-upload-")
+            ]
+            assert [e["id"] for e in cache._list_entries()] == entry_ids[-1:]
+
+        shared_cache = Cache(config=Config(cache_path=shared_cache_dir))
+        assert {e["id"] for e in shared_cache._list_entries()} == set(entry_ids[1:])
+        with open(
+            os.path.join(shared_cache_dir, entry_ids[-1], "venv", "lib", "foo", "a.py")
+        ) as f:
+            assert f.read() == "# foo/a.py\n"
+
+    def test_shared_cache_promotion(
+        self, project_info: ProjectInfo, tmpdir: str
+    ) -> None:
+        """Test restoring a virtual environment from the shared tier promotes it to the local tier."""
+        config = Config.load(project_info.config_path)
+        shared_cache_dir = os.path.join(tmpdir, "shared")
+        self._configure_shared_cache(config, shared_cache_dir)
+        cache = Cache(config=config)
+
+        venv_path = os.path.join(project_info.project_dir, ".venv")
+        create_virtualenv(venv_path)
+
+        with cwd(project_info.project_dir):
+            entry_id = cache._hash_all_lock_files()
+            cache.store()
+            cache.wait()
+
+            shutil.rmtree(project_info.cache_dir)
+            shutil.rmtree(venv_path)
+            cache.restore()
+
+            assert [e["id"] for e in cache._list_entries()] == [entry_id]
+            flexmock(Cache).should_receive("_get_shared_cache").never()
+            shutil.rmtree(venv_path)
+            cache.restore()
+
+        shared_cache = Cache(config=Config(cache_path=shared_cache_dir))
+        assert shared_cache._list_entries()[0]["hits"] == 1
+        assert set(os.listdir(os.path.join(venv_path, "lib"))) == {"foo", "bar"}
+
+    def test_shared_cache_failure(self, project_info: ProjectInfo) -> None:
+        """Test a failure of the background store to the shared tier is reported."""
+        config = Config.load(project_info.config_path)
+        config.shared_cache_path = "/dev/null/shared"
+        cache = Cache(config=config)
+        create_virtualenv(os.path.join(project_info.project_dir, ".venv"))
+
+        with cwd(project_info.project_dir):
+            cache.store()
+            with pytest.raises(VirtualenvCacheStorageError, match="shared cache"):
+                cache.wait()
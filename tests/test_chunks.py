@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import random
+
+from base import BaseTestcase
+
+from virtualenv_cache._chunks import ANCHOR
+from virtualenv_cache._chunks import MAX_CHUNK_SIZE
+from virtualenv_cache._chunks import MIN_CHUNK_SIZE
+from virtualenv_cache._chunks import iter_chunks
+
+
+class TestChunks(BaseTestcase):
+    """Tests related to content-defined chunking."""
+
+    @staticmethod
+    def _generate(size: int, seed: int = 42) -> bytes:
+        """Generate pseudo-random content with anchors in random positions."""
+        rng = random.Random(seed)
+        content = bytearray(rng.getrandbits(8 * size).to_bytes(size, "little"))
+        for _ in range(size // (64 * 1024)):
+            position = rng.randrange(size - len(ANCHOR))
+            content[position : position + len(ANCHOR)] = ANCHOR
+        return bytes(content)
+
+    def test_iter_chunks(self) -> None:
+        """Test chunks respect size bounds and reassemble to the original content."""
+        content = self._generate(4 * MAX_CHUNK_SIZE)
+        chunks = list(iter_chunks(io.BytesIO(content)))
+
+        assert b"".join(chunks) == content
+        assert all(MIN_CHUNK_SIZE <= len(c) <= MAX_CHUNK_SIZE for c in chunks[:-1])
+        assert all(c.endswith(ANCHOR) for c in chunks[:-1] if len(c) < MAX_CHUNK_SIZE)
+
+    def test_iter_chunks_no_anchor(self) -> None:
+        """Test content without anchors is split into chunks of the maximum size."""
+        content = b"a" * (2 * MAX_CHUNK_SIZE + 1)
+        assert [len(c) for c in iter_chunks(io.BytesIO(content))] == [
+            MAX_CHUNK_SIZE,
+            MAX_CHUNK_SIZE,
+            1,
+        ]
+
+    def test_iter_chunks_small(self) -> None:
+        """Test small and empty files are kept in a single chunk, respectively no chunk."""
+        assert list(iter_chunks(io.BytesIO(b"foo" + ANCHOR + b"bar"))) == [
+            b"foo" + ANCHOR + b"bar"
+        ]
+        assert list(iter_chunks(io.BytesIO(b""))) == []
+
+    def test_iter_chunks_insertion(self) -> None:
+        """Test an insertion changes only chunks around it."""
+        content = self._generate(4 * MAX_CHUNK_SIZE)
+        modified = content[:MAX_CHUNK_SIZE] + os.urandom(100) + content[MAX_CHUNK_SIZE:]
+
+        chunks = set(iter_chunks(io.BytesIO(content)))
+        modified_chunks = list(iter_chunks(io.BytesIO(modified)))
+        new_chunks = [c for c in modified_chunks if c not in chunks]
+        assert len(new_chunks) <= 2
+        assert len(modified_chunks) > 10
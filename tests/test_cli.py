@@ -2,6 +2,9 @@
 
 import os
 import json
+import subprocess
+import sys
+import time
 from typing import Any
 from typing import Dict
 
@@ -18,6 +21,57 @@ from base import ProjectInfo
 class TestCLI(BaseTestcase):
     """Tests related to the CLI."""
 
+    # Importing the CLI can take this many times the start-up of the interpreter alone, both measured as the best of
+    # a few runs so that a slow or loaded machine slows both down.
+    _IMPORT_TIME_FACTOR = 20
+    # Modules imported only on code paths that need them.
+    _LAZY_MODULES = (
+        "rich",
+        "daiquiri",
+        "dateutil",
+        "virtualenv_cache._daemon",
+        "http.client",
+        "xml.etree",
+    )
+
+    def test_lazy_imports(self) -> None:
+        """Test importing the CLI does not import modules not needed by all the commands."""
+        code = "import sys, virtualenv_cache.cli; print(' '.join(sys.modules))"
+        modules = subprocess.run(
+            [sys.executable, "-c", code],
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.dirname(BaseTestcase._DATA_DIR)),
+            universal_newlines=True,
+        ).stdout.split()
+
+        assert [
+            m
+            for m in modules
+            if any(m == name or m.startswith(f"{name}.") for name in self._LAZY_MODULES)
+        ] == []
+
+    def test_import_time(self) -> None:
+        """Test importing the CLI fits the budget relative to the start-up of the interpreter."""
+
+        def _run(code: str) -> float:
+            start = time.perf_counter()
+            subprocess.run(
+                [sys.executable, "-c", code],
+                check=True,
+                cwd=os.path.dirname(os.path.dirname(BaseTestcase._DATA_DIR)),
+            )
+            return time.perf_counter() - start
+
+        baseline = []
+        durations = []
+        for _ in range(5):
+            baseline.append(_run("pass"))
+            durations.append(_run("import virtualenv_cache.cli"))
+
+        assert min(durations) < min(baseline) * self._IMPORT_TIME_FACTOR
+
     def test_help(self) -> None:
         """Test printing the help message."""
         result = CliRunner().invoke(cli, ["--help"])
@@ -42,18 +96,24 @@ class TestCLI(BaseTestcase):
                 [
                     {
                         "datetime": "2023-08-28T18:18:13.486841+00:00",
+                        "hits": 0,
                         "hostname": "masina",
                         "id": "6f741140d80b32fc7fc72313e411569f5af412e8f9e30ae1bc52ac0837157435",
+                        "size": None,
                     },
                     {
                         "datetime": "2023-08-28T18:08:13.486841+00:00",
+                        "hits": 0,
                         "hostname": "masina",
                         "id": "18648aedbe40f5e25f2fe09f80295ed1a4bc996d1b47fb8d24c4f08a6e565b47",
+                        "size": None,
                     },
                     {
                         "datetime": "2023-08-28T18:07:56.370582+00:00",
+                        "hits": 0,
                         "hostname": "masina",
                         "id": "b824faa77c86dd2019ef176a3be4af21b02274a7680c44fc75a6606421918154",
+                        "size": None,
                     },
                 ],
             ),
@@ -94,6 +154,32 @@ class TestCLI(BaseTestcase):
         assert ".venv" in os.listdir(project_info.project_dir)
         assert result.exit_code == 0
 
+    def test_restore_partial_hit(self, project_info: ProjectInfo) -> None:
+        """Test restoring the nearest virtual environment is signalized with a distinct exit code."""
+        with open(project_info.config_path, "a") as f:
+            f.write('restore_fallback = "nearest"\n')
+
+        venv_path = os.path.join(project_info.project_dir, ".venv")
+        os.makedirs(venv_path)
+        args = [
+            "--work-dir",
+            project_info.project_dir,
+            "--config-path",
+            project_info.config_path,
+        ]
+        result = CliRunner().invoke(cli, ["store", *args])
+        assert result.exit_code == 0
+
+        with open(os.path.join(project_info.project_dir, "requirements.txt"), "w") as f:
+            f.write("flask==2.3.4\n")
+
+        result = CliRunner().invoke(cli, ["restore", *args])
+        assert result.exit_code == 3
+        assert json.loads(result.output[result.output.index("{") :]) == {
+            "install": ["flask==2.3.4"],
+            "remove": [],
+        }
+
     def test_store(self, project_info: ProjectInfo) -> None:
         """Test storing a virtual environment in the cache."""
         assert ".venv" not in os.listdir(project_info.project_dir)
@@ -70,3 +70,41 @@ requirements_lock_paths = [
 
         config.virtualenv_path = "${PWD}"
         assert config.expanded_virtualenv_path == os.getcwd()
+
+    def test_load_invalid_option(self, tmpdir: str) -> None:
+        """Test loading a configuration file with an unknown option value."""
+        config_path = os.path.join(tmpdir, "myconf.toml")
+        with open(config_path, "w") as f:
+            f.write('[virtualenv-cache]\nentry_format = "foo"\n')
+
+        with pytest.raises(VirtualenvCacheConfigError, match="entry_format"):
+            Config.load(config_path)
+
+    @pytest.mark.parametrize(
+        "options,match",
+        [
+            ('entry_format = "tree"\ncopy_strategy = "hardlink"\n', "copy_strategy"),
+            (
+                'archive_compression = "gzip"\narchive_compression_level = 19\n',
+                "archive_compression_level",
+            ),
+            (
+                'archive_compression = "xz"\narchive_compression_level = -1\n',
+                "archive_compression_level",
+            ),
+            (
+                'archive_compression = "zstd"\narchive_compression_level = 0\n',
+                "archive_compression_level",
+            ),
+        ],
+    )
+    def test_load_invalid_combination(
+        self, tmpdir: str, options: str, match: str
+    ) -> None:
+        """Test loading a configuration file with option values that cannot be used together."""
+        config_path = os.path.join(tmpdir, "myconf.toml")
+        with open(config_path, "w") as f:
+            f.write(f"[virtualenv-cache]\n{options}")
+
+        with pytest.raises(VirtualenvCacheConfigError, match=match):
+            Config.load(config_path)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+import errno
+import os
+
+from flexmock import flexmock
+import pytest
+from base import BaseTestcase
+
+from virtualenv_cache import _copy
+from virtualenv_cache._copy import copy_file
+from virtualenv_cache._copy import copy_tree
+
+
+class TestCopy(BaseTestcase):
+    """Tests related to copying files into and out of the cache."""
+
+    @pytest.mark.parametrize("strategy", ["copy", "hardlink", "reflink"])
+    def test_copy_file(self, tmpdir: str, strategy: str) -> None:
+        """Test materializing a file using the given strategy."""
+        src = os.path.join(tmpdir, "src")
+        dst = os.path.join(tmpdir, "dst")
+        with open(src, "w") as f:
+            f.write("foo")
+        os.chmod(src, 0o751)
+        os.utime(src, ns=(1_000_000_000, 1_000_000_000))
+
+        used_strategy = copy_file(src, dst, strategy=strategy)
+
+        assert used_strategy in {strategy, "copy"}
+        with open(dst) as f:
+            assert f.read() == "foo"
+        assert os.stat(dst).st_mode & 0o777 == 0o751
+        assert os.stat(dst).st_mtime_ns == 1_000_000_000
+
+    def test_hardlink_fallback(self, tmpdir: str) -> None:
+        """Test falling back to copy if files cannot be hardlinked."""
+        src = os.path.join(tmpdir, "src")
+        dst = os.path.join(tmpdir, "dst")
+        with open(src, "w") as f:
+            f.write("foo")
+
+        flexmock(os).should_receive("link").and_raise(
+            OSError(errno.EXDEV, "Invalid cross-device link")
+        ).once()
+
+        assert copy_file(src, dst, strategy="hardlink") == "copy"
+        assert os.stat(src).st_ino != os.stat(dst).st_ino
+
+    def test_reflink_fallback(self, tmpdir: str) -> None:
+        """Test falling back to copy if the filesystem does not support cloning files."""
+        src = os.path.join(tmpdir, "src")
+        dst = os.path.join(tmpdir, "dst")
+        with open(src, "w") as f:
+            f.write("foo")
+
+        flexmock(_copy.fcntl).should_receive("ioctl").and_raise(
+            OSError(errno.EOPNOTSUPP, "Operation not supported")
+        ).once()
+        flexmock(_copy).should_receive("_copy_range").and_return(False).once()
+        _copy._CLONE_SUPPORTED.clear()
+
+        assert copy_file(src, dst, strategy="reflink") == "copy"
+        # Support is remembered for the filesystem, no more attempts to clone files.
+        assert copy_file(src, dst + "2", strategy="reflink") == "copy"
+        _copy._CLONE_SUPPORTED.clear()
+
+        with open(dst) as f:
+            assert f.read() == "foo"
+
+    @pytest.mark.parametrize("workers", [1, 4])
+    def test_copy_tree(self, tmpdir: str, workers: int) -> None:
+        """Test copying a directory tree preserving symlinks and permissions."""
+        src = os.path.join(tmpdir, "src")
+        dst = os.path.join(tmpdir, "dst")
+        os.makedirs(os.path.join(src, "bin"))
+        os.makedirs(os.path.join(src, "lib", "site-packages", "foo"))
+        for i in range(20):
+            with open(
+                os.path.join(src, "lib", "site-packages", "foo", f"{i}.py"), "w"
+            ) as f:
+                f.write(f"x = {i}\n")
+        with open(os.path.join(src, "bin", "activate"), "w") as f:
+            f.write("# activate\n")
+        os.chmod(os.path.join(src, "bin", "activate"), 0o755)
+        os.symlink("/usr/bin/python3", os.path.join(src, "bin", "python"))
+        os.symlink("lib", os.path.join(src, "lib64"))
+        os.chmod(os.path.join(src, "lib"), 0o555)
+
+        try:
+            assert copy_tree(src, dst, workers=workers) == 21
+        finally:
+            os.chmod(os.path.join(src, "lib"), 0o755)
+
+        assert os.readlink(os.path.join(dst, "bin", "python")) == "/usr/bin/python3"
+        assert os.readlink(os.path.join(dst, "lib64")) == "lib"
+        assert os.stat(os.path.join(dst, "bin", "activate")).st_mode & 0o777 == 0o755
+        assert os.stat(os.path.join(dst, "lib")).st_mode & 0o777 == 0o555
+        assert len(os.listdir(os.path.join(dst, "lib", "site-packages", "foo"))) == 20
+        os.chmod(os.path.join(dst, "lib"), 0o755)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import shutil
+import socket
+
+import pytest
+from base import BaseTestcase
+from base import ProjectInfo
+from click.testing import CliRunner
+from flexmock import flexmock
+
+from virtualenv_cache import Cache
+from virtualenv_cache import Config
+from virtualenv_cache import VirtualenvCacheConfigError
+from virtualenv_cache import VirtualenvCacheException
+from virtualenv_cache import VirtualenvCachePartialHit
+from virtualenv_cache._daemon import CacheDaemon
+from virtualenv_cache._daemon import DaemonClient
+from virtualenv_cache._lockfiles import LockFileHasher
+from virtualenv_cache.cli import cli
+from virtualenv_cache.utils import cwd
+
+
+class TestDaemon(BaseTestcase):
+    """Tests related to the daemon serving cache commands."""
+
+    def test_connect_no_daemon(self, daemon_socket_path: str) -> None:
+        """Test no client is created if no daemon is running, also with a stale socket left behind."""
+        assert DaemonClient.connect() is None
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(daemon_socket_path)
+        sock.close()
+        assert os.path.exists(daemon_socket_path)
+        assert DaemonClient.connect() is None
+
+    def test_cli(self, project_info: ProjectInfo, cache_daemon: CacheDaemon) -> None:
+        """Test CLI commands are served by the daemon, state is kept across commands."""
+        venv_path = os.path.join(project_info.project_dir, ".venv")
+        os.makedirs(venv_path)
+        with open(os.path.join(venv_path, "pyvenv.cfg"), "w") as f:
+            f.write("home = /usr/bin\n")
+        with cwd(project_info.project_dir):
+            Cache(config=Config.load(project_info.config_path)).store()
+        shutil.rmtree(venv_path)
+
+        args = [
+            "--work-dir",
+            project_info.project_dir,
+            "--config-path",
+            project_info.config_path,
+        ]
+        flexmock(DaemonClient).should_call("call").times(4)
+
+        result = CliRunner().invoke(cli, ["restore", *args])
+        assert result.exit_code == 0
+        assert ".venv" in os.listdir(project_info.project_dir)
+
+        result = CliRunner().invoke(cli, ["store", *args])
+        assert result.exit_code == 0
+
+        # Digests of lock files are kept in memory.
+        (hasher,) = cache_daemon._hashers.values()
+        assert hasher._memo
+        flexmock(LockFileHasher).should_receive("_load_memo").never()
+        result = CliRunner().invoke(cli, ["list", *args, "--format", "json"])
+        assert result.exit_code == 0
+        entries = json.loads(result.output)
+        assert entries[0]["hits"] == 1
+
+        result = CliRunner().invoke(cli, ["erase", *args])
+        assert result.exit_code == 0
+        assert not os.path.exists(project_info.cache_dir)
+
+    def test_errors(self, project_info: ProjectInfo, cache_daemon: CacheDaemon) -> None:
+        """Test errors raised in the daemon are raised in the client."""
+        with open(project_info.config_path, "a") as f:
+            f.write('restore_fallback = "nearest"\n')
+        os.makedirs(os.path.join(project_info.project_dir, ".venv"))
+        DaemonClient.connect().call(  # type: ignore
+            "store",
+            config_path=project_info.config_path,
+            work_dir=project_info.project_dir,
+        )
+        with open(os.path.join(project_info.project_dir, "requirements.txt"), "w") as f:
+            f.write("flask==2.3.4\n")
+
+        with pytest.raises(VirtualenvCachePartialHit) as exc_info:
+            DaemonClient.connect().call(  # type: ignore
+                "restore",
+                config_path=project_info.config_path,
+                work_dir=project_info.project_dir,
+            )
+        assert exc_info.value.install == ["flask==2.3.4"]
+
+        with pytest.raises(VirtualenvCacheConfigError, match="not found"):
+            DaemonClient.connect().call(  # type: ignore
+                "restore",
+                config_path="missing.toml",
+                work_dir=project_info.project_dir,
+            )
+
+        with pytest.raises(ValueError, match="^Unknown command 'foo'$"):
+            DaemonClient.connect().call(  # type: ignore
+                "foo",
+                config_path=project_info.config_path,
+                work_dir=project_info.project_dir,
+            )
+
+        flexmock(Cache).should_receive("store").and_raise(
+            FileNotFoundError(2, "No such file or directory", "missing.txt")
+        )
+        with pytest.raises(FileNotFoundError) as error_info:
+            DaemonClient.connect().call(  # type: ignore
+                "store",
+                config_path=project_info.config_path,
+                work_dir=project_info.project_dir,
+            )
+        assert error_info.value.errno == 2
+        assert error_info.value.filename == "missing.txt"
+        assert "Traceback" in str(error_info.value.__cause__)
+
+        flexmock(Cache).should_receive("store").and_raise(
+            RuntimeError, "Unexpected failure"
+        )
+        with pytest.raises(RuntimeError, match="^Unexpected failure$"):
+            DaemonClient.connect().call(  # type: ignore
+                "store",
+                config_path=project_info.config_path,
+                work_dir=project_info.project_dir,
+            )
+
+    @pytest.mark.parametrize("command", ["restore", "store"])
+    def test_cli_exit_code(
+        self, project_info: ProjectInfo, cache_daemon: CacheDaemon, command: str
+    ) -> None:
+        """Test CLI commands exit with the same exit codes on unexpected errors, with the daemon or without it."""
+        args = [
+            command,
+            "--work-dir",
+            project_info.project_dir,
+            "--config-path",
+            project_info.config_path,
+        ]
+        flexmock(Cache).should_receive(command).and_raise(
+            OSError(28, "No space left on device")
+        )
+
+        result = CliRunner().invoke(cli, args)
+        assert isinstance(result.exception, (OSError, SystemExit))
+
+        flexmock(DaemonClient).should_receive("connect").and_return(None)
+        in_process = CliRunner().invoke(cli, args)
+        assert result.exit_code == in_process.exit_code
+        assert type(result.exception) is type(in_process.exception)
+
+    def test_already_running(self, cache_daemon: CacheDaemon) -> None:
+        """Test only one daemon can listen on a socket."""
+        with pytest.raises(VirtualenvCacheException, match="already listening"):
+            CacheDaemon(cache_daemon.socket_path).serve_forever()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import shutil
+
+import pytest
+import tomli
+import tomli_w
+from base import BaseTestcase
+from base import ProjectInfo
+from click.testing import CliRunner
+
+from virtualenv_cache import Config
+from virtualenv_cache import VirtualenvCacheConfigError
+from virtualenv_cache._daemon import CacheDaemon
+from virtualenv_cache._environments import run_environments
+from virtualenv_cache._metrics import Metrics
+from virtualenv_cache.cli import cli
+from virtualenv_cache.utils import cwd
+
+_SERVICES = ("backend", "frontend", "worker")
+
+
+def _write(path: str, content: str) -> None:
+    """Write the given file, parent directories are created."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+class TestEnvironments(BaseTestcase):
+    """Tests related to multiple environments stated in one configuration file."""
+
+    @staticmethod
+    def _set_up(project_info: ProjectInfo) -> None:
+        """State an environment for each service of the project and create their virtual environments."""
+        with open(project_info.config_path, "rb") as f:
+            content = tomli.load(f)
+
+        content["virtualenv-cache"]["environment_workers"] = 2
+        content["virtualenv-cache"]["environments"] = {
+            name: {
+                "virtualenv_path": f"services/{name}/.venv",
+                "requirements_lock_paths": [f"services/{name}/requirements.txt"],
+            }
+            for name in _SERVICES
+        }
+        with open(project_info.config_path, "wb") as f:
+            tomli_w.dump(content, f)
+
+        for name in _SERVICES:
+            service_path = os.path.join(project_info.project_dir, "services", name)
+            _write(os.path.join(service_path, "requirements.txt"), f"{name}==1.0\n")
+            _write(
+                os.path.join(service_path, ".venv", "lib", name, "__init__.py"),
+                f"# {name}\n",
+            )
+
+    def test_load(self, tmpdir: str) -> None:
+        """Test options not stated for an environment are taken from the top-level table."""
+        config_path = os.path.join(tmpdir, "myconf.toml")
+        _write(
+            config_path,
+            """\
+[virtualenv-cache]
+cache_path = "/foo/bar"
+entry_format = "objects"
+requirements_lock_paths = ["requirements.txt"]
+
+[virtualenv-cache.environments.backend]
+virtualenv_path = "backend/.venv"
+requirements_lock_paths = ["backend/requirements.txt"]
+
+[virtualenv-cache.environments.frontend]
+virtualenv_path = "frontend/.venv"
+entry_format = "tree"
+""",
+        )
+
+        environments = Config.load(config_path).get_environments()
+        assert list(environments) == ["backend", "frontend"]
+        assert environments["backend"].virtualenv_path == "backend/.venv"
+        assert environments["backend"].requirements_lock_paths == [
+            "backend/requirements.txt"
+        ]
+        assert environments["backend"].entry_format == "objects"
+        assert environments["frontend"].requirements_lock_paths == ["requirements.txt"]
+        assert environments["frontend"].entry_format == "tree"
+        assert environments["frontend"].cache_path == "/foo/bar"
+        assert environments["frontend"].environments == {}
+
+    @pytest.mark.parametrize(
+        "options,match",
+        [
+            ('entry_format = "foo"', "entry_format"),
+            ('foo = "bar"', "foo"),
+            ("environment_workers = 2", "environment_workers"),
+        ],
+    )
+    def test_load_invalid(self, tmpdir: str, options: str, match: str) -> None:
+        """Test invalid configuration of an environment is reported on load."""
+        config_path = os.path.join(tmpdir, "myconf.toml")
+        _write(
+            config_path,
+            f"[virtualenv-cache]\n[virtualenv-cache.environments.backend]\n{options}\n",
+        )
+
+        with pytest.raises(VirtualenvCacheConfigError, match=match):
+            Config.load(config_path)
+
+    def test_restore_store(self, project_info: ProjectInfo) -> None:
+        """Test environments are stored and restored together, each reported separately."""
+        self._set_up(project_info)
+        config = Config.load(project_info.config_path)
+
+        with cwd(project_info.project_dir):
+            reports = run_environments(config, "restore")
+            assert [(r["environment"], r["outcome"]) for r in reports] == [
+                (name, "miss") for name in _SERVICES
+            ]
+
+            metrics = Metrics()
+            reports = run_environments(config, "store", metrics=metrics)
+            assert [(r["environment"], r["outcome"]) for r in reports] == [
+                (name, "stored") for name in _SERVICES
+            ]
+            assert metrics.to_dict()["operations"]["backend/store"]["files"] == 1
+
+            for name in _SERVICES:
+                shutil.rmtree(os.path.join("services", name, ".venv"))
+            reports = run_environments(config, "restore")
+            assert [(r["environment"], r["outcome"]) for r in reports] == [
+                (name, "hit") for name in _SERVICES
+            ]
+
+        for name in _SERVICES:
+            with open(
+                os.path.join(
+                    project_info.project_dir,
+                    "services",
+                    name,
+                    ".venv",
+                    "lib",
+                    name,
+                    "__init__.py",
+                )
+            ) as f:
+                assert f.read() == f"# {name}\n"
+
+    def test_error(self, project_info: ProjectInfo) -> None:
+        """Test a failure of one environment does not affect other environments."""
+        self._set_up(project_info)
+        config = Config.load(project_info.config_path)
+        os.unlink(
+            os.path.join(
+                project_info.project_dir, "services", "worker", "requirements.txt"
+            )
+        )
+
+        with cwd(project_info.project_dir):
+            reports = run_environments(config, "store")
+
+        assert [r["outcome"] for r in reports] == ["stored", "stored", "error"]
+        assert "requirements.txt" in reports[2]["message"]
+
+    def test_cli(self, project_info: ProjectInfo) -> None:
+        """Test the restore command reports outcomes of environments and signalizes misses with exit code 1."""
+        self._set_up(project_info)
+        args = [
+            "--config-path",
+            project_info.config_path,
+            "--work-dir",
+            project_info.project_dir,
+        ]
+
+        result = CliRunner().invoke(cli, ["store", *args])
+        assert result.exit_code == 0, result.output
+        assert [r["outcome"] for r in json.loads(result.output)] == ["stored"] * 3
+
+        _write(
+            os.path.join(
+                project_info.project_dir, "services", "worker", "requirements.txt"
+            ),
+            "worker==2.0\n",
+        )
+        result = CliRunner().invoke(cli, ["restore", *args])
+        assert result.exit_code == 1
+        assert {r["environment"]: r["outcome"] for r in json.loads(result.output)} == {
+            "backend": "hit",
+            "frontend": "hit",
+            "worker": "miss",
+        }
+
+    def test_daemon(self, project_info: ProjectInfo, cache_daemon: CacheDaemon) -> None:
+        """Test environments are served by the daemon, lock file hashers are shared by environments."""
+        self._set_up(project_info)
+        args = [
+            "--config-path",
+            project_info.config_path,
+            "--work-dir",
+            project_info.project_dir,
+        ]
+
+        result = CliRunner().invoke(cli, ["store", *args])
+        assert result.exit_code == 0, result.output
+        assert [r["outcome"] for r in json.loads(result.output)] == ["stored"] * 3
+        assert len(cache_daemon._hashers) == 1
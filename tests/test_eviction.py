@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+import os
+import sqlite3
+from typing import List
+
+import pytest
+from base import BaseTestcase
+
+from virtualenv_cache._eviction import select_victims
+from virtualenv_cache._index import CacheIndex
+
+
+class TestEviction(BaseTestcase):
+    """Tests related to eviction of cache entries."""
+
+    # Sorted by last use, the most recently used first.
+    _ENTRIES = [
+        {"id": "a", "size": 3000, "hits": 1},
+        {"id": "b", "size": 300, "hits": 0},
+        {"id": "c", "size": 300, "hits": 5},
+        {"id": "d", "size": 1000, "hits": 2},
+    ]
+
+    @pytest.mark.parametrize(
+        "policy, max_entries, max_bytes, victims",
+        [
+            ("lru", 4, 0, []),
+            ("lru", 2, 0, ["d", "c"]),
+            ("lru", 4, 4000, ["d"]),
+            ("lru", 4, 1000, ["d", "c", "b", "a"]),
+            ("lfu", 2, 0, ["b", "a"]),
+            ("lfu", 4, 1500, ["b", "a"]),
+            ("gdsf", 2, 0, ["a", "d"]),
+            ("gdsf", 4, 1600, ["a"]),
+        ],
+    )
+    def test_select_victims(
+        self, policy: str, max_entries: int, max_bytes: int, victims: List[str]
+    ) -> None:
+        """Test selecting entries to be evicted based on the given policy and limits."""
+        result = select_victims(
+            self._ENTRIES,
+            policy=policy,
+            max_entries=max_entries,
+            max_bytes=max_bytes,
+        )
+        assert [entry["id"] for entry in result] == victims
+
+    def test_select_victims_keep(self) -> None:
+        """Test the entry to be kept is never evicted."""
+        result = select_victims(
+            self._ENTRIES, policy="lfu", max_entries=1, max_bytes=0, keep="b"
+        )
+        assert [entry["id"] for entry in result] == ["a", "d", "c"]
+
+    def test_select_victims_gdsf_inflation(self) -> None:
+        """Test entries used after other entries were evicted are preferred over entries with more hits."""
+        entries = [
+            {"id": "new", "size": 1000, "hits": 0, "inflation": 0.5},
+            {"id": "old", "size": 1000, "hits": 100, "inflation": 0.0},
+        ]
+        result = select_victims(entries, policy="gdsf", max_entries=1)
+        assert [entry["id"] for entry in result] == ["old"]
+
+    def test_index_inflation(self, tmpdir: str) -> None:
+        """Test entries get the inflation value raised by evicted entries when used."""
+        index = CacheIndex(os.path.join(tmpdir, "index.sqlite3"))
+        usage = {"datetime": "2023-08-28T18:18:13+00:00", "timestamp": 1.0}
+
+        index.touch("a", hostname="foo", size=100, **usage)
+        index.inflate(0.5)
+        index.inflate(0.25)
+        index.touch("b", hostname="foo", size=100, **usage)
+        assert index.get_inflations() == {"a": 0.0, "b": 0.5}
+
+        index.touch("a", hostname="foo", hit=True, **usage)
+        assert index.get_inflations() == {"a": 0.5, "b": 0.5}
+        assert index.get("a")["hits"] == 1  # type: ignore
+
+        index.rebuild([])
+        index.touch("c", hostname="foo", **usage)
+        assert index.get_inflations() == {"c": 0.0}
+
+    def test_index_migration(self, tmpdir: str) -> None:
+        """Test an index created without inflation values is migrated."""
+        path = os.path.join(tmpdir, "index.sqlite3")
+        connection = sqlite3.connect(path)
+        with connection:
+            connection.execute(
+                "CREATE TABLE entries (id TEXT PRIMARY KEY, datetime TEXT NOT NULL, timestamp REAL NOT NULL, "
+                "hostname TEXT NOT NULL, size INTEGER, hits INTEGER NOT NULL DEFAULT 0)"
+            )
+            connection.execute(
+                "INSERT INTO entries VALUES ('a', '2023-08-28T18:18:13+00:00', 1.0, 'foo', 100, 3)"
+            )
+        connection.close()
+
+        index = CacheIndex(path)
+        assert index.get_inflations() == {"a": 0.0}
+        assert index.get("a")["hits"] == 3  # type: ignore
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+
+import pytest
+from base import BaseTestcase
+from base import ProjectInfo
+from base import list_files
+from base import write_file
+from click.testing import CliRunner
+
+from virtualenv_cache import Cache
+from virtualenv_cache import Config
+from virtualenv_cache import VirtualenvCacheMiss
+from virtualenv_cache.cli import cli
+from virtualenv_cache.utils import cwd
+
+
+class TestLayers(BaseTestcase):
+    """Tests related to entries stored as changes done on top of a base layer."""
+
+    @staticmethod
+    def _store_layers(config: Config, venv_path: str) -> Cache:
+        """Store a base layer and an entry on top of it, return the cache used to store the entry."""
+        write_file(venv_path, "lib/base/a.py", "# a\n")
+        write_file(venv_path, "lib/base/b.py", "# b\n")
+        Cache(config=config).store_base()
+
+        write_file(venv_path, "lib/base/a.py", "# modified\n")
+        os.unlink(os.path.join(venv_path, "lib", "base", "b.py"))
+        write_file(venv_path, "lib/dev/c.py", "# c\n")
+        cache = Cache(config=config)
+        cache.store()
+        return cache
+
+    @pytest.mark.parametrize("entry_format", ["tree", "archive"])
+    def test_store_restore(self, project_info: ProjectInfo, entry_format: str) -> None:
+        """Test only changes are stored on top of the base layer and layers are composed on restore."""
+        config = Config.load(project_info.config_path)
+        config.base_lock_paths = ["requirements.txt"]
+        config.entry_format = entry_format
+        config.archive_compression = "gzip"
+        venv_path = os.path.join(project_info.project_dir, ".venv")
+
+        with cwd(project_info.project_dir):
+            cache = self._store_layers(config, venv_path)
+            entry_id = cache._hash_all_lock_files()
+            base_id = cache._hash_lock_files(config.base_lock_paths)
+
+            store = cache.metrics.to_dict()["operations"]["store"]
+            assert (store["outcome"], store["files"]) == ("stored", 2)
+            cached_entry_path = os.path.join(config.expanded_cache_path, entry_id)
+            assert cache._load_entry_layer(cached_entry_path)["base"] == base_id
+            if entry_format == "tree":
+                assert list_files(os.path.join(cached_entry_path, "venv")) == {
+                    "lib/base/a.py",
+                    "lib/dev/c.py",
+                }
+
+            shutil.rmtree(venv_path)
+            cache = Cache(config=config)
+            cache.restore()
+
+        assert list_files(venv_path) == {
+            ".virtualenv-cache-manifest.json",
+            "lib/base/a.py",
+            "lib/dev/c.py",
+        }
+        with open(os.path.join(venv_path, "lib", "base", "a.py")) as f:
+            assert f.read() == "# modified\n"
+        assert (
+            "apply_layer" in cache.metrics.to_dict()["operations"]["restore"]["phases"]
+        )
+
+        with cwd(project_info.project_dir):
+            cache = Cache(config=config)
+            cache.store()
+        assert cache.metrics.to_dict()["operations"]["store"]["outcome"] == "unchanged"
+
+    def test_base_stored_again(self, project_info: ProjectInfo) -> None:
+        """Test entries stored on top of a base layer stored again are not restored."""
+        config = Config.load(project_info.config_path)
+        config.base_lock_paths = ["requirements.txt"]
+        venv_path = os.path.join(project_info.project_dir, ".venv")
+
+        with cwd(project_info.project_dir):
+            self._store_layers(config, venv_path)
+            shutil.rmtree(venv_path)
+            write_file(venv_path, "lib/other.py", "# other\n")
+            Cache(config=config).store_base()
+
+            shutil.rmtree(venv_path)
+            with pytest.raises(VirtualenvCacheMiss):
+                Cache(config=config).restore()
+
+    def test_trim_keeps_base(self, project_info: ProjectInfo) -> None:
+        """Test base layers of entries kept in the cache are not removed."""
+        config = Config.load(project_info.config_path)
+        config.base_lock_paths = ["requirements.txt"]
+        config.cache_size = 1
+
+        with cwd(project_info.project_dir):
+            cache = self._store_layers(
+                config, os.path.join(project_info.project_dir, ".venv")
+            )
+            entry_ids = {
+                cache._hash_all_lock_files(),
+                cache._hash_lock_files(config.base_lock_paths),
+            }
+
+        assert {e["id"] for e in cache._list_entries()} == entry_ids
+
+    def test_store_base_not_configured(self, project_info: ProjectInfo) -> None:
+        """Test storing the base layer fails if no base lock files are configured."""
+        result = CliRunner().invoke(
+            cli,
+            [
+                "store",
+                "--base",
+                "--work-dir",
+                project_info.project_dir,
+                "--config-path",
+                project_info.config_path,
+            ],
+        )
+        assert result.exit_code == 1
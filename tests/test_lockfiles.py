@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+import hashlib
+import os
+
+import pytest
+from base import BaseTestcase
+from flexmock import flexmock
+
+from virtualenv_cache import VirtualenvCacheConfigError
+from virtualenv_cache import _lockfiles
+from virtualenv_cache._lockfiles import LockFileHasher
+from virtualenv_cache.utils import cwd
+
+
+class TestLockFiles(BaseTestcase):
+    """Tests related to hashing lock files."""
+
+    @staticmethod
+    def _write_lock_file(path: str, content: str, mtime: int = 1_000_000_000) -> None:
+        """Write a lock file with modification time in the past so that it can be memoized."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+        os.utime(path, (mtime, mtime))
+
+    def test_hash_files_glob(self, tmpdir: str) -> None:
+        """Test expanding glob patterns stated in lock file paths."""
+        for service in ("foo", "bar"):
+            self._write_lock_file(
+                os.path.join(tmpdir, "services", service, "requirements.txt"),
+                f"{service}==1.0.0\n",
+            )
+        self._write_lock_file(os.path.join(tmpdir, "requirements.txt"), "baz\n")
+
+        with cwd(tmpdir):
+            result = LockFileHasher(workers=2).hash_files(
+                ["requirements.txt", "services/*/requirements.txt"]
+            )
+
+        assert result == {
+            "requirements.txt": hashlib.sha256(b"baz\n").hexdigest(),
+            "services/bar/requirements.txt": hashlib.sha256(
+                b"bar==1.0.0\n"
+            ).hexdigest(),
+            "services/foo/requirements.txt": hashlib.sha256(
+                b"foo==1.0.0\n"
+            ).hexdigest(),
+        }
+
+    def test_hash_files_glob_no_match(self, tmpdir: str) -> None:
+        """Test a glob pattern not matching any file is reported."""
+        with cwd(tmpdir), pytest.raises(
+            VirtualenvCacheConfigError, match="No files matching 'foo/\\*.txt'"
+        ):
+            LockFileHasher().hash_files(["foo/*.txt"])
+
+    def test_hash_files_memo(self, tmpdir: str) -> None:
+        """Test digests of unchanged lock files are taken from the memo."""
+        lock_file_path = os.path.join(tmpdir, "requirements.txt")
+        memo_path = os.path.join(tmpdir, "memo.json")
+        self._write_lock_file(lock_file_path, "foo==1.0.0\n")
+
+        expected = {lock_file_path: hashlib.sha256(b"foo==1.0.0\n").hexdigest()}
+        assert LockFileHasher(memo_path=memo_path).hash_files([lock_file_path]) == (
+            expected
+        )
+        assert os.path.isfile(memo_path)
+
+        flexmock(_lockfiles).should_receive("hash_file").never()
+        assert LockFileHasher(memo_path=memo_path).hash_files([lock_file_path]) == (
+            expected
+        )
+
+    def test_hash_files_memo_changed(self, tmpdir: str) -> None:
+        """Test a changed lock file is hashed again."""
+        lock_file_path = os.path.join(tmpdir, "requirements.txt")
+        memo_path = os.path.join(tmpdir, "memo.json")
+        self._write_lock_file(lock_file_path, "foo==1.0.0\n")
+        LockFileHasher(memo_path=memo_path).hash_files([lock_file_path])
+
+        self._write_lock_file(lock_file_path, "foo==2.0.0\n", mtime=1_000_000_001)
+        assert LockFileHasher(memo_path=memo_path).hash_files([lock_file_path]) == {
+            lock_file_path: hashlib.sha256(b"foo==2.0.0\n").hexdigest()
+        }
+
+    @pytest.mark.parametrize(
+        "file_name,content,equivalent_content",
+        [
+            (
+                "requirements.txt",
+                "# Generated by pip-compile\n"
+                "flask==2.3.3 \\\n    --hash=sha256:bbb \\\n    --hash=sha256:aaa\n"
+                "Jinja2 == 3.1.2 ; python_version >= '3.7'\n",
+                "jinja2==3.1.2;   python_version >= '3.7'  # via flask\n"
+                "Flask==2.3.3 --hash=sha256:aaa --hash=sha256:bbb\n",
+            ),
+            (
+                "poetry.lock",
+                '[[package]]\nname = "Flask"\nversion = "2.3.3"\n'
+                'files = [{file = "flask.whl", hash = "sha256:aaa"}]\n\n'
+                '[[package]]\nname = "jinja2"\nversion = "3.1.2"\n',
+                '# This file is automatically generated.\n[[package]]\nname = "jinja2"\nversion = "3.1.2"\n\n'
+                '[[package]]\nname = "flask"\nversion = "2.3.3"\n'
+                'files = [\n    {file = "flask.whl", hash = "sha256:aaa"},\n]\n',
+            ),
+            (
+                "Pipfile.lock",
+                '{"_meta": {"hash": {"sha256": "123"}}, "default": {"flask": '
+                '{"version": "==2.3.3", "hashes": ["sha256:bbb", "sha256:aaa"]}}}',
+                '{"_meta": {"hash": {"sha256": "456"}},\n "default": {\n  "flask": '
+                '{"hashes": ["sha256:aaa", "sha256:bbb"], "version": "==2.3.3"}\n }\n}',
+            ),
+        ],
+    )
+    def test_hash_files_semantic(
+        self, tmpdir: str, file_name: str, content: str, equivalent_content: str
+    ) -> None:
+        """Test formatting changes in lock files do not change their semantic digests."""
+        digests = []
+        for lock_file_content in (content, equivalent_content):
+            lock_file_path = os.path.join(tmpdir, file_name)
+            self._write_lock_file(lock_file_path, lock_file_content)
+            digests.append(
+                [
+                    LockFileHasher(semantic=semantic).hash_files([lock_file_path])
+                    for semantic in (False, True)
+                ]
+            )
+
+        assert digests[0][0] != digests[1][0]
+        assert digests[0][1] == digests[1][1]
+
+    def test_hash_files_semantic_change(self, tmpdir: str) -> None:
+        """Test a change in resolved packages changes the semantic digest."""
+        lock_file_path = os.path.join(tmpdir, "requirements.txt")
+        digests = []
+        for content in ("flask==2.3.3\n", "flask==2.3.2\n"):
+            self._write_lock_file(lock_file_path, content)
+            digests.append(LockFileHasher(semantic=True).hash_files([lock_file_path]))
+
+        assert digests[0] != digests[1]
+
+    def test_hash_files_semantic_unknown(self, tmpdir: str) -> None:
+        """Test lock files in an unknown format are hashed based on their content."""
+        lock_file_path = os.path.join(tmpdir, "uv.lock.json")
+        self._write_lock_file(lock_file_path, "foo\n")
+
+        result = LockFileHasher(semantic=True).hash_files([lock_file_path])
+
+        assert result == {lock_file_path: hashlib.sha256(b"foo\n").hexdigest()}
+
+    @pytest.mark.parametrize(
+        "file_name,content",
+        [
+            (
+                "requirements.txt",
+                "Flask==2.3.3 --hash=sha256:aaa\ntyping_extensions==4.7.1 ; python_version < '3.8'\n",
+            ),
+            (
+                "poetry.lock",
+                '[[package]]\nname = "flask"\nversion = "2.3.3"\n\n'
+                '[[package]]\nname = "typing-extensions"\nversion = "4.7.1"\n'
+                "markers = \"python_version < '3.8'\"\n",
+            ),
+            (
+                "Pipfile.lock",
+                '{"default": {"flask": {"version": "==2.3.3"}}, "develop": '
+                '{"typing-extensions": {"version": "==4.7.1", "markers": "python_version < \'3.8\'"}}}',
+            ),
+        ],
+    )
+    def test_load_packages(self, tmpdir: str, file_name: str, content: str) -> None:
+        """Test loading packages resolved in lock files as requirement strings."""
+        lock_file_path = os.path.join(tmpdir, file_name)
+        self._write_lock_file(lock_file_path, content)
+
+        assert _lockfiles.load_packages(lock_file_path) == {
+            "flask": "flask==2.3.3",
+            "typing-extensions": "typing-extensions==4.7.1; python_version < '3.8'",
+        }
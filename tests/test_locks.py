@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import threading
+from typing import Any
+from typing import List
+
+from base import BaseTestcase
+from base import ProjectInfo
+from base import create_virtualenv
+from base import list_files
+from flexmock import flexmock
+
+import virtualenv_cache._cache
+from virtualenv_cache import Cache
+from virtualenv_cache import Config
+from virtualenv_cache._locks import FileLock
+from virtualenv_cache.utils import cwd
+
+
+class TestLocks(BaseTestcase):
+    """Tests related to concurrent stores and restores of cache entries."""
+
+    def test_file_lock(self) -> None:
+        """Test exclusive and shared locks, also if the lock file is removed meanwhile."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "locks", "entry")
+            first, second = FileLock(path), FileLock(path)
+
+            assert first.acquire(shared=True)
+            assert second.acquire(shared=True, blocking=False)
+            second.release()
+
+            first.release()
+            assert first.acquire()
+            assert not second.acquire(shared=True, blocking=False)
+
+            acquired = threading.Event()
+
+            def _wait() -> None:
+                second.acquire()
+                acquired.set()
+
+            thread = threading.Thread(target=_wait)
+            thread.start()
+            assert not acquired.wait(0.1)
+            first.remove()
+            thread.join()
+            assert acquired.is_set()
+            assert os.path.exists(path)
+            assert not first.acquire(blocking=False)
+            second.release()
+
+    def test_store_skipped(self, project_info: ProjectInfo) -> None:
+        """Test a store is skipped if the entry is being stored by another process."""
+        cache = Cache(config=Config.load(project_info.config_path))
+        create_virtualenv(os.path.join(project_info.project_dir, ".venv"))
+        with cwd(project_info.project_dir):
+            entry_id = cache._hash_all_lock_files()
+            store_lock = cache._get_entry_lock(entry_id, store=True)
+            assert store_lock.acquire(blocking=False)
+
+            flexmock(Cache).should_receive("_store_local").never()
+            flexmock(Cache).should_receive("_trim_cache").never()
+            cache.store()
+            store_lock.release()
+
+        assert cache.metrics.to_dict()["operations"]["store"]["outcome"] == "skipped"
+
+    def test_store_staged(self, project_info: ProjectInfo) -> None:
+        """Test the entry is replaced atomically, restores never see it partially stored."""
+        config = Config.load(project_info.config_path)
+        cache = Cache(config=config)
+        venv_path = os.path.join(project_info.project_dir, ".venv")
+        create_virtualenv(venv_path)
+
+        with cwd(project_info.project_dir):
+            cached_entry_path = os.path.join(
+                config.expanded_cache_path, cache._hash_all_lock_files()
+            )
+            # A virtual environment stored before, it is replaced as a whole.
+            os.makedirs(os.path.join(cached_entry_path, "venv", "old"))
+            old_content = set(os.listdir(os.path.join(cached_entry_path, "venv")))
+            copy_tree = virtualenv_cache._cache.copy_tree
+
+            def _copy_tree(*args: Any, **kwargs: Any) -> None:
+                copy_tree(*args, **kwargs)
+                # Copied, but not placed to the cache yet.
+                assert (
+                    set(os.listdir(os.path.join(cached_entry_path, "venv")))
+                    == old_content
+                )
+
+            flexmock(virtualenv_cache._cache).should_receive("copy_tree").replace_with(
+                _copy_tree
+            ).once()
+            cache.store()
+
+        assert os.listdir(os.path.join(cached_entry_path, "venv")) == ["lib"]
+        assert os.listdir(os.path.join(config.expanded_cache_path, ".staging")) == []
+
+    def test_concurrent_store_restore(self, project_info: ProjectInfo) -> None:
+        """Test storing the same entry concurrently, while it is restored."""
+        venv_path = os.path.join(project_info.project_dir, ".venv")
+        create_virtualenv(venv_path)
+        outcomes: List[str] = []
+
+        def _store() -> None:
+            cache = Cache(config=Config.load(project_info.config_path))
+            cache.store()
+            outcomes.append(cache.metrics.to_dict()["operations"]["store"]["outcome"])
+
+        def _restore() -> None:
+            config = Config.load(project_info.config_path)
+            config.virtualenv_path = os.path.join(project_info.project_dir, "restored")
+            Cache(config=config).restore()
+
+        with cwd(project_info.project_dir):
+            threads = [threading.Thread(target=_store) for _ in range(4)]
+            threads.append(threading.Thread(target=_restore))
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            _restore()
+
+        assert "stored" in outcomes
+        assert set(outcomes) <= {"stored", "skipped"}
+        assert list_files(
+            os.path.join(project_info.project_dir, "restored", "lib")
+        ) == {
+            "foo/a.py",
+            "foo/b.py",
+            "bar/c.py",
+        }
+
+    def test_trim_locked(self, project_info: ProjectInfo) -> None:
+        """Test entries being restored are not removed, stale staged entries are removed."""
+        config = Config.load(project_info.config_path)
+        config.cache_size = 1
+        cache = Cache(config=config)
+        entries = [e["id"] for e in cache._list_entries()]
+        assert len(entries) > 1
+
+        staged_path = os.path.join(
+            config.expanded_cache_path, ".staging", f"{entries[0]}-stale"
+        )
+        os.makedirs(os.path.join(staged_path, "venv"))
+
+        locks = [cache._get_entry_lock(entry_id) for entry_id in entries]
+        for lock in locks:
+            assert lock.acquire(shared=True)
+
+        cache._trim_cache()
+        assert {e["id"] for e in cache._list_entries()} == set(entries)
+        assert not os.path.exists(staged_path)
+
+        for lock in locks:
+            lock.release()
+
+        cache._trim_cache()
+        kept = [e["id"] for e in cache._list_entries()]
+        assert len(kept) == 1
+        # Locks of removed entries are removed with them.
+        assert {
+            name.split(".", 1)[0]
+            for name in os.listdir(os.path.join(config.expanded_cache_path, ".locks"))
+        } == set(kept)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+import json
+import os
+
+import pytest
+from base import BaseTestcase
+from base import ProjectInfo
+from click.testing import CliRunner
+
+from virtualenv_cache import Cache
+from virtualenv_cache import Config
+from virtualenv_cache import VirtualenvCacheMiss
+from virtualenv_cache._metrics import Metrics
+from virtualenv_cache.cli import cli
+from virtualenv_cache.utils import cwd
+
+
+class TestMetrics(BaseTestcase):
+    """Tests related to metrics collected by cache operations."""
+
+    def test_nested_operations(self) -> None:
+        """Test phases and counters are attributed to the innermost operation."""
+        metrics = Metrics()
+        with metrics.phase("ignored"):
+            pass
+
+        with metrics.operation("store"):
+            with metrics.phase("copy"):
+                metrics.add_io(files=2, size=10)
+            with metrics.operation("trim"):
+                with metrics.phase("remove_entries"):
+                    metrics.add_io(size=5)
+            with metrics.phase("copy"):
+                metrics.add_io(files=1, size=20)
+            metrics.set_outcome("stored")
+
+        data = metrics.to_dict()
+        assert set(data["operations"]) == {"store", "trim"}
+        store = data["operations"]["store"]
+        assert set(store["phases"]) == {"copy"}
+        assert (store["files"], store["bytes"], store["outcome"]) == (3, 30, "stored")
+        assert (
+            store["duration_seconds"] >= data["operations"]["trim"]["duration_seconds"]
+        )
+        assert store["files_per_second"] == pytest.approx(3 / store["duration_seconds"])
+        trim = data["operations"]["trim"]
+        assert set(trim["phases"]) == {"remove_entries"}
+        assert (trim["files"], trim["bytes"], trim["outcome"]) == (0, 5, None)
+
+        copied = Metrics()
+        copied.update(json.loads(json.dumps(data)))
+        assert copied.to_dict()["operations"] == data["operations"]
+
+    def test_openmetrics(self) -> None:
+        """Test producing metrics in the OpenMetrics text format."""
+        metrics = Metrics()
+        with metrics.operation("restore"):
+            with metrics.phase("copy"):
+                metrics.add_io(files=1, size=1)
+            metrics.set_outcome("hit")
+
+        lines = metrics.to_openmetrics().splitlines()
+        assert lines[0] == "# TYPE virtualenv_cache_operation_duration_seconds gauge"
+        assert lines[-1] == "# EOF"
+        assert 'virtualenv_cache_files{operation="restore"} 1' in lines
+        assert 'virtualenv_cache_outcome{operation="restore",outcome="hit"} 1' in lines
+        assert any(
+            line.startswith(
+                'virtualenv_cache_phase_duration_seconds{operation="restore",phase="copy"} '
+            )
+            for line in lines
+        )
+
+    @staticmethod
+    def _populate_entry(project_info: ProjectInfo) -> None:
+        """Place a virtual environment to the cache entry matching lock files of the project, without a manifest."""
+        with cwd(project_info.project_dir):
+            entry_id = Cache(
+                config=Config.load(project_info.config_path)
+            )._hash_all_lock_files()
+
+        venv_path = os.path.join(project_info.cache_dir, entry_id, "venv")
+        os.makedirs(os.path.join(venv_path, "bin"))
+        with open(os.path.join(venv_path, "pyvenv.cfg"), "w") as f:
+            f.write("home = /usr/bin\n")
+        with open(os.path.join(venv_path, "bin", "activate"), "w") as f:
+            f.write("# activate\n")
+
+    def test_restore_store(self, project_info: ProjectInfo) -> None:
+        """Test metrics collected on restore and store."""
+        self._populate_entry(project_info)
+        cache = Cache(config=Config.load(project_info.config_path))
+        with cwd(project_info.project_dir):
+            cache.restore()
+            cache.store()
+
+        operations = cache.metrics.to_dict()["operations"]
+        restore = operations["restore"]
+        assert restore["outcome"] == "hit"
+        assert restore["files"] > 0
+        assert {
+            "hash_lock_files",
+            "remove_virtualenv",
+            "copy",
+            "record_manifest",
+            "mark_usage",
+        } <= set(restore["phases"])
+
+        # The cache entry was stored without a manifest, all the files are stored again.
+        assert operations["store"]["outcome"] == "stored"
+        assert operations["store"]["files"] == restore["files"]
+        assert {"scan", "compute_digests", "copy"} <= set(operations["store"]["phases"])
+        assert "list_entries" in operations["trim"]["phases"]
+
+        cache = Cache(config=Config.load(project_info.config_path))
+        with cwd(project_info.project_dir):
+            cache.store()
+
+        store = cache.metrics.to_dict()["operations"]["store"]
+        assert (store["outcome"], store["files"]) == ("unchanged", 0)
+
+    def test_restore_miss(self, project_info: ProjectInfo) -> None:
+        """Test a cache miss is recorded."""
+        with open(os.path.join(project_info.project_dir, "requirements.txt"), "w") as f:
+            f.write("flask==2.3.4\n")
+
+        cache = Cache(config=Config.load(project_info.config_path))
+        with cwd(project_info.project_dir), pytest.raises(VirtualenvCacheMiss):
+            cache.restore()
+
+        assert cache.metrics.to_dict()["operations"]["restore"]["outcome"] == "miss"
+
+    @pytest.mark.parametrize("daemon", [False, True])
+    def test_cli(
+        self, project_info: ProjectInfo, daemon: bool, request: pytest.FixtureRequest
+    ) -> None:
+        """Test writing metrics to a file, also if the command is served by the daemon or fails."""
+        if daemon:
+            request.getfixturevalue("cache_daemon")
+
+        self._populate_entry(project_info)
+        metrics_path = os.path.join(project_info.project_dir, "metrics.json")
+        args = [
+            "--work-dir",
+            project_info.project_dir,
+            "--config-path",
+            project_info.config_path,
+            "--metrics-file",
+            metrics_path,
+        ]
+        result = CliRunner().invoke(cli, ["restore", *args])
+        assert result.exit_code == 0
+        with open(metrics_path) as f:
+            assert f.read().startswith("{")
+
+        result = CliRunner().invoke(
+            cli, ["erase", *args, "--metrics-format", "openmetrics"]
+        )
+        assert result.exit_code == 0
+        with open(metrics_path) as f:
+            content = f.read()
+        assert (
+            'virtualenv_cache_operation_duration_seconds{operation="erase"}' in content
+        )
+        assert content.endswith("# EOF\n")
+
+        result = CliRunner().invoke(cli, ["restore", *args])
+        assert result.exit_code == 1
+        with open(metrics_path) as f:
+            restore = json.load(f)["operations"]["restore"]
+        assert restore["outcome"] == "miss"
+        assert "hash_lock_files" in restore["phases"]
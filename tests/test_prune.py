@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import sys
+
+import pytest
+from base import BaseTestcase
+from base import ProjectInfo
+from base import list_files
+from base import write_file
+
+from virtualenv_cache import Cache
+from virtualenv_cache import Config
+from virtualenv_cache._prune import PruneFilter
+from virtualenv_cache.utils import cwd
+
+
+class TestPrune(BaseTestcase):
+    """Tests related to items of virtual environments not stored in the cache."""
+
+    @staticmethod
+    def _get_config(project_info: ProjectInfo) -> Config:
+        """Get configuration excluding bytecode and tests of packages."""
+        config = Config.load(project_info.config_path)
+        config.prune_exclude = ["__pycache__", "tests", "*.a"]
+        config.prune_include = ["lib/bar/tests"]
+        return config
+
+    def test_filter(self) -> None:
+        """Test matching items against exclude and include rules."""
+        prune_filter = PruneFilter(
+            exclude=["__pycache__", "lib/*/tests"], include=["lib/bar/*"]
+        )
+        assert prune_filter.is_excluded("__pycache__")
+        assert prune_filter.is_excluded("lib/foo/__pycache__")
+        assert prune_filter.is_excluded("lib/foo/tests")
+        assert not prune_filter.is_excluded("lib/foo/testing")
+        assert not prune_filter.is_excluded("lib/bar/tests")
+        assert not prune_filter.is_excluded("lib/foo/__init__.py")
+        assert not PruneFilter().is_excluded("lib/foo/__pycache__")
+
+    @pytest.mark.parametrize("entry_format", ["tree", "archive", "objects"])
+    def test_store_restore(self, project_info: ProjectInfo, entry_format: str) -> None:
+        """Test excluded items are not stored and not restored."""
+        config = self._get_config(project_info)
+        config.entry_format = entry_format
+        config.archive_compression = "gzip"
+        venv_path = os.path.join(project_info.project_dir, ".venv")
+        write_file(venv_path, "lib/foo/__init__.py", "# foo\n")
+        write_file(venv_path, "lib/foo/__pycache__/__init__.pyc", "")
+        write_file(venv_path, "lib/foo/tests/test_foo.py", "# test\n")
+        write_file(venv_path, "lib/foo/libfoo.a", "")
+        write_file(venv_path, "lib/bar/tests/__init__.py", "# used at runtime\n")
+
+        with cwd(project_info.project_dir):
+            cache = Cache(config=config)
+            cache.store()
+            assert cache.metrics.to_dict()["operations"]["store"]["files"] == 2
+
+            shutil.rmtree(venv_path)
+            Cache(config=config).restore()
+
+        assert list_files(venv_path) == {
+            ".virtualenv-cache-manifest.json",
+            "lib/foo/__init__.py",
+            "lib/bar/tests/__init__.py",
+        }
+
+    @pytest.mark.parametrize("restore_mode", ["replace", "sync"])
+    def test_excluded_not_changes(
+        self, project_info: ProjectInfo, restore_mode: str
+    ) -> None:
+        """Test excluded items created at runtime are not treated as changes and are kept by sync restores."""
+        config = self._get_config(project_info)
+        config.restore_mode = restore_mode
+        venv_path = os.path.join(project_info.project_dir, ".venv")
+        write_file(venv_path, "lib/foo/__init__.py", "# foo\n")
+
+        with cwd(project_info.project_dir):
+            Cache(config=config).store()
+            write_file(venv_path, "lib/foo/__pycache__/__init__.pyc", "")
+
+            cache = Cache(config=config)
+            cache.store()
+            assert (
+                cache.metrics.to_dict()["operations"]["store"]["outcome"] == "unchanged"
+            )
+
+            write_file(venv_path, "lib/foo/__init__.py", "# modified\n")
+            Cache(config=config).restore()
+
+        with open(os.path.join(venv_path, "lib", "foo", "__init__.py")) as f:
+            assert f.read() == "# foo\n"
+        assert os.path.isfile(
+            os.path.join(venv_path, "lib", "foo", "__pycache__", "__init__.pyc")
+        ) == (restore_mode == "sync")
+
+    def test_compile_bytecode(self, project_info: ProjectInfo) -> None:
+        """Test bytecode is compiled after restore using the interpreter of the virtual environment."""
+        config = self._get_config(project_info)
+        config.bytecode_compilation = "parallel"
+        config.copy_workers = 2
+        venv_path = os.path.join(project_info.project_dir, ".venv")
+        write_file(venv_path, "lib/foo/__init__.py", "# foo\n")
+        write_file(venv_path, "lib/foo/bar.py", "BAR = 42\n")
+        os.makedirs(os.path.join(venv_path, "bin"))
+        os.symlink(sys.executable, os.path.join(venv_path, "bin", "python"))
+
+        with cwd(project_info.project_dir):
+            Cache(config=config).store()
+            shutil.rmtree(venv_path)
+            cache = Cache(config=config)
+            cache.restore()
+
+        assert sorted(
+            name.split(".")[0]
+            for name in os.listdir(os.path.join(venv_path, "lib", "foo", "__pycache__"))
+        ) == ["__init__", "bar"]
+        assert (
+            "compile_bytecode"
+            in cache.metrics.to_dict()["operations"]["restore"]["phases"]
+        )
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+
+import pytest
+from base import BaseTestcase
+from base import ProjectInfo
+from base import create_virtualenv
+from base import read_file
+from flexmock import flexmock
+
+from virtualenv_cache import Cache
+from virtualenv_cache import Config
+from virtualenv_cache._manifest import Manifest
+from virtualenv_cache.utils import cwd
+
+
+class TestRelocate(BaseTestcase):
+    """Tests related to restoring virtual environments to a path other than they were stored from."""
+
+    @pytest.mark.parametrize(
+        "entry_format,copy_strategy",
+        [("tree", "copy"), ("objects", "hardlink"), ("archive", "copy")],
+    )
+    def test_restore_relocated(
+        self, project_info: ProjectInfo, entry_format: str, copy_strategy: str
+    ) -> None:
+        """Test path-dependent files are rewritten on restore, the cache entry is kept intact."""
+        config = Config.load(project_info.config_path)
+        config.entry_format = entry_format
+        config.copy_strategy = copy_strategy
+        config.archive_compression = "gzip"
+        stored_path = os.path.join(project_info.project_dir, ".venv")
+        create_virtualenv(stored_path, scripts=True)
+
+        with cwd(project_info.project_dir):
+            Cache(config=config).store()
+            entry_id = Cache(config=config)._hash_all_lock_files()
+
+            config.virtualenv_path = os.path.join(project_info.project_dir, "other")
+            cache = Cache(config=config)
+            cache.restore()
+
+        entry_manifest = Manifest.load(
+            os.path.join(
+                config.expanded_cache_path, entry_id, "virtualenv-cache-manifest.json"
+            )
+        )
+        assert entry_manifest.prefix == stored_path
+        assert sorted(entry_manifest.relocatable) == [
+            "bin/activate",
+            "bin/pip",
+            "bin/pip3",
+            "pyvenv.cfg",
+        ]
+
+        restored_path = config.expanded_virtualenv_path
+        assert read_file(restored_path, "bin/pip").startswith(f"#!{restored_path}/bin/")
+        assert f'VIRTUAL_ENV="{restored_path}"' in read_file(
+            restored_path, "bin/activate"
+        )
+        assert read_file(restored_path, "pyvenv.cfg").endswith(
+            f"venv {restored_path}\n"
+        )
+        assert stored_path in read_file(restored_path, "lib/foo/__init__.py")
+        assert os.access(os.path.join(restored_path, "bin", "pip"), os.X_OK)
+        assert os.readlink(os.path.join(restored_path, "bin", "pip3")) == os.path.join(
+            restored_path, "bin", "pip"
+        )
+        assert os.readlink(os.path.join(restored_path, "bin", "python")) == (
+            "/usr/bin/python3"
+        )
+        assert "relocate" in cache.metrics.to_dict()["operations"]["restore"]["phases"]
+
+        # Files stored in the cache are not modified.
+        assert read_file(stored_path, "bin/pip").startswith(f"#!{stored_path}/bin/")
+        if entry_format == "tree":
+            assert read_file(
+                os.path.join(config.expanded_cache_path, entry_id, "venv"), "bin/pip"
+            ).startswith(f"#!{stored_path}/bin/")
+
+        with cwd(project_info.project_dir):
+            cache = Cache(config=config)
+            cache.store()
+            assert (
+                cache.metrics.to_dict()["operations"]["store"]["outcome"] == "unchanged"
+            )
+
+    def test_store_relocated(self, project_info: ProjectInfo) -> None:
+        """Test changes done to a relocated virtual environment are stored as a whole."""
+        config = Config.load(project_info.config_path)
+        create_virtualenv(os.path.join(project_info.project_dir, ".venv"), scripts=True)
+
+        with cwd(project_info.project_dir):
+            Cache(config=config).store()
+            config.virtualenv_path = os.path.join(project_info.project_dir, "other")
+            Cache(config=config).restore()
+
+            with open(os.path.join(config.virtualenv_path, "lib", "bar.py"), "w") as f:
+                f.write("# added\n")
+
+            flexmock(Cache).should_receive("_store_tree_changes").never()
+            Cache(config=config).store()
+
+            config.virtualenv_path = os.path.join(project_info.project_dir, "third")
+            Cache(config=config).restore()
+
+        assert read_file(config.virtualenv_path, "lib/bar.py") == "# added\n"
+        assert read_file(config.virtualenv_path, "bin/pip").startswith(
+            f"#!{config.virtualenv_path}/bin/"
+        )
+
+    def test_restore_shared_relocated(
+        self, project_info: ProjectInfo, tmpdir: str
+    ) -> None:
+        """Test entries stored to the shared tier from a snapshot state the path to the virtual environment."""
+        config = Config.load(project_info.config_path)
+        config.shared_cache_path = os.path.join(tmpdir, "shared")
+        stored_path = os.path.join(project_info.project_dir, ".venv")
+        create_virtualenv(stored_path, scripts=True)
+
+        with cwd(project_info.project_dir):
+            cache = Cache(config=config)
+            entry_id = cache._hash_all_lock_files()
+            cache.store()
+            cache.wait()
+
+            shutil.rmtree(project_info.cache_dir)
+            config.virtualenv_path = os.path.join(project_info.project_dir, "other")
+            Cache(config=config).restore()
+
+        entry_manifest = Manifest.load(
+            os.path.join(
+                config.shared_cache_path, entry_id, "virtualenv-cache-manifest.json"
+            )
+        )
+        assert entry_manifest.prefix == stored_path
+        restored_path = config.expanded_virtualenv_path
+        assert read_file(restored_path, "bin/pip").startswith(f"#!{restored_path}/bin/")
+        assert read_file(restored_path, "pyvenv.cfg").endswith(
+            f"venv {restored_path}\n"
+        )
+
+    def test_relocation_none(self, project_info: ProjectInfo) -> None:
+        """Test the virtual environment is restored as stored if relocation is turned off."""
+        config = Config.load(project_info.config_path)
+        config.relocation = "none"
+        stored_path = os.path.join(project_info.project_dir, ".venv")
+        create_virtualenv(stored_path, scripts=True)
+
+        with cwd(project_info.project_dir):
+            Cache(config=config).store()
+            config.virtualenv_path = os.path.join(project_info.project_dir, "other")
+            Cache(config=config).restore()
+
+        assert read_file(config.virtualenv_path, "bin/pip").startswith(
+            f"#!{stored_path}/bin/"
+        )
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+import glob
+import os
+import tempfile
+
+import pytest
+from base import BaseTestcase
+from base import ProjectInfo
+from flexmock import flexmock
+
+import virtualenv_cache._cache
+from virtualenv_cache import Cache
+from virtualenv_cache import Config
+from virtualenv_cache._trash import get_erased_pattern
+from virtualenv_cache._trash import move_to_trash
+from virtualenv_cache._trash import purge
+from virtualenv_cache._trash import remove_tree
+from virtualenv_cache._trash import spawn_purge
+from virtualenv_cache.utils import cwd
+
+
+def _create_tree(path: str) -> None:
+    """Create a directory tree with nested directories and symlinks."""
+    for i in range(20):
+        dir_path = os.path.join(path, f"dir{i % 3}", "nested")
+        os.makedirs(dir_path, exist_ok=True)
+        with open(os.path.join(dir_path, f"file{i}"), "w") as f:
+            f.write(str(i))
+    os.symlink("dir0", os.path.join(path, "link"))
+
+
+class TestTrash(BaseTestcase):
+    """Tests related to deleting removed cache entries."""
+
+    @pytest.mark.parametrize("workers", [1, 4])
+    def test_remove_tree(self, workers: int) -> None:
+        """Test removing a directory tree, symlinks are not followed."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            outside_path = os.path.join(tmp_dir, "outside")
+            _create_tree(outside_path)
+            tree_path = os.path.join(tmp_dir, "tree")
+            _create_tree(tree_path)
+            os.symlink(outside_path, os.path.join(tree_path, "outside"))
+
+            remove_tree(tree_path, workers=workers)
+            assert os.listdir(tmp_dir) == ["outside"]
+            assert len(os.listdir(outside_path)) == 4
+
+            # Nothing to be removed.
+            remove_tree(tree_path, workers=workers)
+
+    def test_purge(self) -> None:
+        """Test purging items moved to trash, also in a background process."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            trash_path = os.path.join(tmp_dir, ".trash")
+            for name in ("first", "second"):
+                _create_tree(os.path.join(tmp_dir, name))
+                assert move_to_trash(os.path.join(tmp_dir, name), trash_path)
+            assert move_to_trash(os.path.join(tmp_dir, "missing"), trash_path)
+
+            assert os.listdir(tmp_dir) == [".trash"]
+            assert len(os.listdir(trash_path)) == 2
+            assert purge(trash_path, workers=2) == 2
+            assert os.listdir(trash_path) == [".lock"]
+
+            _create_tree(os.path.join(tmp_dir, "third"))
+            assert move_to_trash(os.path.join(tmp_dir, "third"), trash_path)
+            assert spawn_purge([trash_path], workers=2).wait() == 0
+            assert os.listdir(trash_path) == [".lock"]
+
+            _create_tree(os.path.join(tmp_dir, "tree"))
+            assert spawn_purge([os.path.join(tmp_dir, "tree")], trash=False).wait() == 0
+            assert os.listdir(tmp_dir) == [".trash"]
+
+    @pytest.mark.parametrize("purge_mode", ["background", "inline"])
+    def test_trim_erase(self, project_info: ProjectInfo, purge_mode: str) -> None:
+        """Test entries removed on trim and erased caches are deleted."""
+        config = Config.load(project_info.config_path)
+        config.purge_mode = purge_mode
+        config.cache_size = 1
+        cache = Cache(config=config)
+        if purge_mode == "inline":
+            flexmock(virtualenv_cache._cache).should_receive("spawn_purge").never()
+        else:
+            flexmock(virtualenv_cache._cache).should_call("spawn_purge").twice()
+
+        cache._trim_cache()
+        assert len(cache._list_entries()) == 1
+        entries = [
+            e for e in os.listdir(project_info.cache_dir) if not e.startswith(".")
+        ]
+        assert len(entries) == 1
+        trash_path = os.path.join(project_info.cache_dir, ".trash")
+        assert not os.path.exists(trash_path) or os.listdir(trash_path) in (
+            [],
+            [".lock"],
+        )
+
+        with cwd(project_info.project_dir):
+            cache.erase()
+        assert not os.path.exists(project_info.cache_dir)
+        assert glob.glob(get_erased_pattern(project_info.cache_dir)) == []
+
+    def test_purge_leftovers(self, project_info: ProjectInfo) -> None:
+        """Test items left in trash and erased caches not deleted before are deleted on the next trim."""
+        trash_path = os.path.join(project_info.cache_dir, ".trash")
+        _create_tree(os.path.join(trash_path, "leftover"))
+        erased_path = get_erased_pattern(project_info.cache_dir).replace("*", "old")
+        _create_tree(erased_path)
+
+        cache = Cache(config=Config.load(project_info.config_path))
+        cache._trim_cache()
+
+        assert os.listdir(trash_path) == [".lock"]
+        assert not os.path.exists(erased_path)
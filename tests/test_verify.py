@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import shutil
+import stat
+
+import pytest
+from base import BaseTestcase
+from base import ProjectInfo
+from base import write_file
+from click.testing import CliRunner
+
+from virtualenv_cache import Cache
+from virtualenv_cache import Config
+from virtualenv_cache import VirtualenvCacheMiss
+from virtualenv_cache._archive import find_archive
+from virtualenv_cache._archive import get_archive_name
+from virtualenv_cache._manifest import ManifestRecord
+from virtualenv_cache._verify import sample_files
+from virtualenv_cache.cli import cli
+from virtualenv_cache.utils import cwd
+
+
+class TestVerify(BaseTestcase):
+    """Tests related to verification of cache entries against their manifests."""
+
+    @staticmethod
+    def _store(config: Config, venv_path: str) -> str:
+        """Store a virtual environment to the cache, return the identifier of the cache entry."""
+        write_file(venv_path, "lib/foo/__init__.py", "# foo\n")
+        write_file(venv_path, "lib/foo/bar.py", "BAR = 42\n")
+        cache = Cache(config=config)
+        cache.store()
+        return cache._hash_all_lock_files()
+
+    @staticmethod
+    def _corrupt(config: Config, entry_id: str) -> None:
+        """Corrupt data stored in the given cache entry, files keep their size."""
+        cached_entry_path = os.path.join(config.expanded_cache_path, entry_id)
+        if config.entry_format == "objects":
+            cache = Cache(config=config)
+            record = cache._load_entry_manifest(cached_entry_path).records[
+                "lib/foo/bar.py"
+            ]
+            path = cache._get_object_store().object_path(record.digest, record.mode)
+            os.chmod(path, stat.S_IRUSR | stat.S_IWUSR)
+        elif config.entry_format == "archive":
+            path = os.path.join(
+                cached_entry_path, get_archive_name(find_archive(cached_entry_path))
+            )
+            # A partially written archive.
+            with open(path, "r+b") as f:
+                f.truncate(os.path.getsize(path) // 2)
+            return
+        else:
+            path = os.path.join(cached_entry_path, "venv", "lib", "foo", "bar.py")
+
+        with open(path, "w") as f:
+            f.write("BAR = 43\n")
+
+    def test_sample_files(self) -> None:
+        """Test picking a ratio of files to be checked."""
+        records = [
+            ManifestRecord(path=str(i), type=ManifestRecord.FILE) for i in range(10)
+        ]
+        assert sample_files(records, 1.0) == records
+        assert len(sample_files(records, 0.25)) == 3
+        assert len(sample_files(records, 0.01)) == 1
+        assert sample_files([], 0.5) == []
+
+    @pytest.mark.parametrize("entry_format", ["tree", "objects", "archive"])
+    def test_verify(self, project_info: ProjectInfo, entry_format: str) -> None:
+        """Test corrupt entries are reported and moved to quarantine."""
+        config = Config.load(project_info.config_path)
+        config.entry_format = entry_format
+        config.archive_compression = "gzip"
+        venv_path = os.path.join(project_info.project_dir, ".venv")
+
+        with cwd(project_info.project_dir):
+            entry_id = self._store(config, venv_path)
+
+            cache = Cache(config=config)
+            assert cache.verify() == [{"id": entry_id, "files": 2, "corrupt": []}]
+            assert cache.metrics.to_dict()["operations"]["verify"]["outcome"] == "ok"
+
+            self._corrupt(config, entry_id)
+            cache = Cache(config=config)
+            reports = cache.verify()
+            assert [r["id"] for r in reports] == [entry_id]
+            assert reports[0]["corrupt"]
+            assert (
+                cache.metrics.to_dict()["operations"]["verify"]["outcome"] == "corrupt"
+            )
+
+            assert entry_id not in {e["id"] for e in Cache(config=config).list()}
+            assert not os.path.exists(
+                os.path.join(config.expanded_cache_path, entry_id)
+            )
+            quarantined = os.listdir(
+                os.path.join(config.expanded_cache_path, ".quarantine")
+            )
+            assert any(name.startswith(f"{entry_id}-") for name in quarantined)
+
+            # The corrupt object is quarantined as well, so that it is stored again.
+            shutil.rmtree(venv_path)
+            entry_id = self._store(config, venv_path)
+            assert Cache(config=config).verify()[0]["corrupt"] == []
+
+    def test_restore_verify(self, project_info: ProjectInfo) -> None:
+        """Test a corrupt entry is not restored if verified on restore."""
+        config = Config.load(project_info.config_path)
+        config.restore_verify = "digest"
+        venv_path = os.path.join(project_info.project_dir, ".venv")
+
+        with cwd(project_info.project_dir):
+            entry_id = self._store(config, venv_path)
+            shutil.rmtree(venv_path)
+
+            cache = Cache(config=config)
+            cache.restore()
+            assert (
+                "verify" in cache.metrics.to_dict()["operations"]["restore"]["phases"]
+            )
+
+            self._corrupt(config, entry_id)
+            shutil.rmtree(venv_path)
+            with pytest.raises(VirtualenvCacheMiss):
+                Cache(config=config).restore()
+
+        assert not os.path.exists(venv_path)
+        assert not os.path.exists(os.path.join(config.expanded_cache_path, entry_id))
+
+    def test_cli(self, project_info: ProjectInfo) -> None:
+        """Test the verify command signalizes corrupt entries with exit code 1."""
+        config = Config.load(project_info.config_path)
+        venv_path = os.path.join(project_info.project_dir, ".venv")
+
+        with cwd(project_info.project_dir):
+            entry_id = self._store(config, venv_path)
+
+            args = [
+                "verify",
+                "--format",
+                "json",
+                "--config-path",
+                project_info.config_path,
+                "--work-dir",
+                project_info.project_dir,
+            ]
+            result = CliRunner().invoke(cli, args)
+            assert result.exit_code == 0, result.output
+            assert json.loads(result.output) == [
+                {"id": entry_id, "files": 2, "corrupt": []}
+            ]
+
+            self._corrupt(config, entry_id)
+            result = CliRunner().invoke(cli, args)
+            assert result.exit_code == 1
+            assert json.loads(result.output)[0]["corrupt"] == ["lib/foo/bar.py"]
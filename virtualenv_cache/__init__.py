@@ -5,6 +5,8 @@ from ._config import Config
 from ._exceptions import VirtualenvCacheConfigError
 from ._exceptions import VirtualenvCacheException
 from ._exceptions import VirtualenvCacheMiss
+from ._exceptions import VirtualenvCachePartialHit
+from ._exceptions import VirtualenvCacheStorageError
 
 __title__ = "virtualenv-cache"
 __version__ = "0.0.2"
@@ -16,4 +18,6 @@ __all__ = [
     VirtualenvCacheConfigError.__name__,
     VirtualenvCacheException.__name__,
     VirtualenvCacheMiss.__name__,
+    VirtualenvCachePartialHit.__name__,
+    VirtualenvCacheStorageError.__name__,
 ]
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+
+import gzip
+import logging
+import lzma
+import os
+import tarfile
+from contextlib import contextmanager
+from typing import BinaryIO
+from typing import Collection
+from typing import Dict
+from typing import Generator
+from typing import Optional
+from typing import Tuple
+
+from ._exceptions import VirtualenvCacheConfigError
+from ._manifest import Manifest
+from ._manifest import ManifestRecord
+from ._manifest import hash_stream
+
+_LOGGER = logging.getLogger(__name__)
+
+ARCHIVE_COMPRESSIONS = ("zstd", "gzip", "xz", "none")
+# Inclusive ranges of compression levels, the level is not used with no compression.
+ARCHIVE_COMPRESSION_LEVELS = {"zstd": (1, 22), "gzip": (0, 9), "xz": (0, 9)}
+
+_ARCHIVE_NAMES = {
+    "zstd": "venv.tar.zst",
+    "gzip": "venv.tar.gz",
+    "xz": "venv.tar.xz",
+    "none": "venv.tar",
+}
+
+
+def _import_zstandard():  # type: ignore
+    """Import the optional zstandard module."""
+    try:
+        import zstandard
+    except ImportError as exc:
+        raise VirtualenvCacheConfigError(
+            "Compression 'zstd' requires the zstandard package, install it using "
+            "`pip install virtualenv-cache[zstd]' or configure a different archive compression"
+        ) from exc
+
+    return zstandard
+
+
+def get_archive_name(compression: str) -> str:
+    """Get name of the archive file stored in a cache entry for the given compression."""
+    return _ARCHIVE_NAMES[compression]
+
+
+def get_archive_compression(name: str) -> Optional[str]:
+    """Get compression of an archive based on its file name, None if the name does not state an archive."""
+    for compression, archive_name in _ARCHIVE_NAMES.items():
+        if name == archive_name:
+            return compression
+
+    return None
+
+
+def find_archive(cached_entry_path: str) -> Optional[str]:
+    """Find compression of the archive stored in the given cache entry, if any."""
+    for compression, archive_name in _ARCHIVE_NAMES.items():
+        if os.path.isfile(os.path.join(cached_entry_path, archive_name)):
+            return compression
+
+    return None
+
+
+@contextmanager
+def _open_compressed(
+    f: BinaryIO, compression: str, *, write: bool, level: int, threads: int
+) -> Generator[BinaryIO, None, None]:
+    """Wrap the given file object to compress or decompress data on the fly."""
+    if compression == "zstd":
+        zstandard = _import_zstandard()
+        if write:
+            compressor = zstandard.ZstdCompressor(level=level, threads=threads)
+            with compressor.stream_writer(f, closefd=False) as stream:
+                yield stream
+        else:
+            with zstandard.ZstdDecompressor().stream_reader(f, closefd=False) as stream:
+                yield stream
+    elif compression == "gzip":
+        with gzip.GzipFile(
+            fileobj=f, mode="wb" if write else "rb", compresslevel=level
+        ) as stream:
+            yield stream  # type: ignore
+    elif compression == "xz":
+        with lzma.LZMAFile(
+            f, mode="wb" if write else "rb", preset=level if write else None
+        ) as stream:
+            yield stream  # type: ignore
+    else:
+        yield f
+
+
+def _create_tarinfo(src_path: str, record: ManifestRecord) -> tarfile.TarInfo:
+    """Create a tar header for the given item, hardlinks are not detected so each member can be extracted alone."""
+    stat_result = os.lstat(os.path.join(src_path, *record.path.split("/")))
+    tarinfo = tarfile.TarInfo(record.path)
+    tarinfo.mode = stat_result.st_mode & 0o7777
+    tarinfo.mtime = stat_result.st_mtime
+    tarinfo.uid = stat_result.st_uid
+    tarinfo.gid = stat_result.st_gid
+    if record.type == ManifestRecord.DIRECTORY:
+        tarinfo.type = tarfile.DIRTYPE
+    elif record.type == ManifestRecord.SYMLINK:
+        tarinfo.type = tarfile.SYMTYPE
+        tarinfo.linkname = record.target  # type: ignore
+    else:
+        tarinfo.size = stat_result.st_size
+
+    return tarinfo
+
+
+def write_archive(
+    src_path: str,
+    f: BinaryIO,
+    *,
+    compression: str,
+    level: int = 3,
+    threads: int = 1,
+    exclude: Collection[str] = (),
+    members: Optional[Collection[str]] = None,
+) -> None:
+    """Stream the given directory as a compressed archive into the given file object.
+
+    If members are given, only the stated items are archived.
+    """
+    manifest = Manifest.from_directory(src_path, digests=False, exclude=exclude)
+    with _open_compressed(
+        f, compression, write=True, level=level, threads=threads
+    ) as stream, tarfile.open(
+        fileobj=stream, mode="w|", format=tarfile.PAX_FORMAT
+    ) as tar:
+        for record in manifest.records.values():
+            if members is not None and record.path not in members:
+                continue
+
+            tarinfo = _create_tarinfo(src_path, record)
+            if record.type == ManifestRecord.FILE:
+                with open(
+                    os.path.join(src_path, *record.path.split("/")), "rb"
+                ) as src_f:
+                    tar.addfile(tarinfo, src_f)
+            else:
+                tar.addfile(tarinfo)
+
+
+def create_archive(
+    src_path: str,
+    archive_path: str,
+    *,
+    compression: str,
+    level: int = 3,
+    threads: int = 1,
+    exclude: Collection[str] = (),
+    members: Optional[Collection[str]] = None,
+) -> None:
+    """Stream the given directory into a compressed archive, the archive is written atomically.
+
+    If members are given, only the stated items are archived.
+    """
+    tmp_path = f"{archive_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            write_archive(
+                src_path,
+                f,
+                compression=compression,
+                level=level,
+                threads=threads,
+                exclude=exclude,
+                members=members,
+            )
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+    os.replace(tmp_path, archive_path)
+    _LOGGER.debug(
+        "Created archive %r of size %d bytes",
+        archive_path,
+        os.path.getsize(archive_path),
+    )
+
+
+def read_archive(
+    f: BinaryIO,
+    dst_path: str,
+    *,
+    compression: str,
+    members: Optional[Collection[str]] = None,
+) -> None:
+    """Stream-decompress an archive read from the given file object directly into the destination directory.
+
+    If members are given, only the stated archive members are extracted.
+    """
+    os.makedirs(dst_path, exist_ok=members is not None)
+    # Virtual environments contain symlinks to absolute paths, these are refused by the "data" filter.
+    kwargs = {"filter": "tar"} if hasattr(tarfile, "tar_filter") else {}
+    with _open_compressed(
+        f, compression, write=False, level=0, threads=1
+    ) as stream, tarfile.open(fileobj=stream, mode="r|") as tar:
+        if members is None:
+            tar.extractall(dst_path, **kwargs)  # type: ignore
+            return
+
+        for tarinfo in tar:
+            if tarinfo.name in members:
+                tar.extract(tarinfo, dst_path, **kwargs)  # type: ignore
+
+
+def hash_archive_files(
+    archive_path: str, *, compression: str, members: Collection[str]
+) -> Dict[str, Tuple[int, Optional[str]]]:
+    """Stream-decompress the given archive and compute digests of the stated file members.
+
+    Return sizes of all the regular files in the archive together with their digests, if computed.
+    """
+    result: Dict[str, Tuple[int, Optional[str]]] = {}
+    with open(archive_path, "rb") as f, _open_compressed(
+        f, compression, write=False, level=0, threads=1
+    ) as stream, tarfile.open(fileobj=stream, mode="r|") as tar:
+        for tarinfo in tar:
+            if not tarinfo.isreg():
+                continue
+
+            digest = None
+            if tarinfo.name in members:
+                digest = hash_stream(tar.extractfile(tarinfo))  # type: ignore
+
+            result[tarinfo.name] = (tarinfo.size, digest)
+
+    return result
+
+
+def extract_archive(
+    archive_path: str,
+    dst_path: str,
+    *,
+    compression: str,
+    members: Optional[Collection[str]] = None,
+) -> None:
+    """Stream-decompress the given archive directly into the destination directory.
+
+    If members are given, only the stated archive members are extracted.
+    """
+    with open(archive_path, "rb") as f:
+        read_archive(f, dst_path, compression=compression, members=members)
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+import subprocess
+from typing import Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+BYTECODE_COMPILATIONS = ("none", "parallel")
+
+
+def _find_interpreter(virtualenv_path: str) -> Optional[str]:
+    """Find the Python interpreter of the given virtual environment."""
+    for path in (
+        os.path.join(virtualenv_path, "bin", "python"),
+        os.path.join(virtualenv_path, "Scripts", "python.exe"),
+    ):
+        if os.path.exists(path):
+            return path
+
+    return None
+
+
+def compile_bytecode(virtualenv_path: str, *, workers: int = 1) -> bool:
+    """Byte-compile modules of the given virtual environment using a pool of worker processes.
+
+    Modules are compiled by the interpreter of the virtual environment, so that bytecode matches its Python version.
+    Return False if there is no interpreter or some modules could not be compiled (e.g. tests in Python 2 syntax).
+    """
+    interpreter = _find_interpreter(virtualenv_path)
+    lib_path = next(
+        (
+            os.path.join(virtualenv_path, name)
+            for name in ("lib", "Lib")
+            if os.path.isdir(os.path.join(virtualenv_path, name))
+        ),
+        None,
+    )
+    if interpreter is None or lib_path is None:
+        _LOGGER.warning(
+            "No Python interpreter or modules found in %r, skipping bytecode compilation",
+            virtualenv_path,
+        )
+        return False
+
+    result = subprocess.run(
+        [interpreter, "-m", "compileall", "-q", "-j", str(workers), lib_path],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    )
+    if result.returncode != 0:
+        _LOGGER.warning(
+            "Some modules in %r could not be byte-compiled", virtualenv_path
+        )
+        _LOGGER.debug(
+            "Output of bytecode compilation: %s",
+            result.stdout.decode(errors="replace").strip(),
+        )
+        return False
+
+    return True
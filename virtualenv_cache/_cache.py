@@ -1,22 +1,72 @@
 #!/usr/bin/env python3
 
 import datetime
+import glob
 import hashlib
 import json
 import logging
 import os
 import shutil
 import socket
+import sqlite3
+import tempfile
+import uuid
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 from typing import Dict
+from typing import FrozenSet
+from typing import Iterable
 from typing import List
+from typing import NoReturn
+from typing import Optional
+from typing import Set
+from typing import Tuple
 
 import attr
-from dateutil.parser import parse as parse_datetime
 
+from ._archive import create_archive
+from ._archive import extract_archive
+from ._archive import find_archive
+from ._archive import get_archive_name
+from ._archive import hash_archive_files
+from ._bytecode import compile_bytecode
 from ._config import Config
-from ._exceptions import VirtualenvCacheMiss
+from ._copy import copy_file
+from ._copy import copy_tree
+from ._copy import get_store_strategy
+from ._eviction import gdsf_priority
+from ._eviction import select_victims
 from ._exceptions import VirtualenvCacheConfigError
+from ._exceptions import VirtualenvCacheException
+from ._exceptions import VirtualenvCacheMiss
+from ._exceptions import VirtualenvCachePartialHit
+from ._exceptions import VirtualenvCacheStorageError
+from ._index import CacheIndex
+from ._locks import FileLock
+from ._lockfiles import LockFileHasher
+from ._lockfiles import load_packages
+from ._manifest import Manifest
+from ._manifest import ManifestDiff
+from ._manifest import ManifestRecord
+from ._manifest import hash_file
+from ._metrics import Metrics
+from ._objects import ObjectStore
+from ._prune import PruneFilter
+from ._relocate import find_path_dependent
+from ._relocate import relocate
+from ._storage import StorageBackend
+from ._storage import get_storage_backend
+from ._trash import get_erased_pattern
+from ._trash import move_erased
+from ._trash import move_to_trash
+from ._trash import purge
+from ._trash import remove_tree
+from ._trash import spawn_purge
+from ._verify import sample_files
+from ._verify import verify_archive_files
+from ._verify import verify_files
+from .utils import parallel_map
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -26,43 +76,224 @@ class Cache:
     """A cache for Python virtual environments."""
 
     _CACHE_ENTRY_USAGE_FILE = "virtualenv-cache-usage.json"
+    _CACHE_ENTRY_MANIFEST_FILE = "virtualenv-cache-manifest.json"
+    _CACHE_ENTRY_PACKAGES_FILE = "virtualenv-cache-packages.json"
+    _CACHE_ENTRY_LAYER_FILE = "virtualenv-cache-layer.json"
+    _CACHE_ENTRY_DIRTY_FILE = "virtualenv-cache-dirty"
+    _VIRTUALENV_MANIFEST_FILE = ".virtualenv-cache-manifest.json"
+    _OBJECTS_DIR = ".objects"
+    _INDEX_FILE = ".index.sqlite3"
+    _LOCK_FILE_MEMO_FILE = ".lock-file-digests.json"
+    _TRASH_DIR = ".trash"
+    _STAGING_DIR = ".staging"
+    _QUARANTINE_DIR = ".quarantine"
+    _LOCKS_DIR = ".locks"
+    _OBJECTS_LOCK = "objects"
 
     config = attr.ib(type=Config, kw_only=True)
+    lock_file_hasher = attr.ib(
+        type=Optional[LockFileHasher], default=None, kw_only=True
+    )
+    storage_backend = attr.ib(type=Optional[StorageBackend], default=None, kw_only=True)
+    metrics = attr.ib(type=Metrics, factory=Metrics, kw_only=True)
+    # The path stated in scripts of the virtual environment if it differs from its location, e.g. for a snapshot.
+    virtualenv_prefix = attr.ib(type=Optional[str], default=None, kw_only=True)
+    _uploads = attr.ib(type=List["Future[None]"], factory=list, init=False)
+    _uploader = attr.ib(type=Optional[ThreadPoolExecutor], default=None, init=False)
+
+    def _get_storage_backend(self) -> Optional[StorageBackend]:
+        """Get the backend storing cache entries, None if the cache is kept in a local directory."""
+        if self.storage_backend is None:
+            self.storage_backend = get_storage_backend(
+                self.config.expanded_cache_path, self.config
+            )
+
+        return self.storage_backend
+
+    def _get_shared_cache(
+        self, virtualenv_path: str, *, virtualenv_prefix: Optional[str] = None
+    ) -> Optional["Cache"]:
+        """Get the shared cache tier placing virtual environments to the given path, if configured.
+
+        The virtual environment prefix is to be stated if the given path holds a copy of the virtual environment.
+        """
+        if not self.config.shared_cache_path:
+            return None
+
+        cache_path = os.path.expandvars(self.config.shared_cache_path)
+        if get_storage_backend(cache_path, self.config) is None:
+            cache_path = os.path.abspath(cache_path)
+
+        return Cache(
+            config=attr.evolve(
+                self.config,
+                cache_path=cache_path,
+                cache_size=self.config.shared_cache_size,
+                cache_max_bytes=self.config.shared_cache_max_bytes,
+                eviction_policy=self.config.shared_eviction_policy,
+                virtualenv_path=virtualenv_path,
+                shared_cache_path="",
+            ),
+            metrics=self.metrics,
+            virtualenv_prefix=virtualenv_prefix,
+        )
+
+    def _get_lock_file_hasher(self) -> LockFileHasher:
+        """Get the object computing digests of lock files, digests are memoized in the cache root."""
+        if self.lock_file_hasher is None:
+            self.lock_file_hasher = LockFileHasher(
+                # Digests are not memoized for caches kept in a storage backend.
+                memo_path=(
+                    os.path.join(
+                        self.config.expanded_cache_path, self._LOCK_FILE_MEMO_FILE
+                    )
+                    if self._get_storage_backend() is None
+                    else None
+                ),
+                workers=self.config.copy_workers,
+                semantic=self.config.lock_file_hashing == "semantic",
+            )
+
+        return self.lock_file_hasher
 
     def _hash_all_lock_files(self) -> str:
         """Retrieve a hash of all the lock files."""
-        file_hashes = {}
         if not self.config.requirements_lock_paths:
             _LOGGER.warning(
                 "No requirements lock files defined in the configuration file"
             )
 
-        for item in self.config.requirements_lock_paths:
-            _LOGGER.debug("Computing hash for requirements lock file %r", item)
-            try:
-                with open(item, "rb") as f:
-                    sha256_hash = hashlib.sha256(f.read()).hexdigest()
-            except FileNotFoundError as exc:
-                raise VirtualenvCacheConfigError(
-                    f"File {item!r} stated in the configuration file not found"
-                ) from exc
-
-            file_hashes[item] = sha256_hash
+        return self._hash_lock_files(self.config.requirements_lock_paths)
 
+    def _hash_lock_files(self, lock_paths: List[str]) -> str:
+        """Retrieve a hash of the given lock files."""
+        with self.metrics.phase("hash_lock_files"):
+            file_hashes = self._get_lock_file_hasher().hash_files(lock_paths)
         return hashlib.sha256(
             json.dumps(file_hashes, sort_keys=True).encode()
         ).hexdigest()
 
-    def _mark_cache_entry_usage(self, cached_entry_path: str) -> None:
+    def _load_packages(self, lock_paths: Optional[List[str]] = None) -> Dict[str, str]:
+        """Load packages resolved in the given lock files (all by default), lock files in an unknown format are skipped."""
+        packages = {}
+        for path in self._get_lock_file_hasher().expand(
+            self.config.requirements_lock_paths if lock_paths is None else lock_paths
+        ):
+            try:
+                lock_file_packages = load_packages(path)
+            except (ValueError, KeyError, TypeError) as exc:
+                _LOGGER.warning(
+                    "Cannot parse packages from lock file %r: %s", path, exc
+                )
+                continue
+
+            if lock_file_packages is None:
+                _LOGGER.debug(
+                    "Unknown format of lock file %r, packages not loaded", path
+                )
+                continue
+
+            packages.update(lock_file_packages)
+
+        return packages
+
+    def _record_entry_packages(
+        self, cached_entry_path: str, packages: Dict[str, str]
+    ) -> None:
+        """Record packages resolved in the lock files to the given cache entry."""
+        self._dump_json(
+            os.path.join(cached_entry_path, self._CACHE_ENTRY_PACKAGES_FILE), packages
+        )
+
+    @staticmethod
+    def _dump_json(path: str, content: Any) -> None:
+        """Atomically write the given content to a JSON file, readers never see a partially written file."""
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(content, f, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    def _get_entry_lock(self, entry_id: str, *, store: bool = False) -> FileLock:
+        """Get the lock guarding data of the given cache entry, or the lock held by the process storing it."""
+        return FileLock(
+            os.path.join(
+                self.config.expanded_cache_path,
+                self._LOCKS_DIR,
+                f"{entry_id}.store" if store else entry_id,
+            )
+        )
+
+    def _get_index(self) -> CacheIndex:
+        """Get the index of cache entries, the index is rebuilt if it does not exist or it is corrupted."""
+        index = CacheIndex(
+            os.path.join(self.config.expanded_cache_path, self._INDEX_FILE)
+        )
+        try:
+            if index.exists():
+                index.check()
+                return index
+        except sqlite3.DatabaseError as exc:
+            _LOGGER.warning("Dropping corrupted cache index %r: %s", index.path, exc)
+            index.drop()
+
+        self._rebuild_index(index)
+        return index
+
+    def _scan_entries(self) -> List[Dict[str, Any]]:
+        """Scan entries stored in the cache directory to obtain records about them."""
+        records = []
+        for entry in os.listdir(self.config.expanded_cache_path):
+            if entry.startswith("."):
+                # Internal data shared across entries.
+                continue
+
+            entry_path = os.path.join(self.config.expanded_cache_path, entry)
+            if not os.path.isdir(entry_path):
+                continue
+
+            record = self._get_cache_entry_usage(entry_path)
+            record["id"] = entry
+            record["timestamp"] = datetime.datetime.fromisoformat(
+                record["datetime"]
+            ).timestamp()
+            # Trees without manifest are not walked, the size is computed only if needed on trim.
+            record["size"] = (
+                self._get_entry_size(entry_path)
+                if self._get_entry_format(entry_path) in ("archive", "objects")
+                or self._load_entry_manifest(entry_path) is not None
+                else None
+            )
+            record["hits"] = 0
+            records.append(record)
+
+        return records
+
+    def _rebuild_index(self, index: CacheIndex) -> None:
+        """Rebuild the index of cache entries based on entries stored in the cache."""
+        _LOGGER.info("Building cache index %r", index.path)
+        index.rebuild(self._scan_entries())
+
+    def _mark_cache_entry_usage(
+        self, cached_entry_path: str, *, hit: bool = False, size: Optional[int] = None
+    ) -> None:
         """Mark usage of the given cached virtual environment."""
+        now = datetime.datetime.now(tz=datetime.timezone.utc)
         content = {
             "hostname": socket.gethostname(),
-            "datetime": datetime.datetime.now(tz=datetime.timezone.utc).isoformat(),
+            "datetime": now.isoformat(),
         }
-        with open(
-            os.path.join(cached_entry_path, self._CACHE_ENTRY_USAGE_FILE), "w"
-        ) as f:
-            json.dump(content, f)
+        self._dump_json(
+            os.path.join(cached_entry_path, self._CACHE_ENTRY_USAGE_FILE), content
+        )
+
+        self._get_index().touch(
+            os.path.basename(cached_entry_path),
+            datetime=content["datetime"],
+            timestamp=now.timestamp(),
+            hostname=content["hostname"],
+            hit=hit,
+            size=size,
+        )
 
     def _get_cache_entry_usage(self, cached_entry_path: str) -> Dict[str, Any]:
         """Get usage of the given file."""
@@ -74,23 +305,82 @@ class Cache:
 
     def _list_entries(self) -> List[Dict[str, Any]]:
         """List entries stored in the cache, sorted by usage."""
-        result = []
-        for entry in os.listdir(self.config.expanded_cache_path):
-            entry_path = os.path.join(self.config.expanded_cache_path, entry)
-            if not os.path.isdir(entry_path):
-                continue
+        backend = self._get_storage_backend()
+        if backend is not None:
+            return backend.list()
 
-            record = self._get_cache_entry_usage(entry_path)
-            record["id"] = entry
-            result.append(record)
+        index = CacheIndex(
+            os.path.join(self.config.expanded_cache_path, self._INDEX_FILE)
+        )
+        try:
+            if index.exists():
+                return index.list()
+        except sqlite3.DatabaseError as exc:
+            _LOGGER.warning("Cannot use cache index %r: %s", index.path, exc)
 
-        result.sort(key=lambda x: parse_datetime(x["datetime"]), reverse=True)
+        # Listing does not modify the cache, the index gets built on the next restore or store.
+        result = self._scan_entries()
+        result.sort(key=lambda x: x.pop("timestamp"), reverse=True)
         return result
 
-    def _trim_cache(self) -> None:
-        """Remove entries from the cache respecting the cache size configuration."""
-        entries = self._list_entries()
-        if self.config.cache_size >= len(entries):
+    def _get_entry_size(self, cached_entry_path: str) -> int:
+        """Get number of bytes the virtual environment stored in the cache entry occupies."""
+        compression = find_archive(cached_entry_path)
+        if compression is not None:
+            return os.path.getsize(
+                os.path.join(cached_entry_path, get_archive_name(compression))
+            )
+
+        manifest = self._load_entry_manifest(cached_entry_path)
+        if manifest is not None and self._load_entry_layer(cached_entry_path) is None:
+            return sum(r.size for r in manifest.files())
+
+        return sum(
+            os.lstat(os.path.join(root, file_name)).st_size
+            for root, _, file_names in os.walk(cached_entry_path)
+            for file_name in file_names
+        )
+
+    def _trim_cache(self, keep: Optional[str] = None) -> None:
+        """Remove entries from the cache respecting the cache size configuration.
+
+        The entry stated in keep (e.g. an entry just stored) is never removed.
+        """
+        with self.metrics.operation("trim"):
+            self._remove_victims(keep)
+            if self._get_storage_backend() is None:
+                self._remove_stale_staging()
+                self._purge_trash()
+
+    def _remove_victims(self, keep: Optional[str]) -> None:
+        """Select entries to be removed by the eviction policy and remove them."""
+        with self.metrics.phase("list_entries"):
+            entries = self._list_entries()
+        backend = self._get_storage_backend()
+        if self.config.cache_max_bytes and backend is None:
+            for entry in entries:
+                if entry["size"] is None:
+                    # Sizes of entries created by older versions are computed once and kept in the index.
+                    entry["size"] = self._get_entry_size(
+                        os.path.join(self.config.expanded_cache_path, entry["id"])
+                    )
+                    self._get_index().set_size(entry["id"], entry["size"])
+
+        gdsf = self.config.eviction_policy == "gdsf" and backend is None
+        if gdsf:
+            inflations = self._get_index().get_inflations()
+            for entry in entries:
+                entry["inflation"] = inflations.get(entry["id"], 0.0)
+
+        with self.metrics.phase("select_victims"):
+            victims = select_victims(
+                entries,
+                policy=self.config.eviction_policy,
+                max_entries=self.config.cache_size,
+                max_bytes=self.config.cache_max_bytes,
+                keep=keep,
+            )
+        if not victims:
             _LOGGER.debug(
                 "Nothing to be removed from the cache, cache size %d out of %d",
                 len(entries),
@@ -98,59 +388,1485 @@ class Cache:
             )
             return
 
-        for to_drop in entries[self.config.cache_size :]:
+        index = self._get_index() if backend is None else None
+        bases = (
+            self._get_referenced_bases(entries, victims) if backend is None else set()
+        )
+        removed = []
+        for to_drop in victims:
+            if to_drop["id"] in bases:
+                _LOGGER.info(
+                    "Keeping cached entry %r, it is a base layer of other entries",
+                    to_drop["id"],
+                )
+                continue
+
             _LOGGER.info(
-                "Removing cached entry to match expected cache size %d: %r",
+                "Removing cached entry to match expected cache size %d (%d bytes) using %s eviction policy: %r",
                 self.config.cache_size,
+                self.config.cache_max_bytes,
+                self.config.eviction_policy,
                 to_drop["id"],
             )
-            shutil.rmtree(os.path.join(self.config.expanded_cache_path, to_drop["id"]))
+            with self.metrics.phase("remove_entries"):
+                if backend is not None:
+                    backend.delete(to_drop["id"])
+                elif not self._remove_entry(to_drop["id"], index):  # type: ignore
+                    continue
+            self.metrics.add_io(size=to_drop["size"] or 0)
+            removed.append(to_drop)
+
+        if gdsf and removed:
+            index.inflate(max(gdsf_priority(entry) for entry in removed))  # type: ignore
+
+        with self.metrics.phase("collect_garbage"):
+            if backend is None:
+                self._collect_garbage()
+            else:
+                removed = backend.collect_garbage()
+                _LOGGER.info(
+                    "Removed %d objects no longer used by any cache entry", removed
+                )
+
+    def _get_referenced_bases(
+        self, entries: List[Dict[str, Any]], victims: List[Dict[str, Any]]
+    ) -> Set[str]:
+        """Get base layers of entries that are not going to be removed."""
+        victim_ids = {v["id"] for v in victims}
+        bases = set()
+        for entry in entries:
+            if entry["id"] in victim_ids:
+                continue
+
+            layer = self._load_entry_layer(
+                os.path.join(self.config.expanded_cache_path, entry["id"])
+            )
+            if layer is not None:
+                bases.add(layer["base"])
+
+        return bases
+
+    def _remove_entry(
+        self, entry_id: str, index: CacheIndex, *, quarantine: bool = False
+    ) -> bool:
+        """Remove the given entry from the local cache, return False if it is being stored or restored.
+
+        If quarantine is set, the entry is moved to quarantine instead of being deleted.
+        """
+        store_lock = self._get_entry_lock(entry_id, store=True)
+        if not store_lock.acquire(blocking=False):
+            _LOGGER.info("Cache entry %r is being stored, not removing it", entry_id)
+            return False
+
+        lock = self._get_entry_lock(entry_id)
+        if not lock.acquire(blocking=False):
+            store_lock.release()
+            _LOGGER.info("Cache entry %r is being restored, not removing it", entry_id)
+            return False
+
+        try:
+            cached_entry_path = os.path.join(self.config.expanded_cache_path, entry_id)
+            if quarantine:
+                self._quarantine(cached_entry_path)
+            else:
+                self._discard(cached_entry_path)
+            index.remove(entry_id)
+        finally:
+            lock.remove()
+            store_lock.remove()
+        return True
+
+    def _remove_stale_staging(self) -> None:
+        """Remove entries left in the staging directory by stores that did not finish, e.g. killed processes."""
+        staging_path = os.path.join(self.config.expanded_cache_path, self._STAGING_DIR)
+        if not os.path.isdir(staging_path):
+            return
+
+        for item in os.listdir(staging_path):
+            store_lock = self._get_entry_lock(item.split("-", 1)[0], store=True)
+            if not store_lock.acquire(blocking=False):
+                # Still being stored.
+                continue
+
+            try:
+                _LOGGER.debug("Removing stale staged entry %r", item)
+                self._discard(os.path.join(staging_path, item))
+            finally:
+                store_lock.release()
+
+    def _discard(self, path: str) -> None:
+        """Remove the given directory tree in the cache, it is only moved to trash if purged in background."""
+        trash_path = os.path.join(self.config.expanded_cache_path, self._TRASH_DIR)
+        if self.config.purge_mode == "background" and move_to_trash(path, trash_path):
+            return
+
+        remove_tree(path, workers=self.config.copy_workers)
+
+    def _quarantine(self, path: str) -> None:
+        """Move the given item of the cache to quarantine, where it is kept for inspection until the cache is erased."""
+        quarantine_path = os.path.join(
+            self.config.expanded_cache_path, self._QUARANTINE_DIR
+        )
+        os.makedirs(quarantine_path, exist_ok=True)
+        os.rename(
+            path,
+            os.path.join(
+                quarantine_path, f"{os.path.basename(path)}-{uuid.uuid4().hex}"
+            ),
+        )
+
+    def _purge_trash(self) -> None:
+        """Delete cache entries moved to trash and caches erased before, but not deleted yet."""
+        trash_path = os.path.join(self.config.expanded_cache_path, self._TRASH_DIR)
+        erased = glob.glob(get_erased_pattern(self.config.expanded_cache_path))
+        with self.metrics.phase("purge"):
+            if self.config.purge_mode == "inline":
+                purge(trash_path, workers=self.config.copy_workers)
+                for path in erased:
+                    remove_tree(path, workers=self.config.copy_workers)
+                return
+
+            if os.path.isdir(trash_path) and any(
+                not item.startswith(".") for item in os.listdir(trash_path)
+            ):
+                spawn_purge([trash_path], workers=self.config.copy_workers)
+            if erased:
+                spawn_purge(erased, workers=self.config.copy_workers, trash=False)
+
+    def _get_object_store(self) -> ObjectStore:
+        """Get the content-addressable store shared by cache entries."""
+        return ObjectStore(
+            os.path.join(self.config.expanded_cache_path, self._OBJECTS_DIR)
+        )
+
+    def _collect_garbage(self) -> None:
+        """Remove objects that are not referenced by any cache entry.
+
+        Garbage is not collected while objects are being stored, they are not referenced by any entry yet.
+        """
+        object_store = self._get_object_store()
+        if not os.path.isdir(object_store.path):
+            return
+
+        lock = self._get_entry_lock(self._OBJECTS_LOCK)
+        if not lock.acquire(blocking=False):
+            _LOGGER.debug("Objects are being stored, not collecting garbage")
+            return
+
+        try:
+            self._collect_unreferenced(object_store)
+        finally:
+            lock.release()
+
+    def _collect_unreferenced(self, object_store: ObjectStore) -> None:
+        """Remove objects that are not referenced by any cache entry from the given object store."""
+        referenced = set()
+        for entry in self._list_entries():
+            cached_entry_path = os.path.join(
+                self.config.expanded_cache_path, entry["id"]
+            )
+            if self._get_entry_format(cached_entry_path) != "objects":
+                continue
+
+            manifest = self._load_entry_manifest(cached_entry_path)
+            for record in manifest.files():  # type: ignore
+                referenced.add(object_store.object_name(record.digest, record.mode))
+
+        removed = object_store.collect_garbage(referenced)
+        _LOGGER.info("Removed %d objects no longer used by any cache entry", removed)
+
+    def _get_entry_format(self, cached_entry_path: str) -> Optional[str]:
+        """Detect format of the virtual environment stored in the given cache entry, if any stored.
+
+        An entry left partially changed by an interrupted store holds nothing.
+        """
+        if os.path.exists(
+            os.path.join(cached_entry_path, self._CACHE_ENTRY_DIRTY_FILE)
+        ):
+            return None
+
+        if os.path.isdir(os.path.join(cached_entry_path, "venv")):
+            return "tree"
+
+        if find_archive(cached_entry_path) is not None:
+            return "archive"
+
+        if os.path.isfile(
+            os.path.join(cached_entry_path, self._CACHE_ENTRY_MANIFEST_FILE)
+        ):
+            return "objects"
+
+        return None
+
+    def _load_entry_manifest(self, cached_entry_path: str) -> Optional[Manifest]:
+        """Load manifest of the given cache entry, if present."""
+        manifest_path = os.path.join(cached_entry_path, self._CACHE_ENTRY_MANIFEST_FILE)
+        if not os.path.isfile(manifest_path):
+            return None
+
+        return Manifest.load(manifest_path)
+
+    def _get_entry_manifest_digest(self, cached_entry_path: str) -> Optional[str]:
+        """Get digest of the manifest of the given cache entry, None if not present."""
+        try:
+            return hash_file(
+                os.path.join(cached_entry_path, self._CACHE_ENTRY_MANIFEST_FILE)
+            )
+        except FileNotFoundError:
+            return None
+
+    def _load_entry_layer(self, cached_entry_path: str) -> Optional[Dict[str, str]]:
+        """Load the base layer the given cache entry is stored on top of, None if it holds a whole virtual environment."""
+        layer_path = os.path.join(cached_entry_path, self._CACHE_ENTRY_LAYER_FILE)
+        if not os.path.isfile(layer_path):
+            return None
+
+        with open(layer_path) as f:
+            return json.load(f)  # type: ignore
+
+    def _get_base_layer(
+        self, entry_id: str
+    ) -> Optional[Tuple[Manifest, Dict[str, str]]]:
+        """Get manifest of the base layer the given entry is to be stored on top of and description of the layer."""
+        if not self.config.base_lock_paths or self.config.entry_format == "objects":
+            # Objects are stored once regardless of layers.
+            return None
+
+        base_id = self._hash_lock_files(self.config.base_lock_paths)
+        if base_id == entry_id:
+            return None
+
+        base_path = os.path.join(self.config.expanded_cache_path, base_id)
+        manifest_path = os.path.join(base_path, self._CACHE_ENTRY_MANIFEST_FILE)
+        lock = self._lock_entry_shared(base_id)
+        try:
+            if (
+                self._get_entry_format(base_path) != self.config.entry_format
+                or self._load_entry_layer(base_path) is not None
+                or not os.path.isfile(manifest_path)
+            ):
+                _LOGGER.info(
+                    "No base layer %r stored, storing the whole virtual environment",
+                    base_id,
+                )
+                return None
+
+            layer = {"base": base_id, "base_manifest_digest": hash_file(manifest_path)}
+            return Manifest.load(manifest_path), layer
+        finally:
+            lock.release()
+
+    def _scan_virtualenv(self) -> Tuple[Manifest, FrozenSet[str]]:
+        """Scan the virtual environment leaving out items not stored in the cache, see `prune_exclude'.
+
+        Return also paths of items to be excluded when copying the virtual environment.
+        """
+        manifest = Manifest.from_directory(
+            self.config.expanded_virtualenv_path,
+            digests=False,
+            exclude=(self._VIRTUALENV_MANIFEST_FILE,),
+        )
+        pruned = PruneFilter(
+            exclude=self.config.prune_exclude, include=self.config.prune_include
+        ).prune(manifest)
+        return manifest, frozenset((self._VIRTUALENV_MANIFEST_FILE, *pruned))
+
+    def _load_virtualenv_manifest(self) -> Optional[Manifest]:
+        """Load manifest describing the virtual environment as it was restored or stored last time."""
+        manifest_path = os.path.join(
+            self.config.expanded_virtualenv_path, self._VIRTUALENV_MANIFEST_FILE
+        )
+        try:
+            return Manifest.load(manifest_path)
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError) as exc:
+            _LOGGER.warning("Ignoring invalid manifest %r: %s", manifest_path, exc)
+            return None
+
+    def _record_virtualenv_manifest(
+        self,
+        entry_id: str,
+        entry_manifest: Optional[Manifest],
+        *,
+        entry_manifest_digest: Optional[str] = None,
+    ) -> Manifest:
+        """Record state of the virtual environment matching the given cache entry for incremental stores.
+
+        The digest of the entry manifest identifies the state of the cache entry, so that changes are not stored
+        incrementally on top of an entry stored again by another process meanwhile.
+        """
+        manifest, _ = self._scan_virtualenv()
+        manifest.entry_id = entry_id
+        manifest.entry_manifest_digest = entry_manifest_digest
+        manifest.prefix = self._get_virtualenv_prefix()
+        if entry_manifest is not None:
+            # Content of restored files matches the cache entry, digests do not need to be recomputed.
+            relocated = (
+                set(entry_manifest.relocatable)
+                if entry_manifest.prefix != manifest.prefix
+                else set()
+            )
+            for record in manifest.files():
+                entry_record = entry_manifest.records.get(record.path)
+                if (
+                    entry_record is not None
+                    and entry_record.size == record.size
+                    and record.path not in relocated
+                ):
+                    record.digest = entry_record.digest
+
+        manifest.dump(
+            os.path.join(
+                self.config.expanded_virtualenv_path, self._VIRTUALENV_MANIFEST_FILE
+            )
+        )
+        return manifest
+
+    def _get_virtualenv_prefix(self) -> str:
+        """Get the absolute path to the virtual environment as stated in its scripts and configuration."""
+        if self.virtualenv_prefix is not None:
+            return self.virtualenv_prefix
+
+        return os.path.abspath(self.config.expanded_virtualenv_path)
+
+    def _relocate_virtualenv(
+        self, entry_manifest: Optional[Manifest], paths: Optional[Set[str]] = None
+    ) -> None:
+        """Rewrite path to the virtual environment restored from the given entry, if it was stored from another path.
+
+        If paths are given, only the stated items are considered.
+        """
+        prefix = self._get_virtualenv_prefix()
+        if (
+            self.config.relocation == "none"
+            or entry_manifest is None
+            or entry_manifest.prefix in (None, prefix)
+            or not entry_manifest.relocatable
+        ):
+            return
+
+        with self.metrics.phase("relocate"):
+            relocated = relocate(
+                self.config.expanded_virtualenv_path,
+                [p for p in entry_manifest.relocatable if paths is None or p in paths],
+                entry_manifest.prefix,  # type: ignore
+                prefix,
+            )
+        _LOGGER.info(
+            "Relocated %d files of the virtual environment stored from %r",
+            relocated,
+            entry_manifest.prefix,
+        )
+
+    def _materialize(
+        self,
+        cached_entry_path: str,
+        entry_format: str,
+        records: Iterable[ManifestRecord],
+    ) -> None:
+        """Create the given items stored in the cache entry in the virtual environment."""
+        virtualenv_path = self.config.expanded_virtualenv_path
+        object_store = self._get_object_store()
+
+        def _restore_object(record: ManifestRecord) -> None:
+            target_path = os.path.join(virtualenv_path, *record.path.split("/"))
+            strategy = copy_file(
+                object_store.object_path(record.digest, record.mode),
+                target_path,
+                strategy=self.config.copy_strategy,
+            )
+            if strategy != "hardlink":
+                os.chmod(target_path, record.mode)
+                os.utime(target_path, ns=(record.mtime_ns, record.mtime_ns))
+
+        def _restore_file(record: ManifestRecord) -> None:
+            rel_path = record.path.split("/")
+            copy_file(
+                os.path.join(cached_entry_path, "venv", *rel_path),
+                os.path.join(virtualenv_path, *rel_path),
+                strategy=self.config.copy_strategy,
+            )
+
+        files = []
+        directories = []
+        for record in records:
+            target_path = os.path.join(virtualenv_path, *record.path.split("/"))
+            if record.type == ManifestRecord.DIRECTORY:
+                os.makedirs(target_path, exist_ok=True)
+                directories.append((target_path, record.mode))
+            elif record.type == ManifestRecord.SYMLINK:
+                os.symlink(record.target, target_path)
+            else:
+                files.append(record)
+
+        if entry_format == "archive":
+            compression = find_archive(cached_entry_path)
+            extract_archive(
+                os.path.join(cached_entry_path, get_archive_name(compression)),
+                virtualenv_path,
+                compression=compression,
+                members={r.path for r in files},
+            )
+        elif entry_format == "objects":
+            parallel_map(_restore_object, files, self.config.copy_workers)
+        else:
+            parallel_map(_restore_file, files, self.config.copy_workers)
+
+        # Adjust permissions once directories are populated, they can be read-only.
+        for directory_path, mode in reversed(directories):
+            os.chmod(directory_path, mode)
+
+    @staticmethod
+    def _remove_changed_items(
+        root: str, manifest: Manifest, changes: ManifestDiff
+    ) -> None:
+        """Remove items that were removed or modified in the directory tree to match the given manifest.
+
+        Modified items are removed so that they can be created again, as the type of the item could change.
+        Directories that stay directories are kept with their content.
+        """
+        for path in sorted(changes.removed + changes.modified, reverse=True):
+            item_path = os.path.join(root, *path.split("/"))
+            record = manifest.records.get(path)
+            if os.path.isdir(item_path) and not os.path.islink(item_path):
+                if record is not None and record.type == ManifestRecord.DIRECTORY:
+                    continue
+                shutil.rmtree(item_path)
+            elif os.path.lexists(item_path):
+                os.unlink(item_path)
+
+    def _sync_virtualenv(
+        self, cached_entry_path: str, entry_format: str, entry_manifest: Manifest
+    ) -> None:
+        """Synchronize an already existing virtual environment with the cache entry, touching only differing items."""
+        virtualenv_path = self.config.expanded_virtualenv_path
+        with self.metrics.phase("scan"):
+            # Items not stored in the cache (e.g. bytecode) are kept.
+            manifest, _ = self._scan_virtualenv()
+
+        # Reuse digests of files not modified since they were restored or stored last time.
+        virtualenv_manifest = self._load_virtualenv_manifest()
+        if virtualenv_manifest is not None:
+            for record in manifest.files():
+                previous = virtualenv_manifest.records.get(record.path)
+                if previous is not None and previous.is_same(record):
+                    record.digest = previous.digest
+
+        if self.config.sync_check == "digest":
+            with self.metrics.phase("compute_digests"):
+                hashed = manifest.compute_digests(
+                    virtualenv_path, workers=self.config.copy_workers
+                )
+            _LOGGER.debug("Computed digests of %d files", hashed)
+
+        changes = manifest.diff(entry_manifest)
+        with self.metrics.phase("remove_changed"):
+            self._remove_changed_items(virtualenv_path, entry_manifest, changes)
+
+        records = [entry_manifest.records[p] for p in changes.added + changes.modified]
+        with self.metrics.phase("copy"):
+            self._materialize(cached_entry_path, entry_format, records)
+        files = [r for r in records if r.type == ManifestRecord.FILE]
+        self.metrics.add_io(files=len(files), size=sum(r.size for r in files))
+        _LOGGER.info(
+            "Synchronized virtual environment: %d added, %d removed, %d modified",
+            len(changes.added),
+            len(changes.removed),
+            len(changes.modified),
+        )
+
+    def _store_objects(
+        self, manifest: Manifest, changes: Optional[ManifestDiff]
+    ) -> None:
+        """Store files of the virtual environment as objects, only changed files are considered if changes given."""
+        virtualenv_path = self.config.expanded_virtualenv_path
+        object_store = self._get_object_store()
+        strategy = get_store_strategy(self.config.copy_strategy)
+
+        records = list(manifest.files())
+        if changes is not None:
+            changed = set(changes.added) | set(changes.modified)
+            records = [r for r in records if r.path in changed]
+
+        added = sum(
+            parallel_map(
+                lambda record: object_store.add(
+                    os.path.join(virtualenv_path, *record.path.split("/")),
+                    record.digest,
+                    record.mode,
+                    strategy=strategy,
+                ),
+                records,
+                self.config.copy_workers,
+            )
+        )
+
+        _LOGGER.debug(
+            "Added %d new objects out of %d files to the cache",
+            added,
+            len(records),
+        )
+
+    def _store_tree_changes(
+        self, cached_entry_path: str, manifest: Manifest, changes: ManifestDiff
+    ) -> None:
+        """Apply changes done in the virtual environment to the cached tree."""
+        virtualenv_path = self.config.expanded_virtualenv_path
+        cached_venv_path = os.path.join(cached_entry_path, "venv")
+
+        self._remove_changed_items(cached_venv_path, manifest, changes)
+
+        files = []
+        directories = []
+        for path in changes.added + changes.modified:
+            record = manifest.records[path]
+            src_path = os.path.join(virtualenv_path, *path.split("/"))
+            dst_path = os.path.join(cached_venv_path, *path.split("/"))
+            # Parent directories are not present in trees holding changes done on top of a base layer.
+            os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+            if record.type == ManifestRecord.DIRECTORY:
+                os.makedirs(dst_path, exist_ok=True)
+                directories.append((src_path, dst_path))
+            elif record.type == ManifestRecord.SYMLINK:
+                os.symlink(record.target, dst_path)
+            else:
+                files.append((src_path, dst_path))
+
+        strategy = get_store_strategy(self.config.copy_strategy)
+        parallel_map(
+            lambda item: copy_file(*item, strategy=strategy),
+            files,
+            self.config.copy_workers,
+        )
+
+        for src_path, dst_path in reversed(directories):
+            shutil.copystat(src_path, dst_path)
+
+        _LOGGER.debug(
+            "Updated cached tree: %d added, %d removed, %d modified",
+            len(changes.added),
+            len(changes.removed),
+            len(changes.modified),
+        )
+
+    def _load_entry_packages(self, entry_id: str) -> Optional[Dict[str, str]]:
+        """Load packages recorded for the given cache entry, if recorded."""
+        backend = self._get_storage_backend()
+        if backend is not None:
+            return backend.get_packages(entry_id)
+
+        packages_path = os.path.join(
+            self.config.expanded_cache_path, entry_id, self._CACHE_ENTRY_PACKAGES_FILE
+        )
+        if not os.path.isfile(packages_path):
+            return None
+
+        with open(packages_path) as f:
+            return json.load(f)  # type: ignore
+
+    def _find_nearest_entry(
+        self, packages: Dict[str, str]
+    ) -> Optional[Tuple[str, List[str], List[str]]]:
+        """Find the cache entry with the smallest difference in packages, return packages to install and remove.
+
+        Entries that do not share any package with the given packages are not considered. Ties are resolved in
+        favour of the most recently used entry.
+        """
+        result = None
+        smallest_diff = None
+        for entry in self._list_entries():
+            entry_packages = self._load_entry_packages(entry["id"])
+            if entry_packages is None:
+                continue
+
+            install = sorted(
+                requirement
+                for name, requirement in packages.items()
+                if entry_packages.get(name) != requirement
+            )
+            if len(install) == len(packages):
+                continue
+
+            remove = sorted(name for name in entry_packages if name not in packages)
+            if smallest_diff is None or len(install) + len(remove) < smallest_diff:
+                smallest_diff = len(install) + len(remove)
+                result = (entry["id"], install, remove)
+
+        return result
+
+    def _restore_nearest(self, reason: str) -> NoReturn:
+        """Restore the nearest cache entry if configured to do so, signalize the cache miss in any case."""
+        if self.config.restore_fallback != "nearest":
+            raise VirtualenvCacheMiss(reason)
+
+        packages = self._load_packages()
+        tiers = [self]
+        shared = self._get_shared_cache(
+            os.path.abspath(self.config.expanded_virtualenv_path)
+        )
+        if shared is not None:
+            tiers.append(shared)
+
+        for tier in tiers if packages else ():
+            with self.metrics.phase("find_nearest"):
+                nearest = tier._find_nearest_entry(packages)
+            if nearest is None:
+                continue
+
+            entry_id, install, remove = nearest
+            _LOGGER.warning(
+                "%s, falling back to the nearest cache entry %r: %d packages to install, %d packages to remove",
+                reason,
+                entry_id,
+                len(install),
+                len(remove),
+            )
+            if not tier._restore_entry(entry_id):
+                raise VirtualenvCacheMiss(
+                    f"{reason}, no virtual environment stored in the nearest cache entry {entry_id!r}"
+                )
+
+            if tier is not self:
+                self._promote(tier, entry_id)
+
+            raise VirtualenvCachePartialHit(
+                f"Restored the nearest cache entry {entry_id!r}, packages need to be adjusted",
+                install=install,
+                remove=remove,
+            )
+
+        raise VirtualenvCacheMiss(f"{reason}, no cache entry to fall back to")
+
+    def _promote(self, tier: "Cache", entry_id: str) -> None:
+        """Store the virtual environment just restored from the shared tier to the local tier."""
+        _LOGGER.info("Promoting cache entry %r to the local cache", entry_id)
+        with self.metrics.operation("promote"):
+            self._store_entry(entry_id, tier._load_entry_packages(entry_id) or {})
+
+    def _count_restored(self, manifest: Manifest) -> None:
+        """Count files of the restored virtual environment in metrics."""
+        files = list(manifest.files())
+        self.metrics.add_io(files=len(files), size=sum(r.size for r in files))
+
+    def _get_layer_files(
+        self, cached_entry_path: str, entry_manifest: Manifest, layer: Dict[str, str]
+    ) -> Optional[List[ManifestRecord]]:
+        """Get records of files stored in the given entry on top of its base layer, None if the base is not usable."""
+        base_path = os.path.join(self.config.expanded_cache_path, layer["base"])
+        manifest_path = os.path.join(base_path, self._CACHE_ENTRY_MANIFEST_FILE)
+        try:
+            if hash_file(manifest_path) != layer["base_manifest_digest"]:
+                return None
+            base_manifest = Manifest.load(manifest_path)
+        except (OSError, ValueError, KeyError, TypeError) as exc:
+            _LOGGER.debug(
+                "Cannot load base layer of cache entry %r: %s",
+                os.path.basename(cached_entry_path),
+                exc,
+            )
+            return None
+
+        changes = base_manifest.diff(entry_manifest)
+        changed = set(changes.added) | set(changes.modified)
+        return [r for r in entry_manifest.files() if r.path in changed]
+
+    def _verify_entry(self, entry_id: str) -> Optional[Dict[str, Any]]:
+        """Verify files stored in the given entry of the local cache against the entry manifest.
+
+        Return the number of files checked and paths of files that are missing or corrupt, None if the entry cannot be
+        verified (e.g. nothing is stored in it, or it was stored by an older version without a manifest).
+        """
+        cached_entry_path = os.path.join(self.config.expanded_cache_path, entry_id)
+        entry_format = self._get_entry_format(cached_entry_path)
+        if entry_format is None:
+            return None
+
+        try:
+            entry_manifest = self._load_entry_manifest(cached_entry_path)
+        except (ValueError, KeyError, TypeError) as exc:
+            _LOGGER.warning("Invalid manifest of cache entry %r: %s", entry_id, exc)
+            return {
+                "id": entry_id,
+                "files": 0,
+                "corrupt": [self._CACHE_ENTRY_MANIFEST_FILE],
+            }
+
+        if entry_manifest is None:
+            _LOGGER.debug("No manifest stored in cache entry %r to verify", entry_id)
+            return None
+
+        layer = self._load_entry_layer(cached_entry_path)
+        if layer is None:
+            records = list(entry_manifest.files())
+        else:
+            layer_records = self._get_layer_files(
+                cached_entry_path, entry_manifest, layer
+            )
+            if layer_records is None:
+                # Such an entry is not restored, see _restore_layers().
+                _LOGGER.warning(
+                    "Cannot verify cache entry %r, its base layer %r is not stored anymore or it was stored again",
+                    entry_id,
+                    layer["base"],
+                )
+                return None
+            records = layer_records
+
+        if entry_format == "archive":
+            compression = find_archive(cached_entry_path)
+            try:
+                archive_files = hash_archive_files(
+                    os.path.join(cached_entry_path, get_archive_name(compression)),
+                    compression=compression,  # type: ignore
+                    members={
+                        r.path for r in sample_files(records, self.config.verify_sample)
+                    },
+                )
+            except VirtualenvCacheException:
+                raise
+            except Exception as exc:
+                # Any error decompressing or reading the archive means it is damaged.
+                _LOGGER.warning(
+                    "Cannot read archive of cache entry %r: %s", entry_id, exc
+                )
+                return {
+                    "id": entry_id,
+                    "files": len(records),
+                    "corrupt": [get_archive_name(compression)],  # type: ignore
+                }
+            corrupt = verify_archive_files(records, archive_files)
+        elif entry_format == "objects":
+            object_store = self._get_object_store()
+            corrupt = verify_files(
+                records,
+                lambda r: object_store.object_path(r.digest, r.mode),  # type: ignore
+                sample=self.config.verify_sample,
+                workers=self.config.copy_workers,
+            )
+        else:
+            corrupt = verify_files(
+                records,
+                lambda r: os.path.join(cached_entry_path, "venv", *r.path.split("/")),
+                sample=self.config.verify_sample,
+                workers=self.config.copy_workers,
+            )
+
+        self.metrics.add_io(files=len(records), size=sum(r.size for r in records))
+        return {"id": entry_id, "files": len(records), "corrupt": corrupt}
+
+    def _check_entry(self, entry_id: str) -> List[str]:
+        """Verify the given entry before it is restored if configured, see `restore_verify'; return corrupt paths."""
+        if self.config.restore_verify == "none":
+            return []
+
+        with self.metrics.phase("verify"):
+            report = self._verify_entry(entry_id)
+        return report["corrupt"] if report is not None else []
+
+    def _quarantine_entry(self, entry_id: str, corrupt: List[str]) -> None:
+        """Move the given corrupt entry to quarantine, corrupt objects it references are quarantined as well."""
+        cached_entry_path = os.path.join(self.config.expanded_cache_path, entry_id)
+        _LOGGER.error(
+            "Cache entry %r is corrupt, %d files do not match its manifest (e.g. %r), moving it to quarantine",
+            entry_id,
+            len(corrupt),
+            corrupt[0],
+        )
+        if (
+            self._get_entry_format(cached_entry_path) == "objects"
+            and self._CACHE_ENTRY_MANIFEST_FILE not in corrupt
+        ):
+            # Objects are not stored again while present, other entries referencing them are corrupt as well.
+            object_store = self._get_object_store()
+            manifest = self._load_entry_manifest(cached_entry_path)
+            for path in corrupt:
+                record = manifest.records[path]  # type: ignore
+
+                object_path = object_store.object_path(record.digest, record.mode)  # type: ignore
+                if os.path.exists(object_path):
+                    self._quarantine(object_path)
+
+        self._remove_entry(entry_id, self._get_index(), quarantine=True)
+
+    def verify(self) -> List[Dict[str, Any]]:
+        """Verify files of all the entries in the cache against their manifests, corrupt entries are quarantined.
+
+        Return a report for each entry verified, stating number of files checked and paths of corrupt files.
+        """
+        with self.metrics.operation("verify"):
+            if self._get_storage_backend() is not None:
+                _LOGGER.warning(
+                    "Verification is not supported for caches kept in a storage backend"
+                )
+                return []
+
+            if not os.path.isdir(self.config.expanded_cache_path):
+                _LOGGER.warning("The configured cache hasn't been used yet")
+                return []
+
+            reports = []
+            for entry in self._list_entries():
+                lock = self._lock_entry_shared(entry["id"])
+                try:
+                    with self.metrics.phase("verify"):
+                        report = self._verify_entry(entry["id"])
+                finally:
+                    lock.release()
+
+                if report is None:
+                    continue
+
+                reports.append(report)
+                if report["corrupt"]:
+                    with self.metrics.phase("quarantine"):
+                        self._quarantine_entry(entry["id"], report["corrupt"])
+
+            corrupt = sum(1 for r in reports if r["corrupt"])
+            _LOGGER.info("Verified %d cache entries, %d corrupt", len(reports), corrupt)
+            self.metrics.set_outcome("corrupt" if corrupt else "ok")
+            return reports
+
+    def _restore_entry(self, entry_id: str) -> bool:
+        """Restore the virtual environment stored in the given cache entry, return False if nothing is stored."""
+        cached_entry_path = os.path.join(self.config.expanded_cache_path, entry_id)
+        backend = self._get_storage_backend()
+        if backend is not None:
+            _LOGGER.info(
+                "Restoring virtual environment from cache %r to %r",
+                cached_entry_path,
+                self.config.expanded_virtualenv_path,
+            )
+            with self.metrics.phase("copy"):
+                if not backend.get(entry_id, self.config.expanded_virtualenv_path):
+                    return False
+
+            self._compile_bytecode()
+            with self.metrics.phase("record_manifest"):
+                manifest = self._record_virtualenv_manifest(entry_id, None)
+            self._count_restored(manifest)
+            with self.metrics.phase("mark_usage"):
+                backend.touch(entry_id, hit=True)
+            return True
+
+        lock = self._lock_entry_shared(entry_id)
+        try:
+            corrupt = self._check_entry(entry_id)
+            if not corrupt:
+                return self._restore_local_entry(entry_id)
+        finally:
+            lock.release()
+
+        with self.metrics.phase("quarantine"):
+            self._quarantine_entry(entry_id, corrupt)
+        return False
+
+    def _compile_bytecode(self) -> None:
+        """Byte-compile modules of the restored virtual environment if configured, see `bytecode_compilation'."""
+        if self.config.bytecode_compilation == "none":
+            return
+
+        with self.metrics.phase("compile_bytecode"):
+            compile_bytecode(
+                self.config.expanded_virtualenv_path, workers=self.config.copy_workers
+            )
+
+    def _lock_entry_shared(self, entry_id: str) -> FileLock:
+        """Lock the given entry so that it is not modified nor removed while being read."""
+        lock = self._get_entry_lock(entry_id)
+        try:
+            lock.acquire(shared=True)
+        except OSError as exc:
+            # E.g. a shared cache mounted read-only.
+            _LOGGER.debug("Cannot lock cache entry %r: %s", entry_id, exc)
+
+        return lock
+
+    def _restore_local_entry(self, entry_id: str) -> bool:
+        """Restore the virtual environment stored in the given entry of the local cache."""
+        cached_entry_path = os.path.join(self.config.expanded_cache_path, entry_id)
+        entry_format = self._get_entry_format(cached_entry_path)
+        if entry_format is None:
+            return False
+
+        _LOGGER.info(
+            "Restoring virtual environment from cache %r to %r",
+            cached_entry_path,
+            self.config.expanded_virtualenv_path,
+        )
+        with self.metrics.phase("load_manifest"):
+            entry_manifest = self._load_entry_manifest(cached_entry_path)
+        layer = self._load_entry_layer(cached_entry_path)
+        if (
+            layer is None
+            and self.config.restore_mode == "sync"
+            and entry_manifest is not None
+            and os.path.isdir(self.config.expanded_virtualenv_path)
+        ):
+            self._sync_virtualenv(cached_entry_path, entry_format, entry_manifest)
+            self._relocate_virtualenv(entry_manifest)
+            self._compile_bytecode()
+            with self.metrics.phase("record_manifest"):
+                self._record_virtualenv_manifest(
+                    entry_id,
+                    entry_manifest,
+                    entry_manifest_digest=self._get_entry_manifest_digest(
+                        cached_entry_path
+                    ),
+                )
+            with self.metrics.phase("mark_usage"):
+                self._mark_cache_entry_usage(cached_entry_path, hit=True)
+            return True
+
+        if layer is None:
+            self._copy_entry(cached_entry_path, entry_format, entry_manifest)
+        elif not self._restore_layers(
+            cached_entry_path, entry_format, entry_manifest, layer  # type: ignore
+        ):
+            return False
+
+        self._compile_bytecode()
+        with self.metrics.phase("record_manifest"):
+            manifest = self._record_virtualenv_manifest(
+                entry_id,
+                entry_manifest,
+                entry_manifest_digest=self._get_entry_manifest_digest(
+                    cached_entry_path
+                ),
+            )
+        self._count_restored(manifest)
+        with self.metrics.phase("mark_usage"):
+            self._mark_cache_entry_usage(cached_entry_path, hit=True)
+        return True
+
+    def _copy_entry(
+        self,
+        cached_entry_path: str,
+        entry_format: str,
+        entry_manifest: Optional[Manifest],
+    ) -> None:
+        """Replace the virtual environment with the one stored in the given cache entry."""
+        # Remove any virtual environment already present.
+        with self.metrics.phase("remove_virtualenv"):
+            shutil.rmtree(self.config.expanded_virtualenv_path, ignore_errors=True)
+
+        with self.metrics.phase("copy"):
+            if entry_format == "archive":
+                compression = find_archive(cached_entry_path)
+                extract_archive(
+                    os.path.join(cached_entry_path, get_archive_name(compression)),
+                    self.config.expanded_virtualenv_path,
+                    compression=compression,
+                )
+            elif entry_format == "objects":
+                os.makedirs(self.config.expanded_virtualenv_path)
+                self._materialize(
+                    cached_entry_path,
+                    entry_format,
+                    entry_manifest.records.values(),  # type: ignore
+                )
+            else:
+                copy_tree(
+                    os.path.join(cached_entry_path, "venv"),
+                    self.config.expanded_virtualenv_path,
+                    strategy=self.config.copy_strategy,
+                    workers=self.config.copy_workers,
+                )
+
+        self._relocate_virtualenv(entry_manifest)
+
+    def _restore_layers(
+        self,
+        cached_entry_path: str,
+        entry_format: str,
+        entry_manifest: Manifest,
+        layer: Dict[str, str],
+    ) -> bool:
+        """Restore the base layer the given cache entry is stored on top of and apply the entry to it.
+
+        Return False if the base layer is not stored anymore, it was stored again since the entry was stored, or it is
+        corrupt.
+        """
+        base_id = layer["base"]
+        base_path = os.path.join(self.config.expanded_cache_path, base_id)
+        lock = self._lock_entry_shared(base_id)
+        try:
+            base_format = self._get_entry_format(base_path)
+            manifest_path = os.path.join(base_path, self._CACHE_ENTRY_MANIFEST_FILE)
+            if base_format is None or not os.path.isfile(manifest_path):
+                _LOGGER.warning(
+                    "Base layer %r of cache entry %r is not stored anymore",
+                    base_id,
+                    os.path.basename(cached_entry_path),
+                )
+                return False
+
+            if hash_file(manifest_path) != layer["base_manifest_digest"]:
+                _LOGGER.warning(
+                    "Base layer %r was stored again since cache entry %r was stored on top of it",
+                    base_id,
+                    os.path.basename(cached_entry_path),
+                )
+                return False
+
+            corrupt = self._check_entry(base_id)
+            if not corrupt:
+                base_manifest = Manifest.load(manifest_path)
+                self._copy_entry(base_path, base_format, base_manifest)
+                with self.metrics.phase("mark_usage"):
+                    self._mark_cache_entry_usage(base_path, hit=True)
+        finally:
+            lock.release()
+
+        if corrupt:
+            with self.metrics.phase("quarantine"):
+                self._quarantine_entry(base_id, corrupt)
+            return False
+
+        changes = base_manifest.diff(entry_manifest)
+        changed = set(changes.added) | set(changes.modified)
+        with self.metrics.phase("apply_layer"):
+            self._remove_changed_items(
+                self.config.expanded_virtualenv_path, entry_manifest, changes
+            )
+            self._materialize(
+                cached_entry_path,
+                entry_format,
+                [r for r in entry_manifest.records.values() if r.path in changed],
+            )
+        self._relocate_virtualenv(entry_manifest, changed)
+        return True
 
     def restore(self) -> None:
         """Check already existing cached virtual environment and make it available, if possible."""
+        with self.metrics.operation("restore"):
+            try:
+                self._restore()
+            except VirtualenvCachePartialHit:
+                self.metrics.set_outcome("partial_hit")
+                raise
+            except VirtualenvCacheMiss:
+                self.metrics.set_outcome("miss")
+                raise
+
+    def _restore(self) -> None:
+        """Restore the virtual environment matching the lock files, signalize a cache miss if not possible."""
         _LOGGER.debug("Calculating digests of requirements files")
         all_hashed = self._hash_all_lock_files()
         _LOGGER.debug("Calculated hash of all the lock files: %s", all_hashed)
 
         cached_entry_path = os.path.join(self.config.expanded_cache_path, all_hashed)
-        if not os.path.exists(cached_entry_path):
-            raise VirtualenvCacheMiss("No cached virtual environment found")
+        backend = self._get_storage_backend()
+        reason = "No cached virtual environment found"
+        if backend is None and os.path.exists(cached_entry_path):
+            if self._restore_entry(all_hashed):
+                self.metrics.set_outcome("hit")
+                return
+            reason = "No virtual environment stored in the cache entry found"
+        elif backend is not None and self._restore_entry(all_hashed):
+            self.metrics.set_outcome("hit")
+            return
 
-        # Remove any virtual environment already present.
-        _LOGGER.info(
-            "Restoring virtual environment from cache %r to %r",
-            cached_entry_path,
-            self.config.expanded_virtualenv_path,
+        shared = self._get_shared_cache(
+            os.path.abspath(self.config.expanded_virtualenv_path)
         )
-        shutil.rmtree(self.config.expanded_virtualenv_path, ignore_errors=True)
-        shutil.copytree(
-            os.path.join(cached_entry_path, "venv"),
+        if shared is not None and shared._restore_entry(all_hashed):
+            self.metrics.set_outcome("shared_hit")
+            self._promote(shared, all_hashed)
+            return
+
+        self._restore_nearest(reason)
+
+    def _store_remote(
+        self, backend: StorageBackend, entry_id: str, packages: Dict[str, str]
+    ) -> bool:
+        """Store the virtual environment using the given storage backend, unless it was not changed since restored.
+
+        Return False if the store was skipped.
+        """
+        virtualenv_manifest = self._load_virtualenv_manifest()
+        manifest, exclude = self._scan_virtualenv()
+        if (
+            virtualenv_manifest is not None
+            and virtualenv_manifest.entry_id == entry_id
+            and backend.get_packages(entry_id) is not None
+        ):
+            if not virtualenv_manifest.diff(manifest):
+                _LOGGER.info(
+                    "No changes done to the virtual environment since it was restored, skipping store of %r",
+                    entry_id,
+                )
+                backend.touch(entry_id)
+                self._trim_cache(keep=entry_id)
+                return False
+
+        _LOGGER.info(
+            "Storing virtual environment %r to cache in %r",
             self.config.expanded_virtualenv_path,
+            os.path.join(self.config.expanded_cache_path, entry_id),
         )
+        with self.metrics.phase("copy"):
+            size = backend.put(
+                entry_id,
+                self.config.expanded_virtualenv_path,
+                packages=packages,
+                exclude=exclude,
+                base=virtualenv_manifest.entry_id if virtualenv_manifest else None,
+            )
+        _LOGGER.debug("Stored %d bytes", size)
+        with self.metrics.phase("record_manifest"):
+            manifest = self._record_virtualenv_manifest(entry_id, None)
+        self.metrics.add_io(files=sum(1 for _ in manifest.files()), size=size)
+        self._trim_cache(keep=entry_id)
+        return True
 
-        self._mark_cache_entry_usage(cached_entry_path)
+    def _store_entry(self, all_hashed: str, packages: Dict[str, str]) -> str:
+        """Store the virtual environment as the given cache entry, return outcome - stored, unchanged or skipped.
 
-    def store(self) -> None:
-        """Store any changes done to the virtual environment and make them available for the next round."""
-        all_hashed = self._hash_all_lock_files()
+        Only one process stores the given entry at a time, the store is skipped if another process is storing it.
+        """
+        backend = self._get_storage_backend()
+        if backend is not None:
+            stored = self._store_remote(backend, all_hashed, packages)
+            return "stored" if stored else "unchanged"
+
+        store_lock = self._get_entry_lock(all_hashed, store=True)
+        if not store_lock.acquire(blocking=False):
+            _LOGGER.info(
+                "Cache entry %r is being stored by another process, skipping store",
+                all_hashed,
+            )
+            return "skipped"
+
+        try:
+            stored = self._store_local(all_hashed, packages)
+        finally:
+            store_lock.release()
+
+        self._trim_cache(keep=all_hashed)
+        return "stored" if stored else "unchanged"
+
+    def _store_local(self, all_hashed: str, packages: Dict[str, str]) -> bool:
+        """Store the virtual environment to the local cache, unless it was not changed since restored.
+
+        Return False if the store was skipped.
+        """
         cached_entry_path = os.path.join(self.config.expanded_cache_path, all_hashed)
+        with self.metrics.phase("scan"):
+            manifest, exclude = self._scan_virtualenv()
+        manifest.prefix = self._get_virtualenv_prefix()
+        if self.config.relocation != "none":
+            with self.metrics.phase("find_relocatable"):
+                manifest.relocatable = find_path_dependent(
+                    self.config.expanded_virtualenv_path, manifest, manifest.prefix
+                )
+
+        changes = None
+        virtualenv_manifest = self._load_virtualenv_manifest()
+        entry_manifest = (
+            self._load_entry_manifest(cached_entry_path)
+            if self._get_entry_format(cached_entry_path) == self.config.entry_format
+            else None
+        )
+        if (
+            virtualenv_manifest is not None
+            and virtualenv_manifest.entry_id == all_hashed
+            and entry_manifest is not None
+            and virtualenv_manifest.entry_manifest_digest
+            != self._get_entry_manifest_digest(cached_entry_path)
+        ):
+            _LOGGER.info(
+                "Cache entry %r was stored again since the virtual environment was restored, storing it as a whole",
+                all_hashed,
+            )
+        elif (
+            virtualenv_manifest is not None
+            and virtualenv_manifest.entry_id == all_hashed
+            and entry_manifest is not None
+        ):
+            changes = virtualenv_manifest.diff(manifest)
+            if not changes:
+                _LOGGER.info(
+                    "No changes done to the virtual environment since it was restored, skipping store to %r",
+                    cached_entry_path,
+                )
+                self._record_entry_packages(cached_entry_path, packages)
+                self._mark_cache_entry_usage(cached_entry_path)
+                return False
 
-        os.makedirs(cached_entry_path, exist_ok=True)
+            if (
+                entry_manifest.prefix != manifest.prefix
+                or self._load_entry_layer(cached_entry_path) is not None
+            ):
+                # The entry states another path to the virtual environment or it holds just changes done on top of
+                # a base layer, it is stored again as a whole.
+                changes = None
+            else:
+                changed = set(changes.added) | set(changes.modified)
+                for record in manifest.files():
+                    if record.path not in changed:
+                        record.digest = virtualenv_manifest.records[record.path].digest
+
+        with self.metrics.phase("compute_digests"):
+            hashed = manifest.compute_digests(
+                self.config.expanded_virtualenv_path, workers=self.config.copy_workers
+            )
+        _LOGGER.debug("Computed digests of %d files", hashed)
 
         _LOGGER.info(
             "Storing virtual environment %r to cache in %r",
             self.config.expanded_virtualenv_path,
             cached_entry_path,
         )
-        cached_venv_path = os.path.join(cached_entry_path, "venv")
-        shutil.rmtree(cached_venv_path, ignore_errors=True)
-        shutil.copytree(self.config.expanded_virtualenv_path, cached_venv_path)
+        # Objects are not referenced by any entry until the entry manifest is written.
+        objects_lock = self._get_entry_lock(self._OBJECTS_LOCK)
+        if self.config.entry_format == "objects":
+            objects_lock.acquire(shared=True)
+
+        try:
+            if changes is None or self.config.entry_format == "archive":
+                changes = None
+                base = self._get_base_layer(all_hashed)
+                if base is not None:
+                    changes = base[0].diff(manifest)
+                self._store_staged(
+                    all_hashed,
+                    manifest,
+                    packages,
+                    exclude,
+                    layer=base[1] if base is not None else None,
+                    changes=changes,
+                )
+            else:
+                self._store_changes(all_hashed, manifest, changes, packages)
+        finally:
+            objects_lock.release()
+
+        changed = (
+            set(changes.added) | set(changes.modified) if changes is not None else None
+        )
+        stored = [r for r in manifest.files() if changed is None or r.path in changed]
+        self.metrics.add_io(files=len(stored), size=sum(r.size for r in stored))
+
+        with self.metrics.phase("record_manifest"):
+            self._record_virtualenv_manifest(
+                all_hashed,
+                manifest,
+                entry_manifest_digest=self._get_entry_manifest_digest(
+                    cached_entry_path
+                ),
+            )
+        with self.metrics.phase("mark_usage"):
+            self._mark_cache_entry_usage(
+                cached_entry_path, size=self._get_entry_size(cached_entry_path)
+            )
+        return True
+
+    def _store_staged(
+        self,
+        entry_id: str,
+        manifest: Manifest,
+        packages: Dict[str, str],
+        exclude: FrozenSet[str],
+        *,
+        layer: Optional[Dict[str, str]] = None,
+        changes: Optional[ManifestDiff] = None,
+    ) -> None:
+        """Store the whole virtual environment to a staging directory and atomically replace the cache entry with it.
+
+        Restores never see a partially stored cache entry. Items stated in exclude are not stored. If a layer is
+        given, only the given changes done on top of its base layer are stored.
+        """
+        staging_path = os.path.join(self.config.expanded_cache_path, self._STAGING_DIR)
+        staged_entry_path = os.path.join(staging_path, f"{entry_id}-{uuid.uuid4().hex}")
+        os.makedirs(staged_entry_path)
+        try:
+            self._record_entry_packages(staged_entry_path, packages)
+            manifest.dump(
+                os.path.join(staged_entry_path, self._CACHE_ENTRY_MANIFEST_FILE)
+            )
+            members = None
+            if layer is not None:
+                members = set(changes.added) | set(changes.modified)  # type: ignore
+                _LOGGER.info(
+                    "Storing %d items changed on top of base layer %r",
+                    len(members),
+                    layer["base"],
+                )
+                self._dump_json(
+                    os.path.join(staged_entry_path, self._CACHE_ENTRY_LAYER_FILE), layer
+                )
+
+            with self.metrics.phase("copy"):
+                if self.config.entry_format == "objects":
+                    self._store_objects(manifest, None)
+                elif self.config.entry_format == "archive":
+                    create_archive(
+                        self.config.expanded_virtualenv_path,
+                        os.path.join(
+                            staged_entry_path,
+                            get_archive_name(self.config.archive_compression),
+                        ),
+                        compression=self.config.archive_compression,
+                        level=self.config.archive_compression_level,
+                        threads=self.config.copy_workers,
+                        exclude=exclude,
+                        members=members,
+                    )
+                elif layer is not None:
+                    self._store_tree_changes(
+                        staged_entry_path, manifest, changes  # type: ignore
+                    )
+                else:
+                    copy_tree(
+                        self.config.expanded_virtualenv_path,
+                        os.path.join(staged_entry_path, "venv"),
+                        strategy=get_store_strategy(self.config.copy_strategy),
+                        workers=self.config.copy_workers,
+                        exclude=exclude,
+                    )
+            self._dump_json(
+                os.path.join(staged_entry_path, self._CACHE_ENTRY_USAGE_FILE),
+                {
+                    "hostname": socket.gethostname(),
+                    "datetime": datetime.datetime.now(
+                        tz=datetime.timezone.utc
+                    ).isoformat(),
+                },
+            )
+
+            cached_entry_path = os.path.join(self.config.expanded_cache_path, entry_id)
+            replaced_path = f"{staged_entry_path}.old"
+            with self.metrics.phase("publish"), self._get_entry_lock(entry_id):
+                if os.path.exists(cached_entry_path):
+                    os.rename(cached_entry_path, replaced_path)
+                os.rename(staged_entry_path, cached_entry_path)
+        except BaseException:
+            remove_tree(staged_entry_path, workers=self.config.copy_workers)
+            raise
+
+        with self.metrics.phase("remove_entry_data"):
+            self._discard(replaced_path)
+
+    def _store_changes(
+        self,
+        entry_id: str,
+        manifest: Manifest,
+        changes: ManifestDiff,
+        packages: Dict[str, str],
+    ) -> None:
+        """Apply changes done in the virtual environment to the cache entry in place, restores wait meanwhile.
+
+        The entry is marked dirty until its manifest is written, so that an interrupted store leaves an entry treated
+        as not present rather than a partially changed one.
+        """
+        cached_entry_path = os.path.join(self.config.expanded_cache_path, entry_id)
+        dirty_path = os.path.join(cached_entry_path, self._CACHE_ENTRY_DIRTY_FILE)
+        with self._get_entry_lock(entry_id):
+            with open(dirty_path, "w"):
+                pass
+            self._record_entry_packages(cached_entry_path, packages)
+            with self.metrics.phase("copy"):
+                if self.config.entry_format == "objects":
+                    self._store_objects(manifest, changes)
+                else:
+                    self._store_tree_changes(cached_entry_path, manifest, changes)
+            manifest.dump(
+                os.path.join(cached_entry_path, self._CACHE_ENTRY_MANIFEST_FILE)
+            )
+            os.unlink(dirty_path)
+
+    def _start_shared_upload(self, entry_id: str, packages: Dict[str, str]) -> None:
+        """Store a snapshot of the virtual environment to the shared tier in background.
+
+        The snapshot is created using hardlinks so that the virtual environment can be modified meanwhile. The entry
+        states the path to the virtual environment rather than to the snapshot, so that it is relocated on restore.
+        """
+        virtualenv_path = os.path.abspath(self.config.expanded_virtualenv_path)
+        staging_path = tempfile.mkdtemp(
+            prefix=".virtualenv-cache-upload-", dir=os.path.dirname(virtualenv_path)
+        )
+        snapshot_path = os.path.join(staging_path, "venv")
+        shared = self._get_shared_cache(
+            snapshot_path, virtualenv_prefix=self._get_virtualenv_prefix()
+        )
+        try:
+            with self.metrics.phase("snapshot"):
+                copy_tree(
+                    virtualenv_path,
+                    snapshot_path,
+                    strategy="hardlink",
+                    workers=self.config.copy_workers,
+                )
+        except BaseException:
+            shutil.rmtree(staging_path, ignore_errors=True)
+            raise
 
-        self._mark_cache_entry_usage(cached_entry_path)
-        self._trim_cache()
+        def _upload() -> None:
+            try:
+                with self.metrics.operation("shared_store"):
+                    self.metrics.set_outcome(
+                        shared._store_entry(entry_id, packages)  # type: ignore
+                    )
+            finally:
+                shutil.rmtree(staging_path, ignore_errors=True)
+
+        if self._uploader is None:
+            self._uploader = ThreadPoolExecutor(max_workers=1)
+        self._uploads.append(self._uploader.submit(_upload))
+
+    def wait(self) -> None:
+        """Wait for stores to the shared tier running in background to finish."""
+        uploads, self._uploads = self._uploads, []
+        for upload in uploads:
+            try:
+                upload.result()
+            except VirtualenvCacheException:
+                raise
+            except Exception as exc:
+                raise VirtualenvCacheStorageError(
+                    f"Failed to store virtual environment to the shared cache: {exc}"
+                ) from exc
+
+    def store(self) -> None:
+        """Store any changes done to the virtual environment and make them available for the next round.
+
+        If a shared tier is configured, the virtual environment is stored to it in background, see wait().
+        """
+        with self.metrics.operation("store"):
+            all_hashed = self._hash_all_lock_files()
+            with self.metrics.phase("load_packages"):
+                packages = self._load_packages()
+            self._store(all_hashed, packages)
+
+    def store_base(self) -> None:
+        """Store the virtual environment as the base layer keyed by the base lock files.
+
+        Entries stored later are stored as changes done on top of the base layer, see `base_lock_paths'.
+        """
+        if not self.config.base_lock_paths:
+            raise VirtualenvCacheConfigError(
+                "No base lock files defined in the configuration file"
+            )
+
+        with self.metrics.operation("store"):
+            base_id = self._hash_lock_files(self.config.base_lock_paths)
+            with self.metrics.phase("load_packages"):
+                packages = self._load_packages(self.config.base_lock_paths)
+            self._store(base_id, packages)
+
+    def _store(self, entry_id: str, packages: Dict[str, str]) -> None:
+        """Store the virtual environment as the given entry, also to the shared tier if configured."""
+        if self.config.shared_cache_path:
+            self._start_shared_upload(entry_id, packages)
+
+        self.metrics.set_outcome(self._store_entry(entry_id, packages))
 
     def list(self) -> List[Dict[str, Any]]:
         """List all the environments available."""
+        if self._get_storage_backend() is not None:
+            return self._list_entries()
+
         if not os.path.isdir(self.config.expanded_cache_path):
             _LOGGER.warning("The configured cache hasn't been used yet")
             return []
@@ -159,10 +1875,43 @@ class Cache:
 
     def erase(self) -> None:
         """Erase the cache."""
+        with self.metrics.operation("erase"):
+            self._erase()
+
+    def _erase(self) -> None:
+        """Remove all the cache entries and data shared by them."""
+        backend = self._get_storage_backend()
+        if backend is not None:
+            _LOGGER.warning(
+                "Erasing cache located in %r", self.config.expanded_cache_path
+            )
+            with self.metrics.phase("remove_entries"):
+                for entry in backend.list():
+                    backend.delete(entry["id"])
+                    self.metrics.add_io(size=entry["size"] or 0)
+            with self.metrics.phase("collect_garbage"):
+                backend.collect_garbage(min_age=0)
+            return
+
         if os.path.exists(self.config.expanded_cache_path):
             _LOGGER.warning(
                 "Erasing cache located in %r", self.config.expanded_cache_path
             )
-            shutil.rmtree(self.config.expanded_cache_path)
+            with self.metrics.phase("remove_entries"):
+                erased_path = (
+                    move_erased(self.config.expanded_cache_path)
+                    if self.config.purge_mode == "background"
+                    else None
+                )
+                if erased_path is None:
+                    remove_tree(
+                        self.config.expanded_cache_path,
+                        workers=self.config.copy_workers,
+                    )
+            if erased_path is not None:
+                with self.metrics.phase("purge"):
+                    spawn_purge(
+                        [erased_path], workers=self.config.copy_workers, trash=False
+                    )
         else:
             _LOGGER.warning("No cache in %r found", self.config.expanded_cache_path)
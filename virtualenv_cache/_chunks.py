@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+import hashlib
+import threading
+import uuid
+import zlib
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO
+from typing import Dict
+from typing import Generator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import attr
+
+from ._s3 import S3Client
+
+# Chunk boundaries are placed right after an occurrence of the anchor, chunks are bounded in size.
+ANCHOR = b"\x8e\xd7"
+MIN_CHUNK_SIZE = 32 * 1024
+MAX_CHUNK_SIZE = 1024 * 1024
+_READ_SIZE = 4 * 1024 * 1024
+
+# A location of a chunk - a pack name, an offset and a length of the compressed chunk in the pack and its size.
+ChunkLocation = Tuple[str, int, int, int]
+
+
+def iter_chunks(f: BinaryIO) -> Generator[bytes, None, None]:
+    """Split content of the given file into content-defined chunks.
+
+    Boundaries depend only on content preceding them, so an insertion or a removal changes only chunks around it.
+    Anchors are looked up using bytes.find rather than a rolling hash computed byte by byte in Python.
+    """
+    buffer = bytearray()
+    start = 0
+    eof = False
+    while True:
+        if len(buffer) - start < MAX_CHUNK_SIZE and not eof:
+            del buffer[:start]
+            start = 0
+            data = f.read(_READ_SIZE)
+            if data:
+                buffer += data
+                continue
+            eof = True
+
+        if start == len(buffer):
+            return
+
+        end = min(start + MAX_CHUNK_SIZE, len(buffer))
+        position = buffer.find(ANCHOR, start + MIN_CHUNK_SIZE - len(ANCHOR), end)
+        cut = position + len(ANCHOR) if position != -1 else end
+        yield bytes(buffer[start:cut])
+        start = cut
+
+
+def compute_chunk_digest(data: bytes) -> str:
+    """Compute a digest identifying the given chunk."""
+    return hashlib.sha256(data).hexdigest()
+
+
+@attr.s(slots=True)
+class PackWriter:
+    """Collect chunks not stored yet into pack objects uploaded in background.
+
+    Chunks are compressed one by one so that they can be downloaded using range requests. Chunks can be added
+    from multiple threads.
+    """
+
+    client = attr.ib(type=S3Client)
+    bucket = attr.ib(type=str)
+    prefix = attr.ib(type=str)
+    locations = attr.ib(type=Dict[str, ChunkLocation], factory=dict, kw_only=True)
+    pack_size = attr.ib(type=int, default=8 * 1024 * 1024, kw_only=True)
+    compression_level = attr.ib(type=int, default=1, kw_only=True)
+    workers = attr.ib(type=int, default=1, kw_only=True)
+    size = attr.ib(type=int, default=0, init=False)
+    _lock = attr.ib(type=threading.Lock, factory=threading.Lock, init=False)
+    _pack = attr.ib(type=str, factory=lambda: uuid.uuid4().hex, init=False)
+    _buffer = attr.ib(type=bytearray, factory=bytearray, init=False)
+    _uploads = attr.ib(type=List["Future[None]"], factory=list, init=False)
+    _executor = attr.ib(type=Optional[ThreadPoolExecutor], default=None, init=False)
+
+    def add(self, data: bytes) -> str:
+        """Add the given chunk unless it is already stored, return its digest."""
+        digest = compute_chunk_digest(data)
+        with self._lock:
+            if digest in self.locations:
+                return digest
+
+        compressed = zlib.compress(data, self.compression_level)
+        with self._lock:
+            # The same chunk could be added by another thread meanwhile.
+            if digest not in self.locations:
+                self.locations[digest] = (
+                    self._pack,
+                    len(self._buffer),
+                    len(compressed),
+                    len(data),
+                )
+                self._buffer += compressed
+                if len(self._buffer) >= self.pack_size:
+                    self._submit()
+
+        return digest
+
+    def _submit(self) -> None:
+        """Upload the current pack in background, the number of packs kept in memory is bounded."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers)
+
+        in_flight = [f for f in self._uploads if not f.done()]
+        if len(in_flight) >= self.workers:
+            in_flight[0].result()
+
+        self._uploads.append(
+            self._executor.submit(
+                self.client.put_object,
+                self.bucket,
+                f"{self.prefix}{self._pack}",
+                bytes(self._buffer),
+            )
+        )
+        self.size += len(self._buffer)
+        self._pack = uuid.uuid4().hex
+        self._buffer = bytearray()
+
+    def close(self) -> None:
+        """Upload the last pack and wait for all the uploads to finish."""
+        if self._buffer:
+            self._submit()
+
+        try:
+            for upload in self._uploads:
+                upload.result()
+        finally:
+            self.abort()
+
+    def abort(self) -> None:
+        """Stop uploading packs, packs already uploaded are removed by garbage collection."""
+        for upload in self._uploads:
+            upload.cancel()
+
+        if self._executor is not None:
+            self._executor.shutdown()
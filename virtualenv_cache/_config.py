@@ -3,22 +3,109 @@
 import logging
 import os.path
 import pathlib
+from typing import Any
+from typing import Dict
 from typing import List
 
 import attr
 import tomli
 from pathlib import Path
 
+from ._archive import ARCHIVE_COMPRESSION_LEVELS
+from ._archive import ARCHIVE_COMPRESSIONS
+from ._bytecode import BYTECODE_COMPILATIONS
+from ._copy import COPY_STRATEGIES
+from ._eviction import EVICTION_POLICIES
+from ._lockfiles import LOCK_FILE_HASHINGS
+from ._relocate import RELOCATIONS
+from ._s3 import MIN_PART_SIZE
+from ._storage import REMOTE_ENTRY_FORMATS
+from ._storage import is_storage_url
+from ._trash import PURGE_MODES
+from ._verify import VERIFY_MODES
 from ._exceptions import VirtualenvCacheConfigError
 
 _LOGGER = logging.getLogger(__name__)
 
 
+def _validate_eviction_policy(
+    _: object, attribute: "attr.Attribute[str]", value: str
+) -> None:
+    """Check the eviction policy is known, custom policies can be registered at runtime."""
+    if value not in EVICTION_POLICIES:
+        raise ValueError(
+            f"{attribute.name!r} must be in {tuple(EVICTION_POLICIES)!r} (got {value!r})"
+        )
+
+
+def _validate_copy_strategy(
+    config: "Config", attribute: "attr.Attribute[str]", value: str
+) -> None:
+    """Check the copy strategy is known and cannot corrupt cache entries.
+
+    Files of the "tree" entry format are writable, hardlinking them would let any in-place write to the virtual
+    environment modify the cache entry.
+    """
+    attr.validators.in_(COPY_STRATEGIES)(config, attribute, value)
+    if value == "hardlink" and config.entry_format == "tree":
+        raise ValueError(
+            f"{attribute.name!r} cannot be 'hardlink' with the 'tree' entry format, use the 'objects' entry format"
+        )
+
+
+def _validate_archive_compression_level(
+    config: "Config", attribute: "attr.Attribute[int]", value: int
+) -> None:
+    """Check the compression level is in the range supported by the configured archive compression."""
+    attr.validators.instance_of(int)(config, attribute, value)
+    if config.archive_compression not in ARCHIVE_COMPRESSION_LEVELS:
+        return
+
+    low, high = ARCHIVE_COMPRESSION_LEVELS[config.archive_compression]
+    if not low <= value <= high:
+        raise ValueError(
+            f"{attribute.name!r} must be in range {low}-{high} for the {config.archive_compression!r} "
+            f"compression (got {value!r})"
+        )
+
+
+# Options storage backends cannot honour, only their default values are accepted.
+_BACKEND_DEFAULTS: Dict[str, Any] = {
+    "entry_format": "tree",
+    "restore_mode": "replace",
+    "restore_verify": "none",
+    "base_lock_paths": [],
+}
+
+
+def _check_backend_options(config: "Config") -> None:
+    """Check options can be honoured if the cache is kept in a storage backend."""
+    if not is_storage_url(config.expanded_cache_path):
+        return
+
+    for option, default in _BACKEND_DEFAULTS.items():
+        if getattr(config, option) != default:
+            raise VirtualenvCacheConfigError(
+                f"Option {option!r} cannot be honoured for a cache kept in a storage backend ({config.cache_path!r})"
+            )
+
+    if config.relocation != "none":
+        _LOGGER.warning(
+            "Virtual environments restored from a storage backend (%r) are not relocated, "
+            "set the 'relocation' option to 'none'",
+            config.cache_path,
+        )
+
+
 @attr.s(slots=True)
 class Config:
     """A configuration file stating information about Python projects virtualenv."""
 
     DEFAULT_CONFIG_PATH = str(Path().cwd() / ".virtualenv_cache.toml")
+    ENTRY_FORMATS = ("tree", "objects", "archive")
+    RESTORE_MODES = ("replace", "sync")
+    RESTORE_FALLBACKS = ("none", "nearest")
+    SYNC_CHECKS = ("metadata", "digest")
     _DEFAULT_CONFIG_CONTENT_PATH = str(
         pathlib.Path(__file__).parent.resolve()
         / "data"
@@ -32,10 +119,153 @@ class Config:
             "${HOME}/.virtualenv_cache/caches/", os.path.basename(os.getcwd())
         ),
     )
+    cache_max_bytes = attr.ib(
+        type=int,
+        default=0,
+        kw_only=True,
+        validator=[attr.validators.instance_of(int), attr.validators.ge(0)],
+    )
+    eviction_policy = attr.ib(
+        type=str,
+        default="lru",
+        kw_only=True,
+        validator=_validate_eviction_policy,
+    )
+    shared_cache_path = attr.ib(type=str, default="", kw_only=True)
+    shared_cache_size = attr.ib(type=int, default=100, kw_only=True)
+    shared_cache_max_bytes = attr.ib(
+        type=int,
+        default=0,
+        kw_only=True,
+        validator=[attr.validators.instance_of(int), attr.validators.ge(0)],
+    )
+    shared_eviction_policy = attr.ib(
+        type=str,
+        default="lru",
+        kw_only=True,
+        validator=_validate_eviction_policy,
+    )
+    purge_mode = attr.ib(
+        type=str,
+        default="background",
+        kw_only=True,
+        validator=attr.validators.in_(PURGE_MODES),
+    )
     virtualenv_path = attr.ib(type=str, default=".venv", kw_only=True)
     requirements_lock_paths = attr.ib(
         type=List[str], default=attr.Factory(list), kw_only=True
     )
+    base_lock_paths = attr.ib(type=List[str], default=attr.Factory(list), kw_only=True)
+    prune_exclude = attr.ib(type=List[str], default=attr.Factory(list), kw_only=True)
+    prune_include = attr.ib(type=List[str], default=attr.Factory(list), kw_only=True)
+    bytecode_compilation = attr.ib(
+        type=str,
+        default="none",
+        kw_only=True,
+        validator=attr.validators.in_(BYTECODE_COMPILATIONS),
+    )
+    lock_file_hashing = attr.ib(
+        type=str,
+        default="content",
+        kw_only=True,
+        validator=attr.validators.in_(LOCK_FILE_HASHINGS),
+    )
+    entry_format = attr.ib(
+        type=str,
+        default="tree",
+        kw_only=True,
+        validator=attr.validators.in_(ENTRY_FORMATS),
+    )
+    copy_strategy = attr.ib(
+        type=str,
+        default="copy",
+        kw_only=True,
+        validator=_validate_copy_strategy,
+    )
+    copy_workers = attr.ib(
+        type=int,
+        default=8,
+        kw_only=True,
+        validator=[attr.validators.instance_of(int), attr.validators.ge(1)],
+    )
+    restore_mode = attr.ib(
+        type=str,
+        default="replace",
+        kw_only=True,
+        validator=attr.validators.in_(RESTORE_MODES),
+    )
+    restore_fallback = attr.ib(
+        type=str,
+        default="none",
+        kw_only=True,
+        validator=attr.validators.in_(RESTORE_FALLBACKS),
+    )
+    sync_check = attr.ib(
+        type=str,
+        default="metadata",
+        kw_only=True,
+        validator=attr.validators.in_(SYNC_CHECKS),
+    )
+    restore_verify = attr.ib(
+        type=str,
+        default="none",
+        kw_only=True,
+        validator=attr.validators.in_(VERIFY_MODES),
+    )
+    verify_sample = attr.ib(
+        type=float,
+        default=1.0,
+        kw_only=True,
+        validator=[
+            attr.validators.instance_of((int, float)),
+            attr.validators.gt(0),
+            attr.validators.le(1),
+        ],
+    )
+    relocation = attr.ib(
+        type=str,
+        default="rewrite",
+        kw_only=True,
+        validator=attr.validators.in_(RELOCATIONS),
+    )
+    archive_compression = attr.ib(
+        type=str,
+        default="zstd",
+        kw_only=True,
+        validator=attr.validators.in_(ARCHIVE_COMPRESSIONS),
+    )
+    archive_compression_level = attr.ib(
+        type=int,
+        default=3,
+        kw_only=True,
+        validator=_validate_archive_compression_level,
+    )
+    s3_endpoint_url = attr.ib(type=str, default="", kw_only=True)
+    s3_region = attr.ib(type=str, default="us-east-1", kw_only=True)
+    remote_entry_format = attr.ib(
+        type=str,
+        default="archive",
+        kw_only=True,
+        validator=attr.validators.in_(REMOTE_ENTRY_FORMATS),
+    )
+    transfer_part_size = attr.ib(
+        type=int,
+        default=8 * 1024 * 1024,
+        kw_only=True,
+        validator=[attr.validators.instance_of(int), attr.validators.ge(MIN_PART_SIZE)],
+    )
+    environments = attr.ib(
+        type=Dict[str, Dict[str, Any]],
+        default=attr.Factory(dict),
+        kw_only=True,
+        validator=attr.validators.instance_of(dict),
+    )
+    environment_workers = attr.ib(
+        type=int,
+        default=4,
+        kw_only=True,
+        validator=[attr.validators.instance_of(int), attr.validators.ge(1)],
+    )
 
     @property
     def expanded_cache_path(self) -> str:
@@ -47,6 +277,37 @@ class Config:
         """Expand any environment variables stored in the `virtualenv_path` configuration option."""
         return os.path.expandvars(self.virtualenv_path)
 
+    def get_environments(self) -> Dict[str, "Config"]:
+        """Get configuration of each environment stated in the `environments' configuration option.
+
+        Options not stated for an environment are taken from the configuration the environments are stated in.
+        """
+        result = {}
+        for name, options in self.environments.items():
+            if not isinstance(options, dict):
+                raise VirtualenvCacheConfigError(
+                    f"Configuration of environment {name!r} is not a table"
+                )
+
+            for option in ("environments", "environment_workers"):
+                if option in options:
+                    raise VirtualenvCacheConfigError(
+                        f"Option {option!r} cannot be stated for environment {name!r}"
+                    )
+
+            try:
+                result[name] = attr.evolve(self, environments={}, **options)
+            except TypeError as exc:
+                raise VirtualenvCacheConfigError(
+                    f"Invalid configuration of environment {name!r}: {exc}"
+                ) from exc
+            except ValueError as exc:
+                raise VirtualenvCacheConfigError(
+                    f"Invalid configuration of environment {name!r}: {exc.args[0]}"
+                ) from exc
+
+        return result
+
     @classmethod
     def create(cls, config_path: str) -> "Config":
         """Create a configuration file and write it to the given path."""
@@ -100,4 +361,20 @@ class Config:
             else:
                 setattr(config, k, v)
 
+        try:
+            attr.validate(config)
+        except ValueError as exc:
+            raise VirtualenvCacheConfigError(
+                f"Invalid configuration in {config_path!r}: {exc.args[0]}"
+            ) from exc
+
+        _check_backend_options(config)
+        for name, environment in config.get_environments().items():
+            try:
+                _check_backend_options(environment)
+            except VirtualenvCacheConfigError as exc:
+                raise VirtualenvCacheConfigError(
+                    f"Invalid configuration of environment {name!r}: {exc}"
+                ) from exc
+
         return config
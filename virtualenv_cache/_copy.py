@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+import errno
+import logging
+import os
+import shutil
+from typing import Collection
+from typing import Dict
+from typing import Tuple
+
+from ._manifest import Manifest
+from ._manifest import ManifestRecord
+from .utils import parallel_map
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore
+
+_LOGGER = logging.getLogger(__name__)
+
+COPY_STRATEGIES = ("copy", "hardlink", "reflink")
+
+# Errors signalizing the filesystem cannot link the given files (e.g. different devices).
+_LINK_UNSUPPORTED_ERRNOS = frozenset(
+    (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP)
+)
+# Errors signalizing the filesystem cannot clone the given files.
+_CLONE_UNSUPPORTED_ERRNOS = frozenset(
+    (errno.EXDEV, errno.EINVAL, errno.ENOTSUP, errno.EOPNOTSUPP, errno.ENOTTY)
+)
+# The FICLONE ioctl request as defined in linux/fs.h.
+_FICLONE = 0x40049409
+
+# Pairs of (source device, destination device) with known support of cloning files.
+_CLONE_SUPPORTED: Dict[Tuple[int, int], bool] = {}
+
+
+def _copy_range(src_fd: int, dst_fd: int, size: int) -> bool:
+    """Copy file content in kernel using copy_file_range, which shares extents on CoW filesystems."""
+    if not hasattr(os, "copy_file_range"):
+        return False
+
+    copied = 0
+    try:
+        while copied < size:
+            chunk_size = os.copy_file_range(src_fd, dst_fd, size - copied)
+            if chunk_size == 0:
+                break
+            copied += chunk_size
+    except OSError as exc:
+        if exc.errno not in _CLONE_UNSUPPORTED_ERRNOS | {errno.ENOSYS}:
+            raise
+        return False
+
+    return copied == size
+
+
+def _clone(src: str, dst: str) -> bool:
+    """Try to clone the source file into the destination, return True if the file was cloned."""
+    if fcntl is None:
+        return False
+
+    devices = (os.stat(src).st_dev, os.stat(os.path.dirname(dst) or ".").st_dev)
+    if _CLONE_SUPPORTED.get(devices) is False:
+        return False
+
+    with open(src, "rb") as src_f, open(dst, "wb") as dst_f:
+        try:
+            fcntl.ioctl(dst_f.fileno(), _FICLONE, src_f.fileno())
+            _CLONE_SUPPORTED[devices] = True
+            return True
+        except OSError as exc:
+            if exc.errno not in _CLONE_UNSUPPORTED_ERRNOS:
+                raise
+
+        # Different filesystems cannot share extents at all.
+        if devices[0] == devices[1] and _copy_range(
+            src_f.fileno(), dst_f.fileno(), os.fstat(src_f.fileno()).st_size
+        ):
+            return True
+
+    _LOGGER.debug(
+        "Filesystem does not support cloning %r to %r, falling back to copy", src, dst
+    )
+    _CLONE_SUPPORTED[devices] = False
+    return False
+
+
+def copy_file(src: str, dst: str, *, strategy: str = "copy") -> str:
+    """Materialize the source file in the destination, return the strategy that was actually used.
+
+    If the requested strategy is not supported for the given files, a regular copy is performed.
+    """
+    if strategy == "hardlink":
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except OSError as exc:
+            if exc.errno not in _LINK_UNSUPPORTED_ERRNOS:
+                raise
+            _LOGGER.debug(
+                "Cannot hardlink %r to %r, falling back to copy: %s", src, dst, exc
+            )
+    elif strategy == "reflink" and _clone(src, dst):
+        shutil.copystat(src, dst)
+        return "reflink"
+
+    shutil.copy2(src, dst)
+    return "copy"
+
+
+def get_store_strategy(strategy: str) -> str:
+    """Get a copy strategy safe to be used when storing files to the cache.
+
+    Hardlinks would make cached files share content with the virtual environment that can be further modified.
+    """
+    return "copy" if strategy == "hardlink" else strategy
+
+
+def copy_tree(
+    src: str,
+    dst: str,
+    *,
+    strategy: str = "copy",
+    workers: int = 1,
+    exclude: Collection[str] = (),
+) -> int:
+    """Copy a directory tree, return number of files copied.
+
+    All the directories are created ahead, files are then copied by a pool of worker threads. Symlinks are
+    preserved and permissions are kept as `shutil.copytree' does. The destination directory must not exist.
+    """
+    manifest = Manifest.from_directory(src, digests=False, exclude=exclude)
+
+    os.makedirs(dst)
+    files = []
+    for record in manifest.records.values():
+        dst_path = os.path.join(dst, *record.path.split("/"))
+        if record.type == ManifestRecord.DIRECTORY:
+            os.mkdir(dst_path)
+        elif record.type == ManifestRecord.SYMLINK:
+            os.symlink(record.target, dst_path)
+        else:
+            files.append((os.path.join(src, *record.path.split("/")), dst_path))
+
+    parallel_map(lambda item: copy_file(*item, strategy=strategy), files, workers)
+
+    # Directory metadata are adjusted once populated, they can be read-only.
+    for record in reversed(list(manifest.records.values())):
+        if record.type == ManifestRecord.DIRECTORY:
+            rel_path = record.path.split("/")
+            shutil.copystat(os.path.join(src, *rel_path), os.path.join(dst, *rel_path))
+    shutil.copystat(src, dst)
+
+    return len(files)
@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+
+import builtins
+import json
+import logging
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+import traceback
+from typing import Any
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+from typing import Type
+
+import attr
+
+from ._cache import Cache
+from ._config import Config
+from ._environments import ENVIRONMENT_COMMANDS
+from ._environments import get_hasher_key
+from ._environments import run_environments
+from ._exceptions import VirtualenvCacheConfigError
+from ._exceptions import VirtualenvCacheException
+from ._exceptions import VirtualenvCacheMiss
+from ._exceptions import VirtualenvCachePartialHit
+from ._exceptions import VirtualenvCacheStorageError
+from ._lockfiles import LockFileHasher
+from ._metrics import Metrics
+from .utils import cwd
+
+_LOGGER = logging.getLogger(__name__)
+
+COMMANDS = ("restore", "store", "list", "erase", "verify")
+
+# Exceptions raised in the daemon are raised again in the client, as are built-in exceptions.
+_EXCEPTIONS = {
+    e.__name__: e
+    for e in (
+        VirtualenvCacheConfigError,
+        VirtualenvCacheException,
+        VirtualenvCacheMiss,
+        VirtualenvCacheStorageError,
+    )
+}
+
+
+class _RemoteTraceback(Exception):
+    """The traceback of an exception raised in the daemon, set as the cause of the exception raised in the client."""
+
+    def __str__(self) -> str:
+        return f"\n\n{self.args[0]}"
+
+
+def _describe_exception(exc: Exception) -> Dict[str, Any]:
+    """Describe the given exception so that it can be raised again in the client, see _rebuild_exception()."""
+    args = list(exc.args)
+    if isinstance(exc, OSError) and exc.filename is not None:
+        # File names are not part of arguments of OS errors.
+        args = [exc.errno, exc.strerror, exc.filename, None, exc.filename2]
+    try:
+        json.dumps(args)
+    except (TypeError, ValueError):
+        args = [str(exc)]
+
+    return {
+        "type": type(exc).__name__,
+        "message": str(exc),
+        "args": args,
+        "traceback": "".join(
+            traceback.format_exception(type(exc), exc, exc.__traceback__)
+        ),
+    }
+
+
+def _get_exception_class(name: str) -> Optional[Type[Exception]]:
+    """Get the class of an exception of the given name that can be raised in the client, if known."""
+    exc_class = _EXCEPTIONS.get(name, getattr(builtins, name, None))
+    if isinstance(exc_class, type) and issubclass(exc_class, Exception):
+        return exc_class
+
+    return None
+
+
+def _rebuild_exception(error: Dict[str, Any]) -> Exception:
+    """Create an exception of the same type and arguments as the one described by the daemon.
+
+    Exceptions of other types (e.g. raised by third-party libraries) are turned into VirtualenvCacheException
+    stating the original type. The traceback from the daemon is set as the cause.
+    """
+    exc: Optional[Exception] = None
+    exc_class = _get_exception_class(error["type"])
+    if exc_class is not None:
+        try:
+            exc = exc_class(*error.get("args", [error["message"]]))
+        except TypeError:
+            exc = None
+
+    if exc is None:
+        exc = VirtualenvCacheException(f"{error['type']}: {error['message']}")
+
+    if error.get("traceback"):
+        exc.__cause__ = _RemoteTraceback(error["traceback"])
+    return exc
+
+
+def get_socket_path() -> str:
+    """Get path to the Unix socket the daemon listens on, it can be adjusted using VIRTUALENV_CACHE_SOCKET."""
+    socket_path = os.getenv("VIRTUALENV_CACHE_SOCKET")
+    if socket_path:
+        return socket_path
+
+    runtime_dir = os.getenv("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(runtime_dir, f"virtualenv-cache-{os.getuid()}.sock")
+
+
+def run_command(
+    cache: Cache,
+    command: str,
+    *,
+    hashers: Optional[Dict[Tuple[str, ...], LockFileHasher]] = None,
+) -> Any:
+    """Run the given command on the cache, return its JSON serializable result.
+
+    If environments are stated in the configuration, the restore and store commands are run on all of them and
+    reports about environments are returned, see run_environments().
+    """
+    if cache.config.environments and command in ENVIRONMENT_COMMANDS:
+        return run_environments(
+            cache.config, command, metrics=cache.metrics, hashers=hashers
+        )
+
+    if command == "restore":
+        cache.restore()
+    elif command == "store":
+        try:
+            cache.store()
+        finally:
+            cache.wait()
+    elif command == "store-base":
+        try:
+            cache.store_base()
+        finally:
+            cache.wait()
+    elif command == "list":
+        return cache.list()
+    elif command == "erase":
+        cache.erase()
+    elif command == "verify":
+        return cache.verify()
+    else:
+        raise ValueError(f"Unknown command {command!r}")
+
+    return None
+
+
+class _LogForwarder(logging.Handler):
+    """Forward log records emitted while serving a request to the client."""
+
+    def __init__(self, send: Any, level: int) -> None:
+        """Send records using the given function."""
+        super().__init__(level)
+        self._send = send
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Send the record to the client, errors are ignored as the client can be gone."""
+        try:
+            self._send(
+                {
+                    "log": {
+                        "name": record.name,
+                        "levelno": record.levelno,
+                        "levelname": record.levelname,
+                        "msg": record.getMessage(),
+                    }
+                }
+            )
+        except OSError:
+            pass
+
+
+@attr.s(slots=True)
+class CacheDaemon:
+    """Serve cache commands over a Unix socket, keeping digests of lock files in memory.
+
+    Requests are served one at a time - each of them runs in the working directory and the environment of its client.
+    """
+
+    socket_path = attr.ib(type=str)
+    _hashers = attr.ib(
+        type=Dict[Tuple[str, ...], LockFileHasher], factory=dict, init=False
+    )
+    _lock = attr.ib(type=threading.Lock, factory=threading.Lock, init=False)
+    _server = attr.ib(
+        type=Optional[socketserver.ThreadingUnixStreamServer], default=None, init=False
+    )
+
+    def _get_cache(self, config_path: str, metrics: Metrics) -> Cache:
+        """Create a cache for the given configuration, reusing state kept from previous requests."""
+        config = Config.load(config_path)
+        hasher_key = get_hasher_key(config)
+        cache = Cache(
+            config=config,
+            lock_file_hasher=self._hashers.get(hasher_key),
+            metrics=metrics,
+        )
+        self._hashers[hasher_key] = cache._get_lock_file_hasher()
+        return cache
+
+    def handle(self, request: Dict[str, Any], send: Any) -> Dict[str, Any]:
+        """Serve the given request, log records are sent using the given function while serving it.
+
+        Metrics collected while serving the request are sent in the response, regardless of its outcome.
+        """
+        metrics = Metrics()
+        response = self._handle(request, send, metrics)
+        response["metrics"] = metrics.to_dict()
+        return response
+
+    def _handle(
+        self, request: Dict[str, Any], send: Any, metrics: Metrics
+    ) -> Dict[str, Any]:
+        """Run the command stated in the request, return the response without metrics."""
+        forwarder = _LogForwarder(
+            send, logging.DEBUG if request.get("verbose") else logging.INFO
+        )
+        package_logger = logging.getLogger(__package__)
+        with self._lock:
+            environ = dict(os.environ)
+            level = package_logger.level
+            logging.getLogger().addHandler(forwarder)
+            if request.get("verbose"):
+                package_logger.setLevel(logging.DEBUG)
+            try:
+                os.environ.clear()
+                os.environ.update(request.get("environment", {}))
+                with cwd(request["work_dir"]):
+                    cache = self._get_cache(request["config_path"], metrics)
+                    return {
+                        "result": run_command(
+                            cache, request["command"], hashers=self._hashers
+                        )
+                    }
+            except VirtualenvCachePartialHit as exc:
+                return {
+                    "error": {
+                        "type": type(exc).__name__,
+                        "message": str(exc),
+                        "install": exc.install,
+                        "remove": exc.remove,
+                    }
+                }
+            except Exception as exc:
+                _LOGGER.debug("Failed to serve request %r", request, exc_info=True)
+                return {"error": _describe_exception(exc)}
+            finally:
+                os.environ.clear()
+                os.environ.update(environ)
+                package_logger.setLevel(level)
+                logging.getLogger().removeHandler(forwarder)
+
+    def serve_forever(self) -> None:
+        """Listen on the socket until interrupted, the socket is removed on exit."""
+        if DaemonClient.connect(self.socket_path) is not None:
+            raise VirtualenvCacheException(
+                f"A daemon is already listening on {self.socket_path!r}"
+            )
+
+        if os.path.exists(self.socket_path):
+            # A socket left behind by a daemon that is not running anymore.
+            os.unlink(self.socket_path)
+
+        daemon = self
+
+        class _RequestHandler(socketserver.StreamRequestHandler):
+            """Read a request and write log records followed by the response, each as a JSON line."""
+
+            def setup(self) -> None:
+                super().setup()
+                # Records can be emitted by threads running in background, e.g. by uploads to the shared tier.
+                self.send_lock = threading.Lock()
+
+            def _send(self, message: Dict[str, Any]) -> None:
+                with self.send_lock:
+                    self.wfile.write(json.dumps(message).encode() + b"\n")
+                    self.wfile.flush()
+
+            def handle(self) -> None:
+                try:
+                    request = json.loads(self.rfile.readline())
+                except ValueError as exc:
+                    self._send({"error": {"type": "ValueError", "message": str(exc)}})
+                    return
+
+                self._send(daemon.handle(request, self._send))
+
+        old_umask = os.umask(0o177)
+        try:
+            server = socketserver.ThreadingUnixStreamServer(
+                self.socket_path, _RequestHandler
+            )
+        finally:
+            os.umask(old_umask)
+
+        _LOGGER.info("Listening on %r", self.socket_path)
+        self._server = server
+        try:
+            with server:
+                server.serve_forever()
+        finally:
+            self._server = None
+            os.unlink(self.socket_path)
+
+    def shutdown(self) -> None:
+        """Stop listening, requests being served are finished."""
+        if self._server is not None:
+            self._server.shutdown()
+
+
+@attr.s(slots=True)
+class DaemonClient:
+    """A client running cache commands in a daemon."""
+
+    socket_path = attr.ib(type=str)
+    _socket = attr.ib(type=socket.socket, repr=False)
+
+    @classmethod
+    def connect(cls, socket_path: Optional[str] = None) -> Optional["DaemonClient"]:
+        """Connect to the daemon, None if no daemon is running."""
+        if not hasattr(socket, "AF_UNIX"):
+            return None
+
+        socket_path = socket_path or get_socket_path()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            sock.close()
+            return None
+
+        return cls(socket_path, sock)
+
+    def call(
+        self,
+        command: str,
+        *,
+        config_path: str,
+        work_dir: str,
+        verbose: bool = False,
+        metrics: Optional[Metrics] = None,
+    ) -> Any:
+        """Run the given command in the daemon, log records emitted are handled as if emitted in this process.
+
+        Metrics collected by the daemon are added to the given metrics, if any.
+        """
+        request = {
+            "command": command,
+            "config_path": os.path.abspath(config_path),
+            "work_dir": os.path.abspath(work_dir),
+            "environment": dict(os.environ),
+            "verbose": verbose,
+        }
+        _LOGGER.debug(
+            "Running command %r in daemon listening on %r", command, self.socket_path
+        )
+        with self._socket, self._socket.makefile("rwb") as f:
+            f.write(json.dumps(request).encode() + b"\n")
+            f.flush()
+            for line in f:
+                message = json.loads(line)
+                if "log" in message:
+                    record = logging.makeLogRecord(message["log"])
+                    logging.getLogger(record.name).handle(record)
+                    continue
+
+                if metrics is not None and "metrics" in message:
+                    metrics.update(message["metrics"])
+
+                if "error" not in message:
+                    return message["result"]
+
+                error = message["error"]
+                if error["type"] == VirtualenvCachePartialHit.__name__:
+                    raise VirtualenvCachePartialHit(
+                        error["message"],
+                        install=error["install"],
+                        remove=error["remove"],
+                    )
+
+                raise _rebuild_exception(error)
+
+        raise VirtualenvCacheException(
+            f"Daemon listening on {self.socket_path!r} closed the connection"
+        )
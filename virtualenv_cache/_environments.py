@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from ._cache import Cache
+from ._config import Config
+from ._exceptions import VirtualenvCacheMiss
+from ._exceptions import VirtualenvCachePartialHit
+from ._lockfiles import LockFileHasher
+from ._metrics import Metrics
+
+_LOGGER = logging.getLogger(__name__)
+
+ENVIRONMENT_COMMANDS = ("restore", "store", "store-base")
+
+
+def get_hasher_key(config: Config) -> Tuple[str, ...]:
+    """Get a key identifying lock file hashers that can be shared by caches using the given configuration."""
+    return (
+        config.expanded_cache_path,
+        config.lock_file_hashing,
+        str(config.copy_workers),
+    )
+
+
+def _run_environment(cache: Cache, name: str, command: str) -> Dict[str, Any]:
+    """Run the given command on the cache of one environment, return a report stating its outcome.
+
+    Failures are stated in the report so that other environments are not affected.
+    """
+    report: Dict[str, Any] = {
+        "environment": name,
+        "virtualenv_path": cache.config.virtualenv_path,
+    }
+    start = time.monotonic()
+    _LOGGER.info("Running %s of environment %r", command, name)
+    try:
+        if command == "restore":
+            cache.restore()
+        elif command == "store":
+            try:
+                cache.store()
+            finally:
+                cache.wait()
+        else:
+            try:
+                cache.store_base()
+            finally:
+                cache.wait()
+    except VirtualenvCachePartialHit as exc:
+        report["install"] = exc.install
+        report["remove"] = exc.remove
+        report["message"] = str(exc)
+    except VirtualenvCacheMiss as exc:
+        report["message"] = str(exc)
+    except Exception as exc:
+        _LOGGER.exception("Failed to %s environment %r: %s", command, name, exc)
+        report["outcome"] = "error"
+        report["message"] = str(exc)
+
+    report["duration_seconds"] = time.monotonic() - start
+    if "outcome" not in report:
+        operation = "restore" if command == "restore" else "store"
+        report["outcome"] = cache.metrics.to_dict()["operations"][operation]["outcome"]
+
+    _LOGGER.info(
+        "Finished %s of environment %r in %.2f seconds: %s",
+        command,
+        name,
+        report["duration_seconds"],
+        report["outcome"],
+    )
+    return report
+
+
+def run_environments(
+    config: Config,
+    command: str,
+    *,
+    metrics: Optional[Metrics] = None,
+    hashers: Optional[Dict[Tuple[str, ...], LockFileHasher]] = None,
+) -> List[Dict[str, Any]]:
+    """Run the given command on all the environments stated in the configuration using a pool of worker threads.
+
+    Return a report for each environment, in the order environments are stated. Metrics of each environment are
+    added to the given metrics with operations prefixed by the environment name (e.g. "backend/restore"). Lock file
+    hashers are shared by environments, and kept in hashers if given.
+    """
+    if command not in ENVIRONMENT_COMMANDS:
+        raise ValueError(f"Command {command!r} cannot be run on environments")
+
+    hashers = hashers if hashers is not None else {}
+    caches = {}
+    for name, environment_config in config.get_environments().items():
+        cache = Cache(
+            config=environment_config,
+            lock_file_hasher=hashers.get(get_hasher_key(environment_config)),
+        )
+        hashers[get_hasher_key(environment_config)] = cache._get_lock_file_hasher()
+        caches[name] = cache
+
+    _LOGGER.info(
+        "Running %s of %d environments using %d workers",
+        command,
+        len(caches),
+        config.environment_workers,
+    )
+    with ThreadPoolExecutor(max_workers=config.environment_workers) as executor:
+        reports = list(
+            executor.map(
+                lambda item: _run_environment(item[1], item[0], command),
+                caches.items(),
+            )
+        )
+
+    if metrics is not None:
+        for name, cache in caches.items():
+            metrics.update(
+                {
+                    "operations": {
+                        f"{name}/{operation}": record
+                        for operation, record in cache.metrics.to_dict()[
+                            "operations"
+                        ].items()
+                    }
+                }
+            )
+
+    return reports
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+
+# Each policy assigns a priority to an entry, entries with the lowest priority are evicted first. Entries passed
+# are sorted by their last use, the most recently used first - the position is used to break ties.
+_EvictionPolicy = Callable[[Dict[str, Any], int], Any]
+
+
+def gdsf_priority(entry: Dict[str, Any]) -> float:
+    """Compute the Greedy-Dual-Size-Frequency priority of the given entry with uniform cost.
+
+    The priority is raised by the inflation value the entry got when it was used last time - the inflation value
+    grows with priorities of evicted entries, so entries not used for a long time are evicted despite many hits.
+    """
+    return entry.get("inflation", 0.0) + (entry["hits"] + 1) / max(
+        entry["size"] or 1, 1
+    )
+
+
+EVICTION_POLICIES: Dict[str, _EvictionPolicy] = {
+    # Least recently used.
+    "lru": lambda entry, position: -position,
+    # Least frequently used.
+    "lfu": lambda entry, position: (entry["hits"], -position),
+    # Greedy-Dual-Size-Frequency with uniform cost - small and frequently used entries are preferred.
+    "gdsf": lambda entry, position: (gdsf_priority(entry), -position),
+}
+
+
+def register_eviction_policy(name: str, policy: _EvictionPolicy) -> None:
+    """Register a custom eviction policy that can be referenced in the configuration file."""
+    EVICTION_POLICIES[name] = policy
+
+
+def select_victims(
+    entries: List[Dict[str, Any]],
+    *,
+    policy: str,
+    max_entries: int,
+    max_bytes: int = 0,
+    keep: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Select entries to be evicted so that the cache respects configured limits.
+
+    The byte limit is not checked if set to zero. The entry stated in keep is never evicted.
+    """
+    policy_func = EVICTION_POLICIES[policy]
+    candidates = sorted(
+        (
+            (policy_func(entry, position), entry)
+            for position, entry in enumerate(entries)
+            if entry["id"] != keep
+        ),
+        key=lambda item: item[0],
+    )
+
+    count = len(entries)
+    total_bytes = sum(entry["size"] or 0 for entry in entries)
+    victims = []
+    for _, entry in candidates:
+        if count <= max_entries and (not max_bytes or total_bytes <= max_bytes):
+            break
+
+        victims.append(entry)
+        count -= 1
+        total_bytes -= entry["size"] or 0
+
+    return victims
@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 
+from typing import List
+
 
 class VirtualenvCacheException(Exception):
     """A base class in the exceptions hierarchy for implementing exceptions."""
@@ -9,5 +11,19 @@ class VirtualenvCacheMiss(VirtualenvCacheException):
     """An exception raised when there is no matching entry in the cache."""
 
 
+class VirtualenvCachePartialHit(VirtualenvCacheMiss):
+    """An exception raised when the nearest cache entry was restored as there is no matching entry in the cache."""
+
+    def __init__(self, message: str, *, install: List[str], remove: List[str]) -> None:
+        """Keep packages that need to be installed and removed to match requirements."""
+        super().__init__(message)
+        self.install = install
+        self.remove = remove
+
+
 class VirtualenvCacheConfigError(VirtualenvCacheException):
     """An exception raised on an issue with a configuration file."""
+
+
+class VirtualenvCacheStorageError(VirtualenvCacheException):
+    """An exception raised on an issue with a storage backend."""
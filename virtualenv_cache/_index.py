@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+import sqlite3
+from contextlib import contextmanager
+from typing import Any
+from typing import Dict
+from typing import Generator
+from typing import Iterable
+from typing import List
+from typing import Optional
+
+import attr
+
+_LOGGER = logging.getLogger(__name__)
+
+_SCHEMA = """\
+CREATE TABLE IF NOT EXISTS entries (
+    id TEXT PRIMARY KEY,
+    datetime TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    hostname TEXT NOT NULL,
+    size INTEGER,
+    hits INTEGER NOT NULL DEFAULT 0,
+    inflation REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS entries_timestamp ON entries (timestamp);
+CREATE TABLE IF NOT EXISTS clock (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    inflation REAL NOT NULL
+);
+"""
+
+_COLUMNS = ("id", "datetime", "hostname", "size", "hits")
+
+
+@attr.s(slots=True)
+class CacheIndex:
+    """A persistent index of cache entries kept in an SQLite database in the cache root.
+
+    The index is a derived data structure - it can be rebuilt from cache entries if lost.
+    """
+
+    path = attr.ib(type=str)
+
+    def exists(self) -> bool:
+        """Check whether the index was already created."""
+        return os.path.isfile(self.path)
+
+    @contextmanager
+    def _transaction(self) -> Generator[sqlite3.Connection, None, None]:
+        """Open the index and run statements in a single transaction."""
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                connection.executescript(_SCHEMA)
+                columns = {
+                    row[1] for row in connection.execute("PRAGMA table_info(entries)")
+                }
+                if "inflation" not in columns:
+                    # An index created by an older version.
+                    connection.execute(
+                        "ALTER TABLE entries ADD COLUMN inflation REAL NOT NULL DEFAULT 0"
+                    )
+                yield connection
+        finally:
+            connection.close()
+
+    def check(self) -> None:
+        """Check the index can be used, raise sqlite3.DatabaseError if it is corrupted."""
+        with self._transaction() as connection:
+            connection.execute("SELECT id FROM entries LIMIT 1").fetchall()
+
+    @staticmethod
+    def _to_record(row: Iterable[Any]) -> Dict[str, Any]:
+        """Convert a row from the database to a record about a cache entry."""
+        return dict(zip(_COLUMNS, row))
+
+    def get(self, entry_id: str) -> Optional[Dict[str, Any]]:
+        """Get a record about the given cache entry."""
+        with self._transaction() as connection:
+            row = connection.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM entries WHERE id = ?", (entry_id,)
+            ).fetchone()
+
+        return self._to_record(row) if row is not None else None
+
+    def list(self) -> List[Dict[str, Any]]:
+        """List records about all the cache entries, the most recently used first."""
+        with self._transaction() as connection:
+            rows = connection.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM entries ORDER BY timestamp DESC"
+            ).fetchall()
+
+        return [self._to_record(row) for row in rows]
+
+    def touch(
+        self,
+        entry_id: str,
+        *,
+        datetime: str,
+        timestamp: float,
+        hostname: str,
+        hit: bool = False,
+        size: Optional[int] = None,
+    ) -> None:
+        """Record use of the given cache entry, a hit is recorded on restore.
+
+        The entry gets the current inflation value, see `inflate'.
+        """
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT INTO entries (id, datetime, timestamp, hostname, size, hits, inflation) "
+                "VALUES (?, ?, ?, ?, ?, ?, COALESCE((SELECT inflation FROM clock), 0)) "
+                "ON CONFLICT (id) DO UPDATE SET "
+                "datetime = excluded.datetime, timestamp = excluded.timestamp, hostname = excluded.hostname, "
+                "size = COALESCE(excluded.size, size), hits = hits + excluded.hits, inflation = excluded.inflation",
+                (entry_id, datetime, timestamp, hostname, size, int(hit)),
+            )
+
+    def get_inflations(self) -> Dict[str, float]:
+        """Get the inflation value each cache entry got when it was used last time."""
+        with self._transaction() as connection:
+            rows = connection.execute("SELECT id, inflation FROM entries").fetchall()
+
+        return dict(rows)
+
+    def inflate(self, value: float) -> None:
+        """Raise the inflation value to the given one, entries used from now on get it.
+
+        The value is raised to the priority of each entry evicted by the "gdsf" eviction policy, so that entries
+        which were frequently used long ago age out.
+        """
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT INTO clock (id, inflation) VALUES (0, ?) "
+                "ON CONFLICT (id) DO UPDATE SET inflation = MAX(inflation, excluded.inflation)",
+                (value,),
+            )
+
+    def set_size(self, entry_id: str, size: int) -> None:
+        """Set size of the given cache entry."""
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE entries SET size = ? WHERE id = ?", (size, entry_id)
+            )
+
+    def remove(self, entry_id: str) -> None:
+        """Remove record about the given cache entry."""
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM entries WHERE id = ?", (entry_id,))
+
+    def rebuild(self, records: Iterable[Dict[str, Any]]) -> None:
+        """Atomically replace content of the index with the given records."""
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM entries")
+            connection.execute("DELETE FROM clock")
+            connection.executemany(
+                "INSERT INTO entries (id, datetime, timestamp, hostname, size, hits) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        r["id"],
+                        r["datetime"],
+                        r["timestamp"],
+                        r["hostname"],
+                        r.get("size"),
+                        r.get("hits", 0),
+                    )
+                    for r in records
+                ),
+            )
+
+    def drop(self) -> None:
+        """Remove the index, it will be rebuilt on next use."""
+        for suffix in ("", "-journal"):
+            if os.path.exists(self.path + suffix):
+                os.unlink(self.path + suffix)
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import attr
+import tomli
+
+from ._exceptions import VirtualenvCacheConfigError
+from ._manifest import hash_file
+from .utils import parallel_map
+
+_LOGGER = logging.getLogger(__name__)
+
+
+LOCK_FILE_HASHINGS = ("content", "semantic")
+
+_REQUIREMENT_RE = re.compile(
+    r"^(?P<name>[A-Za-z0-9][A-Za-z0-9._-]*)\s*(?:\[(?P<extras>[^\]]*)\])?\s*(?P<specifier>[^;]*)(?:;(?P<marker>.*))?$"
+)
+_HASH_OPTION_RE = re.compile(r"\s*--hash[=\s]\s*(\S+)")
+_COMMENT_RE = re.compile(r"(^|\s+)#.*$")
+
+
+def _is_glob(path: str) -> bool:
+    """Check whether the given path is a glob pattern."""
+    return any(c in path for c in "*?[")
+
+
+def _canonicalize_name(name: str) -> str:
+    """Normalize package name as described in PEP 503."""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def _normalize_whitespace(value: Optional[str]) -> Optional[str]:
+    """Collapse any whitespace in the given value, None for an empty value."""
+    value = " ".join(value.split()) if value else ""
+    return value or None
+
+
+def _package(
+    name: str,
+    version: Optional[str],
+    hashes: List[str],
+    marker: Optional[str],
+    **kwargs: Any,
+) -> Dict[str, Any]:
+    """Create a canonical record about a resolved package."""
+    return {
+        "name": _canonicalize_name(name),
+        "version": _normalize_whitespace(version),
+        "hashes": sorted(set(hashes)),
+        "marker": _normalize_whitespace(marker),
+        **kwargs,
+    }
+
+
+def _parse_requirements(content: str) -> Dict[str, Any]:
+    """Parse a requirements file as produced by pip-tools."""
+    packages = []
+    options = []
+    for line in re.sub(r"\\\r?\n", " ", content).splitlines():
+        line = _COMMENT_RE.sub("", line).strip()
+        if not line:
+            continue
+
+        hashes = _HASH_OPTION_RE.findall(line)
+        line = _HASH_OPTION_RE.sub("", line).strip()
+        match = _REQUIREMENT_RE.match(line)
+        if line.startswith("-") or match is None:
+            # Options or direct references are kept as stated.
+            options.append(_normalize_whitespace(line))
+            continue
+
+        packages.append(
+            _package(
+                match.group("name"),
+                match.group("specifier").replace(" ", ""),
+                hashes,
+                match.group("marker"),
+                extras=sorted(
+                    e.strip()
+                    for e in (match.group("extras") or "").split(",")
+                    if e.strip()
+                ),
+            )
+        )
+
+    return {"packages": packages, "options": sorted(options)}
+
+
+def _parse_pipfile_lock(content: str) -> Dict[str, Any]:
+    """Parse a Pipfile.lock file as produced by Pipenv."""
+    data = json.loads(content)
+    packages = []
+    for section in ("default", "develop"):
+        for name, info in data.get(section, {}).items():
+            packages.append(
+                _package(
+                    name,
+                    info.get("version") or info.get("ref"),
+                    info.get("hashes", []),
+                    info.get("markers"),
+                    section=section,
+                )
+            )
+
+    return {"packages": packages}
+
+
+def _parse_toml_lock(content: str) -> Dict[str, Any]:
+    """Parse a poetry.lock or pdm.lock file, both state resolved packages in the package array."""
+    data = tomli.loads(content)
+    # Older lock file formats state hashes of files in the metadata section.
+    metadata_files = data.get("metadata", {}).get("files", {})
+    packages = []
+    for info in data.get("package", []):
+        files = info.get("files") or metadata_files.get(info["name"], [])
+        packages.append(
+            _package(
+                info["name"],
+                info.get("version"),
+                [f["hash"] for f in files if "hash" in f],
+                info.get("markers") or info.get("marker"),
+                source=info.get("source"),
+            )
+        )
+
+    return {"packages": packages}
+
+
+def _parse_lock_file(path: str) -> Optional[Dict[str, Any]]:
+    """Parse the given lock file based on its name, None is returned if the lock file format is not known."""
+    file_name = os.path.basename(path)
+    if file_name == "Pipfile.lock":
+        parser = _parse_pipfile_lock
+    elif file_name in ("poetry.lock", "pdm.lock"):
+        parser = _parse_toml_lock
+    elif file_name.endswith((".txt", ".in")):
+        parser = _parse_requirements
+    else:
+        return None
+
+    with open(path) as f:
+        return parser(f.read())
+
+
+def _to_requirement(package: Dict[str, Any]) -> str:
+    """Convert a canonical record about a package to a requirement string accepted by pip."""
+    version = package["version"] or ""
+    if version[:1].isalnum():
+        # Poetry and PDM state bare versions.
+        version = f"=={version}"
+
+    extras = f"[{','.join(package['extras'])}]" if package.get("extras") else ""
+    marker = f"; {package['marker']}" if package["marker"] else ""
+    return f"{package['name']}{extras}{version}{marker}"
+
+
+def normalize_lock_file(path: str) -> Optional[bytes]:
+    """Turn the given lock file into a canonical form of the resolved package set.
+
+    None is returned if the lock file format is not known.
+    """
+    result = _parse_lock_file(path)
+    if result is None:
+        return None
+
+    result["packages"].sort(key=lambda p: json.dumps(p, sort_keys=True))
+    return json.dumps(result, sort_keys=True).encode()
+
+
+def load_packages(path: str) -> Optional[Dict[str, str]]:
+    """Load packages resolved in the given lock file as a mapping of package names to requirement strings.
+
+    None is returned if the lock file format is not known.
+    """
+    result = _parse_lock_file(path)
+    if result is None:
+        return None
+
+    return {p["name"]: _to_requirement(p) for p in result["packages"]}
+
+
+def hash_lock_file(path: str, *, semantic: bool = False) -> str:
+    """Compute a SHA-256 digest of the given lock file, optionally of its canonical form."""
+    if semantic:
+        normalized = normalize_lock_file(path)
+        if normalized is not None:
+            return hashlib.sha256(normalized).hexdigest()
+
+        _LOGGER.debug("Unknown lock file format of %r, hashing its content", path)
+
+    return hash_file(path)
+
+
+@attr.s(slots=True)
+class LockFileHasher:
+    """Compute digests of lock files, digests of files not changed are taken from a memo kept on disk.
+
+    The hasher can be shared by caches used from multiple threads, e.g. caches of environments stated in one
+    configuration file.
+    """
+
+    _MEMO_MAX_SIZE = 4096
+    # Files modified recently could be modified again without a change in their mtime, these are not memoized.
+    _RACY_INTERVAL = 2.0
+
+    memo_path = attr.ib(type=Optional[str], default=None)
+    workers = attr.ib(type=int, default=1)
+    semantic = attr.ib(type=bool, default=False)
+    _memo = attr.ib(type=Optional[Dict[str, str]], default=None, init=False)
+    _lock = attr.ib(type=threading.Lock, factory=threading.Lock, init=False)
+
+    @staticmethod
+    def expand(paths: List[str]) -> List[str]:
+        """Expand glob patterns stated in the given paths."""
+        result = []
+        for path in paths:
+            if not _is_glob(path):
+                result.append(path)
+                continue
+
+            matched = sorted(glob.glob(path, recursive=True))
+            if not matched:
+                raise VirtualenvCacheConfigError(
+                    f"No files matching {path!r} stated in the configuration file found"
+                )
+
+            _LOGGER.debug("Pattern %r matched lock files %r", path, matched)
+            result.extend(matched)
+
+        return result
+
+    def _load_memo(self) -> Dict[str, str]:
+        """Load the memo of digests from disk, if available."""
+        if self._memo is not None:
+            return self._memo
+
+        self._memo = {}
+        if self.memo_path is not None and os.path.isfile(self.memo_path):
+            try:
+                with open(self.memo_path) as f:
+                    self._memo = json.load(f)
+            except ValueError as exc:
+                _LOGGER.warning("Ignoring invalid memo %r: %s", self.memo_path, exc)
+
+        return self._memo
+
+    def _save_memo(self) -> None:
+        """Atomically write the memo to disk, if its location exists."""
+        if self.memo_path is None or not os.path.isdir(os.path.dirname(self.memo_path)):
+            return
+
+        memo = self._load_memo()
+        while len(memo) > self._MEMO_MAX_SIZE:
+            # Dicts keep insertion order, the oldest records are dropped first.
+            del memo[next(iter(memo))]
+
+        tmp_path = f"{self.memo_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(memo, f)
+        os.replace(tmp_path, self.memo_path)
+
+    def _get_memo_key(self, path: str) -> Optional[str]:
+        """Get a key identifying the given file and its state, None if the file cannot be memoized."""
+        try:
+            stat_result = os.stat(path)
+        except FileNotFoundError as exc:
+            raise VirtualenvCacheConfigError(
+                f"File {path!r} stated in the configuration file not found"
+            ) from exc
+
+        if time.time() - stat_result.st_mtime < self._RACY_INTERVAL:
+            return None
+
+        return ":".join(
+            str(i)
+            for i in (
+                "semantic" if self.semantic else "content",
+                os.path.realpath(path),
+                stat_result.st_dev,
+                stat_result.st_ino,
+                stat_result.st_size,
+                stat_result.st_mtime_ns,
+            )
+        )
+
+    def hash_files(self, paths: List[str]) -> Dict[str, str]:
+        """Compute SHA-256 digests of the given lock files, glob patterns are expanded."""
+        with self._lock:
+            memo = self._load_memo()
+        keys = [(path, self._get_memo_key(path)) for path in self.expand(paths)]
+
+        def _hash(item: Tuple[str, Optional[str]]) -> str:
+            path, key = item
+            digest = memo.get(key) if key is not None else None
+            if digest is None:
+                _LOGGER.debug("Computing hash for requirements lock file %r", path)
+                digest = hash_lock_file(path, semantic=self.semantic)
+            return digest
+
+        digests = parallel_map(_hash, keys, self.workers)
+
+        with self._lock:
+            modified = False
+            for (_, key), digest in zip(keys, digests):
+                if key is not None and memo.get(key) != digest:
+                    memo[key] = digest
+                    modified = True
+
+            if modified:
+                self._save_memo()
+
+        return {path: digest for (path, _), digest in zip(keys, digests)}
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import os
+from typing import Optional
+
+import attr
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore
+
+
+@attr.s(slots=True)
+class FileLock:
+    """An advisory lock held on a file, the file is created if it does not exist.
+
+    The lock file can be removed by the holder of an exclusive lock, processes waiting for the lock meanwhile
+    notice it and lock the new file instead. Locking is a no-op on platforms without flock.
+    """
+
+    path = attr.ib(type=str)
+    _fd = attr.ib(type=Optional[int], default=None, init=False)
+
+    def acquire(self, *, shared: bool = False, blocking: bool = True) -> bool:
+        """Acquire the lock, return False if not blocking and the lock is held by someone else."""
+        if fcntl is None:  # pragma: no cover
+            return True
+
+        operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        if not blocking:
+            operation |= fcntl.LOCK_NB
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                fcntl.flock(fd, operation)
+            except BlockingIOError:
+                os.close(fd)
+                return False
+
+            # The lock file could be removed while waiting for the lock, the lock has to be held on the file on disk.
+            try:
+                if os.stat(self.path).st_ino == os.fstat(fd).st_ino:
+                    self._fd = fd
+                    return True
+            except FileNotFoundError:
+                pass
+
+            os.close(fd)
+
+    def release(self) -> None:
+        """Release the lock, if held."""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def remove(self) -> None:
+        """Remove the lock file and release the exclusive lock held."""
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        self.release()
+
+    def __enter__(self) -> "FileLock":
+        """Acquire an exclusive lock, waiting for it if needed."""
+        self.acquire()
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        """Release the lock."""
+        self.release()
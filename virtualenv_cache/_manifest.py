@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import posixpath
+from typing import BinaryIO
+from typing import Collection
+from typing import Dict
+from typing import Generator
+from typing import List
+from typing import Optional
+
+import attr
+
+from .utils import parallel_map
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_stream(f: BinaryIO) -> str:
+    """Compute a SHA-256 digest of data read from the given file object in chunks.
+
+    SHA-256 rather than BLAKE2b: hashlib uses OpenSSL for SHA-256, which runs on
+    the SHA extensions of current x86 and ARM CPUs and outpaces the software
+    BLAKE2b implementation. The digests also name objects in the object store,
+    so changing the algorithm would stop deduplication against existing caches.
+    """
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+        digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def hash_file(path: str) -> str:
+    """Compute a SHA-256 digest of the given file, reading it in chunks."""
+    with open(path, "rb") as f:
+        return hash_stream(f)
+
+
+@attr.s(slots=True)
+class ManifestRecord:
+    """A record describing a single item (a directory, a file or a symlink) in a directory tree."""
+
+    DIRECTORY = "directory"
+    FILE = "file"
+    SYMLINK = "symlink"
+
+    path = attr.ib(type=str)
+    type = attr.ib(type=str)
+    mode = attr.ib(type=int, default=0)
+    size = attr.ib(type=int, default=0)
+    mtime_ns = attr.ib(type=int, default=0)
+    digest = attr.ib(type=Optional[str], default=None)
+    target = attr.ib(type=Optional[str], default=None)
+
+    def to_dict(self) -> Dict[str, object]:
+        """Convert the record to a JSON serializable dictionary, omitting unset fields."""
+        return {k: v for k, v in attr.asdict(self).items() if v is not None}
+
+    def is_same(self, other: "ManifestRecord") -> bool:
+        """Check whether the other record describes the same item.
+
+        Files are compared based on their digests if known for both records, based on metadata otherwise.
+        """
+        if self.type != other.type or self.target != other.target:
+            return False
+
+        if self.mode != other.mode:
+            return False
+
+        if self.digest is not None and other.digest is not None:
+            return self.digest == other.digest
+
+        return self.size == other.size and self.mtime_ns == other.mtime_ns
+
+
+@attr.s(slots=True)
+class ManifestDiff:
+    """Differences between two manifests, stated as relative paths."""
+
+    added = attr.ib(type=List[str], factory=list)
+    removed = attr.ib(type=List[str], factory=list)
+    modified = attr.ib(type=List[str], factory=list)
+
+    def __bool__(self) -> bool:
+        """Check whether there are any differences."""
+        return bool(self.added or self.removed or self.modified)
+
+
+@attr.s(slots=True)
+class Manifest:
+    """A listing of all the items in a directory tree together with their metadata."""
+
+    records = attr.ib(type=Dict[str, ManifestRecord], factory=dict)
+    entry_id = attr.ib(type=Optional[str], default=None)
+    # Absolute path to the directory tree described and items stating it, so that they can be relocated.
+    prefix = attr.ib(type=Optional[str], default=None)
+    relocatable = attr.ib(type=List[str], factory=list)
+    # Digest of the manifest of the cache entry the directory tree was restored from or stored to.
+    entry_manifest_digest = attr.ib(type=Optional[str], default=None)
+
+    @staticmethod
+    def _scan(
+        root: str, rel_path: str = "", exclude: Collection[str] = ()
+    ) -> Generator[ManifestRecord, None, None]:
+        """Walk the given directory tree, parent directories are always yielded before their content."""
+        with os.scandir(os.path.join(root, rel_path)) as it:
+            entries = sorted(it, key=lambda e: e.name)
+
+        for entry in entries:
+            entry_rel_path = posixpath.join(rel_path, entry.name)
+            if entry_rel_path in exclude:
+                continue
+
+            stat_result = entry.stat(follow_symlinks=False)
+            if entry.is_symlink():
+                yield ManifestRecord(
+                    path=entry_rel_path,
+                    type=ManifestRecord.SYMLINK,
+                    target=os.readlink(entry.path),
+                )
+            elif entry.is_dir(follow_symlinks=False):
+                yield ManifestRecord(
+                    path=entry_rel_path,
+                    type=ManifestRecord.DIRECTORY,
+                    mode=stat_result.st_mode & 0o7777,
+                )
+                yield from Manifest._scan(root, entry_rel_path, exclude)
+            elif entry.is_file(follow_symlinks=False):
+                yield ManifestRecord(
+                    path=entry_rel_path,
+                    type=ManifestRecord.FILE,
+                    mode=stat_result.st_mode & 0o7777,
+                    size=stat_result.st_size,
+                    mtime_ns=stat_result.st_mtime_ns,
+                )
+
+    @classmethod
+    def from_directory(
+        cls,
+        root: str,
+        *,
+        digests: bool = True,
+        workers: int = 1,
+        exclude: Collection[str] = (),
+    ) -> "Manifest":
+        """Create a manifest describing the given directory tree, optionally computing digests of files.
+
+        Items to be excluded are stated as paths relative to the root directory.
+        """
+        manifest = cls()
+        for record in cls._scan(root, exclude=exclude):
+            manifest.records[record.path] = record
+
+        if digests:
+            manifest.compute_digests(root, workers=workers)
+
+        return manifest
+
+    def compute_digests(self, root: str, *, workers: int = 1) -> int:
+        """Compute digests of files that do not have them computed yet, return number of files hashed."""
+        files = [r for r in self.files() if r.digest is None]
+        file_digests = parallel_map(
+            lambda r: hash_file(os.path.join(root, *r.path.split("/"))),
+            files,
+            workers,
+        )
+        for record, digest in zip(files, file_digests):
+            record.digest = digest
+
+        return len(files)
+
+    @classmethod
+    def load(cls, manifest_path: str) -> "Manifest":
+        """Load a manifest from the given file."""
+        with open(manifest_path) as f:
+            content = json.load(f)
+
+        manifest = cls(
+            entry_id=content.get("entry_id"),
+            prefix=content.get("prefix"),
+            relocatable=content.get("relocatable", []),
+            entry_manifest_digest=content.get("entry_manifest_digest"),
+        )
+        for item in content["records"]:
+            record = ManifestRecord(**item)
+            manifest.records[record.path] = record
+
+        return manifest
+
+    def dump(self, manifest_path: str) -> None:
+        """Atomically write the manifest to the given file."""
+        tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "entry_id": self.entry_id,
+                    "prefix": self.prefix,
+                    "relocatable": self.relocatable,
+                    "entry_manifest_digest": self.entry_manifest_digest,
+                    "records": [r.to_dict() for r in self.records.values()],
+                },
+                f,
+            )
+        os.replace(tmp_path, manifest_path)
+
+    def files(self) -> Generator[ManifestRecord, None, None]:
+        """Iterate over records describing regular files."""
+        return (r for r in self.records.values() if r.type == ManifestRecord.FILE)
+
+    def diff(self, other: "Manifest") -> ManifestDiff:
+        """Compute changes needed to turn this manifest into the other one."""
+        result = ManifestDiff()
+        for path, record in other.records.items():
+            own_record = self.records.get(path)
+            if own_record is None:
+                result.added.append(path)
+            elif not own_record.is_same(record):
+                result.modified.append(path)
+
+        result.removed = [p for p in self.records if p not in other.records]
+        return result
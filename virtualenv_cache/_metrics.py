@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any
+from typing import Dict
+from typing import Generator
+from typing import List
+from typing import Optional
+
+import attr
+
+METRICS_FORMATS = ("json", "openmetrics")
+
+_METRIC_PREFIX = "virtualenv_cache"
+
+
+def _escape_label(value: str) -> str:
+    """Escape a label value as required by the OpenMetrics text format."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+@attr.s(slots=True)
+class Metrics:
+    """Durations of phases and I/O counters collected while running cache operations.
+
+    Operations (restore, store, trim, erase, ...) can be nested, phases and counters are attributed to the innermost
+    operation running in the current thread. Operations and phases run repeatedly are summed up.
+    """
+
+    _operations = attr.ib(type=Dict[str, Dict[str, Any]], factory=dict, init=False)
+    _lock = attr.ib(type=threading.Lock, factory=threading.Lock, init=False)
+    _local = attr.ib(type=threading.local, factory=threading.local, init=False)
+
+    def _stack(self) -> List[str]:
+        """Get operations running in the current thread, the innermost is the last one."""
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack  # type: ignore
+
+    def _record(self) -> Optional[Dict[str, Any]]:
+        """Get the record of the innermost operation running in the current thread, if any."""
+        stack = self._stack()
+        return self._operations[stack[-1]] if stack else None
+
+    @contextmanager
+    def operation(self, name: str) -> Generator[None, None, None]:
+        """Measure the given operation, phases and counters are attributed to it while running."""
+        with self._lock:
+            self._operations.setdefault(
+                name,
+                {
+                    "duration_seconds": 0.0,
+                    "outcome": None,
+                    "files": 0,
+                    "bytes": 0,
+                    "phases": {},
+                },
+            )
+
+        stack = self._stack()
+        stack.append(name)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            stack.pop()
+            with self._lock:
+                self._operations[name]["duration_seconds"] += time.monotonic() - start
+
+    @contextmanager
+    def phase(self, name: str) -> Generator[None, None, None]:
+        """Measure the given phase of the running operation."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            duration = time.monotonic() - start
+            record = self._record()
+            if record is not None:
+                with self._lock:
+                    phases = record["phases"]
+                    phases[name] = phases.get(name, 0.0) + duration
+
+    def add_io(self, *, files: int = 0, size: int = 0) -> None:
+        """Count files and bytes read or written by the running operation."""
+        record = self._record()
+        if record is not None:
+            with self._lock:
+                record["files"] += files
+                record["bytes"] += size
+
+    def set_outcome(self, outcome: str) -> None:
+        """Record the outcome of the running operation (e.g. hit or miss)."""
+        record = self._record()
+        if record is not None:
+            with self._lock:
+                record["outcome"] = outcome
+
+    def update(self, data: Dict[str, Any]) -> None:
+        """Add metrics in the form produced by to_dict(), e.g. metrics collected in another process."""
+        with self._lock:
+            for name, operation in data.get("operations", {}).items():
+                self._operations[name] = {
+                    "duration_seconds": operation["duration_seconds"],
+                    "outcome": operation["outcome"],
+                    "files": operation["files"],
+                    "bytes": operation["bytes"],
+                    "phases": dict(operation["phases"]),
+                }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get all the metrics collected in a form serializable to JSON, including derived throughput."""
+        operations = {}
+        with self._lock:
+            for name, record in self._operations.items():
+                duration = record["duration_seconds"]
+                operations[name] = {
+                    **record,
+                    "phases": dict(record["phases"]),
+                    "files_per_second": record["files"] / duration if duration else 0.0,
+                    "bytes_per_second": record["bytes"] / duration if duration else 0.0,
+                }
+
+        return {"timestamp": time.time(), "operations": operations}
+
+    def to_openmetrics(self) -> str:
+        """Get all the metrics collected in the OpenMetrics text format."""
+        data = self.to_dict()
+        families: Dict[str, List[str]] = {}
+
+        def _add(name: str, value: float, **labels: str) -> None:
+            label_str = ",".join(
+                f'{key}="{_escape_label(label)}"' for key, label in labels.items()
+            )
+            families.setdefault(name, []).append(
+                f"{_METRIC_PREFIX}_{name}{{{label_str}}} {value}"
+            )
+
+        for name, operation in data["operations"].items():
+            _add(
+                "operation_duration_seconds",
+                operation["duration_seconds"],
+                operation=name,
+            )
+            for phase, duration in operation["phases"].items():
+                _add("phase_duration_seconds", duration, operation=name, phase=phase)
+            _add("files", operation["files"], operation=name)
+            _add("bytes", operation["bytes"], operation=name)
+            _add("files_per_second", operation["files_per_second"], operation=name)
+            _add("bytes_per_second", operation["bytes_per_second"], operation=name)
+            if operation["outcome"] is not None:
+                _add("outcome", 1, operation=name, outcome=operation["outcome"])
+
+        lines = []
+        for name, samples in families.items():
+            lines.append(f"# TYPE {_METRIC_PREFIX}_{name} gauge")
+            lines.extend(samples)
+        lines.append(f"# TYPE {_METRIC_PREFIX}_timestamp_seconds gauge")
+        lines.append(f"{_METRIC_PREFIX}_timestamp_seconds {data['timestamp']}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str, *, format: str = "json") -> None:
+        """Atomically write metrics to the given file, so that a scraper never reads a partially written file."""
+        if format == "json":
+            content = json.dumps(self.to_dict(), sort_keys=True, indent=2) + "\n"
+        elif format == "openmetrics":
+            content = self.to_openmetrics()
+        else:
+            raise ValueError(f"Unknown metrics format {format!r}")
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
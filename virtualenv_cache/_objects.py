@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+import threading
+from typing import Set
+
+import attr
+
+from ._copy import copy_file
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@attr.s(slots=True)
+class ObjectStore:
+    """A content-addressable store keeping each distinct file only once, shared by all the cache entries.
+
+    Objects are kept read-only so that a virtual environment with hardlinked files cannot modify them in place.
+    """
+
+    path = attr.ib(type=str)
+
+    @staticmethod
+    def object_name(digest: str, mode: int) -> str:
+        """Get name of an object based on its content digest and permissions."""
+        return f"{digest}-{mode & 0o7555:o}"
+
+    def object_path(self, digest: str, mode: int) -> str:
+        """Get path to an object in the store."""
+        return os.path.join(self.path, digest[:2], self.object_name(digest, mode))
+
+    def add(
+        self, src_path: str, digest: str, mode: int, *, strategy: str = "copy"
+    ) -> bool:
+        """Add the given file to the store unless already present, return True if a new object was added."""
+        object_path = self.object_path(digest, mode)
+        if os.path.exists(object_path):
+            return False
+
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        tmp_path = f"{object_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        copy_file(src_path, tmp_path, strategy=strategy)
+        os.chmod(tmp_path, mode & 0o7555)
+        os.replace(tmp_path, object_path)
+        return True
+
+    def collect_garbage(self, referenced: Set[str]) -> int:
+        """Remove objects not stated in the referenced object names, return number of objects removed."""
+        if not os.path.isdir(self.path):
+            return 0
+
+        removed = 0
+        for prefix in os.listdir(self.path):
+            prefix_path = os.path.join(self.path, prefix)
+            for object_name in os.listdir(prefix_path):
+                if object_name not in referenced:
+                    os.unlink(os.path.join(prefix_path, object_name))
+                    removed += 1
+
+        _LOGGER.debug("Removed %d unreferenced objects from %r", removed, self.path)
+        return removed
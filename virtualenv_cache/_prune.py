@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+import fnmatch
+import logging
+from typing import List
+
+import attr
+
+from ._manifest import Manifest
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _matches(path: str, patterns: List[str]) -> bool:
+    """Check whether the given relative path matches any of the given glob patterns.
+
+    Patterns without a slash are matched against names of items at any depth, other patterns against the whole path.
+    """
+    name = path.rpartition("/")[2]
+    return any(
+        fnmatch.fnmatchcase(path if "/" in pattern else name, pattern)
+        for pattern in patterns
+    )
+
+
+@attr.s(slots=True)
+class PruneFilter:
+    """Glob rules stating items of virtual environments that are not stored in the cache.
+
+    Include rules take precedence over exclude rules, items in excluded directories are always excluded.
+    """
+
+    exclude = attr.ib(type=List[str], factory=list)
+    include = attr.ib(type=List[str], factory=list)
+
+    def is_excluded(self, path: str) -> bool:
+        """Check whether the given item is excluded, regardless of its parent directories."""
+        return _matches(path, self.exclude) and not _matches(path, self.include)
+
+    def prune(self, manifest: Manifest) -> List[str]:
+        """Remove excluded items from the manifest, return paths of excluded items that are not in excluded directories."""
+        if not self.exclude:
+            return []
+
+        result = []
+        pruned = set()
+        for path in list(manifest.records):
+            if path.rpartition("/")[0] in pruned:
+                pruned.add(path)
+            elif self.is_excluded(path):
+                pruned.add(path)
+                result.append(path)
+            else:
+                continue
+
+            del manifest.records[path]
+
+        _LOGGER.debug("Pruned %d items from the virtual environment", len(pruned))
+        return result
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+import shutil
+import uuid
+from typing import Collection
+from typing import List
+
+from ._manifest import Manifest
+from ._manifest import ManifestRecord
+
+_LOGGER = logging.getLogger(__name__)
+
+RELOCATIONS = ("rewrite", "none")
+
+# Items of a virtual environment which state its absolute path - pyvenv.cfg, scripts with shebangs and activate scripts.
+_CONFIG_FILE = "pyvenv.cfg"
+_SCRIPTS_DIRS = ("bin", "Scripts")
+
+
+def _is_candidate(path: str) -> bool:
+    """Check whether the given item of a virtual environment can state path to the virtual environment."""
+    if path == _CONFIG_FILE:
+        return True
+
+    directory, _, name = path.rpartition("/")
+    return directory in _SCRIPTS_DIRS and bool(name)
+
+
+def _is_within(path: str, prefix: str) -> bool:
+    """Check whether the given absolute path points into the given directory."""
+    return path == prefix or path.startswith(prefix.rstrip(os.sep) + os.sep)
+
+
+def find_path_dependent(root: str, manifest: Manifest, prefix: str) -> List[str]:
+    """Find items of the given virtual environment stating the given absolute path to it.
+
+    Only pyvenv.cfg and files and symlinks in the scripts directory are checked.
+    """
+    encoded_prefix = os.fsencode(prefix)
+    result = []
+    for record in manifest.records.values():
+        if not _is_candidate(record.path):
+            continue
+
+        if record.type == ManifestRecord.SYMLINK:
+            if _is_within(record.target, prefix):  # type: ignore
+                result.append(record.path)
+        elif record.type == ManifestRecord.FILE:
+            with open(os.path.join(root, *record.path.split("/")), "rb") as f:
+                if encoded_prefix in f.read():
+                    result.append(record.path)
+
+    return result
+
+
+def relocate(
+    root: str, paths: Collection[str], old_prefix: str, new_prefix: str
+) -> int:
+    """Rewrite the given items of the virtual environment to state the new path to it, return number of items rewritten.
+
+    Files are replaced rather than modified in place, as they can be hardlinked to files stored in the cache.
+    """
+    encoded_old_prefix = os.fsencode(old_prefix)
+    encoded_new_prefix = os.fsencode(new_prefix)
+    relocated = 0
+    for path in paths:
+        item_path = os.path.join(root, *path.split("/"))
+        tmp_path = os.path.join(
+            os.path.dirname(item_path), f".{uuid.uuid4().hex}.relocate"
+        )
+        if os.path.islink(item_path):
+            target = os.readlink(item_path)
+            if not _is_within(target, old_prefix):
+                continue
+            os.symlink(new_prefix + target[len(old_prefix) :], tmp_path)
+        else:
+            try:
+                with open(item_path, "rb") as f:
+                    content = f.read()
+            except FileNotFoundError:
+                continue
+
+            if encoded_old_prefix not in content:
+                continue
+
+            with open(tmp_path, "wb") as f:
+                f.write(content.replace(encoded_old_prefix, encoded_new_prefix))
+            shutil.copystat(item_path, tmp_path)
+
+        os.replace(tmp_path, item_path)
+        relocated += 1
+
+    _LOGGER.debug("Relocated %d items from %r to %r", relocated, old_prefix, new_prefix)
+    return relocated
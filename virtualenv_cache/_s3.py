@@ -0,0 +1,509 @@
+#!/usr/bin/env python3
+
+import datetime
+import hashlib
+import hmac
+import io
+import logging
+import os
+import threading
+import time
+import urllib.parse
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from typing import Deque
+from typing import Dict
+from typing import Generator
+from typing import List
+from typing import Optional
+from typing import TYPE_CHECKING
+from typing import Tuple
+
+import attr
+
+from ._exceptions import VirtualenvCacheStorageError
+
+# Modules used only to talk to object stores are imported lazily, they are slow to import.
+if TYPE_CHECKING:  # pragma: no cover
+    import http.client
+    from xml.etree import ElementTree
+
+_LOGGER = logging.getLogger(__name__)
+
+_XML_NAMESPACE = "{http://s3.amazonaws.com/doc/2006-03-01/}"
+# Parts of a multipart upload, except for the last one, cannot be smaller.
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+def _parse_xml(body: bytes) -> "ElementTree.Element":
+    """Parse an XML document stated in a response."""
+    from xml.etree import ElementTree
+
+    return ElementTree.fromstring(body)
+
+
+def _hmac_sha256(key: bytes, msg: str) -> bytes:
+    """Compute HMAC-SHA256 of the given message."""
+    return hmac.new(key, msg.encode(), hashlib.sha256).digest()
+
+
+def _parse_timestamp(value: Optional[str]) -> float:
+    """Parse a timestamp as stated in responses, e.g. 2009-10-12T17:50:30.000Z."""
+    if not value:
+        return 0.0
+
+    return datetime.datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def sign_request(
+    *,
+    method: str,
+    path: str,
+    query: Dict[str, str],
+    headers: Dict[str, str],
+    payload_hash: str,
+    region: str,
+    access_key: str,
+    secret_key: str,
+    now: datetime.datetime,
+) -> str:
+    """Compute the Authorization header for the given request using AWS Signature Version 4.
+
+    All the headers passed are signed, header names are expected to be in lower case.
+    """
+    amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+    scope = f"{now.strftime('%Y%m%d')}/{region}/s3/aws4_request"
+    signed_headers = ";".join(sorted(headers))
+    canonical_request = "\n".join(
+        (
+            method,
+            urllib.parse.quote(path, safe="/~"),
+            "&".join(
+                f"{urllib.parse.quote(k, safe='~')}={urllib.parse.quote(v, safe='~')}"
+                for k, v in sorted(query.items())
+            ),
+            "".join(f"{k}:{' '.join(headers[k].split())}\n" for k in sorted(headers)),
+            signed_headers,
+            payload_hash,
+        )
+    )
+    string_to_sign = "\n".join(
+        (
+            "AWS4-HMAC-SHA256",
+            amz_date,
+            scope,
+            hashlib.sha256(canonical_request.encode()).hexdigest(),
+        )
+    )
+
+    signing_key = f"AWS4{secret_key}".encode()
+    for item in scope.split("/"):
+        signing_key = _hmac_sha256(signing_key, item)
+
+    signature = hmac.new(
+        signing_key, string_to_sign.encode(), hashlib.sha256
+    ).hexdigest()
+    return (
+        f"AWS4-HMAC-SHA256 Credential={access_key}/{scope}, "
+        f"SignedHeaders={signed_headers}, Signature={signature}"
+    )
+
+
+@attr.s(slots=True)
+class S3Client:
+    """A minimal client for S3-compatible object stores, buckets are addressed using path-style requests.
+
+    Requests are signed if credentials are available, connections are kept per thread.
+    """
+
+    _RETRIES = 3
+
+    endpoint_url = attr.ib(type=str)
+    region = attr.ib(type=str, default="us-east-1")
+    access_key = attr.ib(type=Optional[str], default=None, kw_only=True)
+    secret_key = attr.ib(type=Optional[str], default=None, kw_only=True)
+    session_token = attr.ib(type=Optional[str], default=None, kw_only=True)
+    timeout = attr.ib(type=float, default=60.0, kw_only=True)
+    _local = attr.ib(type=threading.local, factory=threading.local, init=False)
+
+    @classmethod
+    def from_environment(cls, endpoint_url: str, region: str) -> "S3Client":
+        """Create a client using credentials stated in the standard AWS environment variables."""
+        return cls(
+            endpoint_url or f"https://s3.{region}.amazonaws.com",
+            region,
+            access_key=os.getenv("AWS_ACCESS_KEY_ID"),
+            secret_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+            session_token=os.getenv("AWS_SESSION_TOKEN"),
+        )
+
+    def _get_connection(self) -> "http.client.HTTPConnection":
+        """Get a connection to the endpoint kept for the current thread."""
+        import http.client
+
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            url = urllib.parse.urlsplit(self.endpoint_url)
+            connection_class = (
+                http.client.HTTPSConnection
+                if url.scheme == "https"
+                else http.client.HTTPConnection
+            )
+            connection = connection_class(url.netloc, timeout=self.timeout)
+            self._local.connection = connection
+
+        return connection
+
+    def _drop_connection(self) -> None:
+        """Close the connection kept for the current thread, a new one is opened on the next request."""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def request(
+        self,
+        method: str,
+        bucket: str,
+        key: str = "",
+        *,
+        query: Optional[Dict[str, str]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        body: bytes = b"",
+        expected: Tuple[int, ...] = (200, 204, 206),
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        """Perform a request and return its status, headers and body, requests are retried on transient errors."""
+        import http.client
+
+        url = urllib.parse.urlsplit(self.endpoint_url)
+        path = f"{url.path.rstrip('/')}/{bucket}"
+        if key:
+            path += f"/{key}"
+        query = query or {}
+
+        for attempt in range(1, self._RETRIES + 1):
+            request_headers = {k.lower(): v for k, v in (headers or {}).items()}
+            request_headers["host"] = url.netloc
+            if self.access_key and self.secret_key:
+                now = datetime.datetime.now(tz=datetime.timezone.utc)
+                payload_hash = hashlib.sha256(body).hexdigest()
+                request_headers["x-amz-date"] = now.strftime("%Y%m%dT%H%M%SZ")
+                request_headers["x-amz-content-sha256"] = payload_hash
+                if self.session_token:
+                    request_headers["x-amz-security-token"] = self.session_token
+                request_headers["authorization"] = sign_request(
+                    method=method,
+                    path=path,
+                    query=query,
+                    headers=request_headers,
+                    payload_hash=payload_hash,
+                    region=self.region,
+                    access_key=self.access_key,
+                    secret_key=self.secret_key,
+                    now=now,
+                )
+
+            request_path = urllib.parse.quote(path, safe="/~")
+            if query:
+                request_path += "?" + urllib.parse.urlencode(
+                    sorted(query.items()), quote_via=urllib.parse.quote
+                )
+
+            try:
+                connection = self._get_connection()
+                connection.request(
+                    method, request_path, body=body or None, headers=request_headers
+                )
+                response = connection.getresponse()
+                response_body = response.read()
+            except (OSError, http.client.HTTPException) as exc:
+                self._drop_connection()
+                if attempt == self._RETRIES:
+                    raise VirtualenvCacheStorageError(
+                        f"Request {method} {request_path!r} failed: {exc}"
+                    ) from exc
+                _LOGGER.debug("Retrying request %s %r: %s", method, request_path, exc)
+                time.sleep(0.1 * 2**attempt)
+                continue
+
+            if response.status >= 500 and attempt < self._RETRIES:
+                _LOGGER.debug(
+                    "Retrying request %s %r with status %d",
+                    method,
+                    request_path,
+                    response.status,
+                )
+                time.sleep(0.1 * 2**attempt)
+                continue
+
+            if response.status not in expected:
+                raise VirtualenvCacheStorageError(
+                    f"Request {method} {request_path!r} failed with status {response.status}: "
+                    f"{response_body[:512].decode(errors='replace')}"
+                )
+
+            return (
+                response.status,
+                {k.lower(): v for k, v in response.getheaders()},
+                response_body,
+            )
+
+        raise AssertionError("unreachable")  # pragma: no cover
+
+    def list_objects(self, bucket: str, prefix: str) -> List[Dict[str, Any]]:
+        """List all the objects with the given prefix, return their keys, sizes and modification timestamps."""
+        result = []
+        query = {"list-type": "2", "prefix": prefix}
+        while True:
+            _, _, body = self.request("GET", bucket, query=query)
+            root = _parse_xml(body)
+            for item in root.iter(f"{_XML_NAMESPACE}Contents"):
+                result.append(
+                    {
+                        "key": item.findtext(f"{_XML_NAMESPACE}Key"),
+                        "size": int(item.findtext(f"{_XML_NAMESPACE}Size") or 0),
+                        "last_modified": _parse_timestamp(
+                            item.findtext(f"{_XML_NAMESPACE}LastModified")
+                        ),
+                    }
+                )
+
+            token = root.findtext(f"{_XML_NAMESPACE}NextContinuationToken")
+            if root.findtext(f"{_XML_NAMESPACE}IsTruncated") != "true" or not token:
+                return result
+
+            query["continuation-token"] = token
+
+    def get_object(
+        self, bucket: str, key: str, *, byte_range: Optional[Tuple[int, int]] = None
+    ) -> Optional[bytes]:
+        """Get content of the given object, None if the object does not exist. The byte range is inclusive."""
+        headers = {}
+        if byte_range is not None:
+            headers["range"] = f"bytes={byte_range[0]}-{byte_range[1]}"
+
+        status, _, body = self.request(
+            "GET", bucket, key, headers=headers, expected=(200, 206, 404)
+        )
+        return body if status != 404 else None
+
+    def put_object(self, bucket: str, key: str, body: bytes) -> None:
+        """Create or overwrite the given object."""
+        self.request("PUT", bucket, key, body=body)
+
+    def delete_objects(self, bucket: str, keys: List[str]) -> None:
+        """Delete the given objects, objects that do not exist are ignored."""
+        for key in keys:
+            self.request("DELETE", bucket, key, expected=(200, 204, 404))
+
+    def create_multipart_upload(self, bucket: str, key: str) -> str:
+        """Start a multipart upload of the given object, return the upload id."""
+        _, _, body = self.request("POST", bucket, key, query={"uploads": ""})
+        upload_id = _parse_xml(body).findtext(f"{_XML_NAMESPACE}UploadId")
+        if not upload_id:
+            raise VirtualenvCacheStorageError(
+                f"No upload id returned for multipart upload of {key!r}"
+            )
+
+        return upload_id
+
+    def upload_part(
+        self, bucket: str, key: str, upload_id: str, part_number: int, body: bytes
+    ) -> str:
+        """Upload a part of a multipart upload, return its ETag."""
+        _, headers, _ = self.request(
+            "PUT",
+            bucket,
+            key,
+            query={"partNumber": str(part_number), "uploadId": upload_id},
+            body=body,
+        )
+        return headers["etag"]
+
+    def complete_multipart_upload(
+        self, bucket: str, key: str, upload_id: str, etags: List[str]
+    ) -> None:
+        """Complete a multipart upload from parts with the given ETags."""
+        body = "".join(
+            f"<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>"
+            for number, etag in enumerate(etags, start=1)
+        )
+        _, _, response_body = self.request(
+            "POST",
+            bucket,
+            key,
+            query={"uploadId": upload_id},
+            body=f"<CompleteMultipartUpload>{body}</CompleteMultipartUpload>".encode(),
+        )
+        # Errors can be reported in the body of a successful response.
+        if b"<Error>" in response_body:
+            raise VirtualenvCacheStorageError(
+                f"Failed to complete multipart upload of {key!r}: {response_body[:512]!r}"
+            )
+
+    def abort_multipart_upload(self, bucket: str, key: str, upload_id: str) -> None:
+        """Abort a multipart upload, uploaded parts are discarded."""
+        self.request(
+            "DELETE", bucket, key, query={"uploadId": upload_id}, expected=(204, 404)
+        )
+
+
+@attr.s(slots=True)
+class MultipartWriter:
+    """A file-like object uploading written data as parts of a multipart upload in parallel.
+
+    Small objects fitting into a single part are uploaded using a single request.
+    """
+
+    client = attr.ib(type=S3Client)
+    bucket = attr.ib(type=str)
+    key = attr.ib(type=str)
+    part_size = attr.ib(type=int, default=MIN_PART_SIZE, kw_only=True)
+    workers = attr.ib(type=int, default=1, kw_only=True)
+    size = attr.ib(type=int, default=0, init=False)
+    _buffer = attr.ib(type=bytearray, factory=bytearray, init=False)
+    _upload_id = attr.ib(type=Optional[str], default=None, init=False)
+    _parts = attr.ib(type=List["Future[str]"], factory=list, init=False)
+    _executor = attr.ib(type=Optional[ThreadPoolExecutor], default=None, init=False)
+
+    def write(self, data: bytes) -> int:
+        """Buffer written data, full parts are uploaded in background."""
+        self._buffer += data
+        self.size += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._submit(bytes(self._buffer[: self.part_size]))
+            del self._buffer[: self.part_size]
+
+        return len(data)
+
+    def flush(self) -> None:
+        """Data are flushed by parts, nothing to do."""
+
+    def _submit(self, part: bytes) -> None:
+        """Upload the given part in background, the number of parts kept in memory is bounded."""
+        if self._upload_id is None:
+            self._upload_id = self.client.create_multipart_upload(self.bucket, self.key)
+            self._executor = ThreadPoolExecutor(max_workers=self.workers)
+
+        in_flight = [f for f in self._parts if not f.done()]
+        if len(in_flight) >= self.workers:
+            in_flight[0].result()
+
+        self._parts.append(
+            self._executor.submit(  # type: ignore
+                self.client.upload_part,
+                self.bucket,
+                self.key,
+                self._upload_id,
+                len(self._parts) + 1,
+                part,
+            )
+        )
+
+    def close(self) -> None:
+        """Upload any remaining data and complete the upload."""
+        if self._upload_id is None:
+            self.client.put_object(self.bucket, self.key, bytes(self._buffer))
+            return
+
+        try:
+            if self._buffer:
+                self._submit(bytes(self._buffer))
+            etags = [f.result() for f in self._parts]
+            self.client.complete_multipart_upload(
+                self.bucket, self.key, self._upload_id, etags
+            )
+        except BaseException:
+            self.abort()
+            raise
+        finally:
+            self._executor.shutdown()  # type: ignore
+
+    def abort(self) -> None:
+        """Abort the upload, nothing is stored."""
+        if self._upload_id is None:
+            return
+
+        for f in self._parts:
+            f.cancel()
+        self._executor.shutdown()  # type: ignore
+        self.client.abort_multipart_upload(self.bucket, self.key, self._upload_id)
+
+
+class RangeReader(io.RawIOBase):
+    """A file-like object reading an object sequentially, ranges ahead are downloaded in parallel."""
+
+    def __init__(
+        self,
+        client: S3Client,
+        bucket: str,
+        key: str,
+        size: int,
+        *,
+        part_size: int = MIN_PART_SIZE,
+        workers: int = 1,
+    ) -> None:
+        """Start downloading first parts of the object."""
+        super().__init__()
+        self._client = client
+        self._bucket = bucket
+        self._key = key
+        self._ranges = self._iter_ranges(size, part_size)
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._pending: Deque["Future[Optional[bytes]]"] = deque()
+        self._chunk = memoryview(b"")
+        for _ in range(workers):
+            self._schedule()
+
+    @staticmethod
+    def _iter_ranges(
+        size: int, part_size: int
+    ) -> Generator[Tuple[int, int], None, None]:
+        """Split the object into inclusive byte ranges."""
+        for start in range(0, size, part_size):
+            yield start, min(start + part_size, size) - 1
+
+    def _schedule(self) -> None:
+        """Start downloading the next range, if any."""
+        byte_range = next(self._ranges, None)
+        if byte_range is not None:
+            self._pending.append(
+                self._executor.submit(
+                    self._client.get_object,
+                    self._bucket,
+                    self._key,
+                    byte_range=byte_range,
+                )
+            )
+
+    def readable(self) -> bool:
+        """The object can be read."""
+        return True
+
+    def readinto(self, b: Any) -> int:
+        """Read data into the given buffer, ranges are consumed in order."""
+        while not self._chunk:
+            if not self._pending:
+                return 0
+
+            chunk = self._pending.popleft().result()
+            if chunk is None:
+                raise VirtualenvCacheStorageError(
+                    f"Object {self._key!r} was removed while being downloaded"
+                )
+            self._chunk = memoryview(chunk)
+            self._schedule()
+
+        size = min(len(b), len(self._chunk))
+        b[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        return size
+
+    def close(self) -> None:
+        """Stop downloading any further ranges."""
+        for f in self._pending:
+            f.cancel()
+        self._executor.shutdown()
+        super().close()
@@ -0,0 +1,628 @@
+#!/usr/bin/env python3
+
+import abc
+import datetime
+import gzip
+import io
+import json
+import logging
+import os
+import shutil
+import socket
+import time
+import urllib.parse
+import zlib
+from typing import Any
+from typing import Callable
+from typing import Collection
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import TYPE_CHECKING
+
+import attr
+
+from ._archive import get_archive_compression
+from ._archive import get_archive_name
+from ._archive import read_archive
+from ._archive import write_archive
+from ._chunks import ChunkLocation
+from ._chunks import PackWriter
+from ._chunks import compute_chunk_digest
+from ._chunks import iter_chunks
+from ._exceptions import VirtualenvCacheConfigError
+from ._exceptions import VirtualenvCacheStorageError
+from ._manifest import Manifest
+from ._manifest import ManifestRecord
+from ._s3 import MultipartWriter
+from ._s3 import RangeReader
+from ._s3 import S3Client
+from .utils import parallel_map
+
+if TYPE_CHECKING:  # pragma: no cover
+    from ._config import Config
+
+_LOGGER = logging.getLogger(__name__)
+
+_USAGE_FILE = "virtualenv-cache-usage.json"
+_PACKAGES_FILE = "virtualenv-cache-packages.json"
+_CHUNKS_FILE = "virtualenv-cache-chunks.json.gz"
+_PACKS_DIR = ".chunks"
+_UNREFERENCED_PACKS_FILE = ".unreferenced-packs.json"
+
+REMOTE_ENTRY_FORMATS = ("archive", "chunks")
+
+
+@attr.s(slots=True)
+class StorageBackend(abc.ABC):
+    """A base class for backends storing cache entries outside of the local filesystem.
+
+    Entries are stored as archives of virtual environments together with metadata about their usage.
+    """
+
+    @abc.abstractmethod
+    def list(self) -> List[Dict[str, Any]]:
+        """List records about entries stored, the most recently used first."""
+
+    @abc.abstractmethod
+    def get(self, entry_id: str, dst_path: str) -> bool:
+        """Restore the virtual environment stored in the given entry, return False if no such entry exists.
+
+        The destination directory is replaced only if the entry exists.
+        """
+
+    @abc.abstractmethod
+    def put(
+        self,
+        entry_id: str,
+        src_path: str,
+        *,
+        packages: Dict[str, str],
+        exclude: Collection[str] = (),
+        base: Optional[str] = None,
+    ) -> int:
+        """Store the given virtual environment as an entry, return the number of bytes stored.
+
+        The entry the virtual environment was restored from can be stated as a base, its data need not be stored again.
+        """
+
+    @abc.abstractmethod
+    def delete(self, entry_id: str) -> None:
+        """Delete the given entry."""
+
+    @abc.abstractmethod
+    def touch(self, entry_id: str, *, hit: bool = False) -> None:
+        """Record use of the given entry, a hit is recorded on restore."""
+
+    @abc.abstractmethod
+    def get_packages(self, entry_id: str) -> Optional[Dict[str, str]]:
+        """Get packages recorded for the given entry, if any."""
+
+    def collect_garbage(self, *, min_age: float = 3600.0) -> int:
+        """Remove data shared by entries no longer referenced by any of them, return the number of objects removed.
+
+        Data are removed once unreferenced for at least min_age seconds, an entry being stored can reference them
+        meanwhile.
+        """
+        return 0
+
+
+@attr.s(slots=True)
+class S3Backend(StorageBackend):
+    """A backend storing cache entries in an S3-compatible object store.
+
+    Each entry is stored under `<prefix><entry id>/` together with metadata about its usage and packages resolved.
+    In the "archive" format, the virtual environment is stored as a compressed archive uploaded and downloaded in
+    parts by a pool of worker threads. In the "chunks" format, files are split into content-defined chunks kept
+    in packs under `<prefix>.chunks/` shared by entries - only chunks not stored in the base entry are uploaded.
+    """
+
+    # Chunks of a pack closer to each other are downloaded using a single range request.
+    _MAX_RANGE_GAP = 256 * 1024
+
+    client = attr.ib(type=S3Client)
+    bucket = attr.ib(type=str)
+    prefix = attr.ib(type=str, default="")
+    entry_format = attr.ib(
+        type=str,
+        default="archive",
+        kw_only=True,
+        validator=attr.validators.in_(REMOTE_ENTRY_FORMATS),
+    )
+    compression = attr.ib(type=str, default="zstd", kw_only=True)
+    compression_level = attr.ib(type=int, default=3, kw_only=True)
+    part_size = attr.ib(type=int, default=8 * 1024 * 1024, kw_only=True)
+    workers = attr.ib(type=int, default=1, kw_only=True)
+
+    @classmethod
+    def from_config(cls, url: str, config: "Config") -> "S3Backend":
+        """Create the backend for the given s3://bucket/prefix URL."""
+        parsed_url = urllib.parse.urlsplit(url)
+        if not parsed_url.netloc:
+            raise VirtualenvCacheConfigError(f"No bucket stated in {url!r}")
+
+        prefix = parsed_url.path.strip("/")
+        return cls(
+            S3Client.from_environment(config.s3_endpoint_url, config.s3_region),
+            parsed_url.netloc,
+            f"{prefix}/" if prefix else "",
+            entry_format=config.remote_entry_format,
+            compression=config.archive_compression,
+            compression_level=config.archive_compression_level,
+            part_size=config.transfer_part_size,
+            workers=config.copy_workers,
+        )
+
+    def _key(self, entry_id: str, name: str) -> str:
+        """Get key of an object stored in the given entry."""
+        return f"{self.prefix}{entry_id}/{name}"
+
+    def _load_json(self, key: str) -> Optional[Any]:
+        """Load the given JSON object, if it exists."""
+        content = self.client.get_object(self.bucket, key)
+        return json.loads(content) if content is not None else None
+
+    def _load_chunks(self, entry_id: str) -> Optional[Dict[str, Any]]:
+        """Load listing of files and their chunks stored in the given entry, if stored in the "chunks" format."""
+        content = self.client.get_object(self.bucket, self._key(entry_id, _CHUNKS_FILE))
+        return json.loads(gzip.decompress(content)) if content is not None else None
+
+    @staticmethod
+    def _find_data(objects: Dict[str, Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Find the object holding the virtual environment given objects of an entry, return its key and size.
+
+        The compression is stated for archives. None is returned for incomplete entries.
+        """
+        # Usage is written last, entries without it are incomplete.
+        if _USAGE_FILE not in objects:
+            return None
+
+        if _CHUNKS_FILE in objects:
+            return {**objects[_CHUNKS_FILE], "compression": None}
+
+        for name, item in objects.items():
+            compression = get_archive_compression(name)
+            if compression is not None:
+                return {**item, "compression": compression}
+
+        return None
+
+    def _list_entry_objects(self, entry_id: str) -> Dict[str, Dict[str, Any]]:
+        """List objects stored in the given entry by their names."""
+        return {
+            os.path.basename(o["key"]): o
+            for o in self.client.list_objects(self.bucket, self._key(entry_id, ""))
+        }
+
+    def list(self) -> List[Dict[str, Any]]:
+        """List records about entries stored, the most recently used first."""
+        objects: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for item in self.client.list_objects(self.bucket, self.prefix):
+            entry_id, _, name = item["key"][len(self.prefix) :].partition("/")
+            if entry_id.startswith(".") or "/" in name:
+                continue
+
+            objects.setdefault(entry_id, {})[name] = item
+
+        data = {entry_id: self._find_data(o) for entry_id, o in objects.items()}
+        entry_ids = [entry_id for entry_id, d in data.items() if d is not None]
+        usages = parallel_map(
+            lambda entry_id: self._load_json(self._key(entry_id, _USAGE_FILE)),
+            entry_ids,
+            self.workers,
+        )
+
+        result = []
+        for entry_id, usage in zip(entry_ids, usages):
+            if usage is None:
+                continue
+
+            result.append(
+                {
+                    "id": entry_id,
+                    "datetime": usage["datetime"],
+                    "hostname": usage["hostname"],
+                    "hits": usage.get("hits", 0),
+                    # Sizes of entries in the "chunks" format are recorded on store.
+                    "size": usage.get("size", data[entry_id]["size"]),  # type: ignore
+                }
+            )
+
+        result.sort(
+            key=lambda r: datetime.datetime.fromisoformat(r["datetime"]).timestamp(),
+            reverse=True,
+        )
+        return result
+
+    def get(self, entry_id: str, dst_path: str) -> bool:
+        """Restore the virtual environment stored in the given entry directly into the destination directory."""
+        data = self._find_data(self._list_entry_objects(entry_id))
+        if data is None:
+            return False
+
+        shutil.rmtree(dst_path, ignore_errors=True)
+        if data["compression"] is None:
+            content = self._load_chunks(entry_id)
+            if content is None:
+                return False
+
+        # A partially restored virtual environment is not left behind.
+        try:
+            if data["compression"] is None:
+                self._get_chunks(entry_id, content, dst_path)
+            else:
+                self._get_archive(data, dst_path)
+        except BaseException:
+            shutil.rmtree(dst_path, ignore_errors=True)
+            raise
+
+        return True
+
+    def _get_archive(self, data: Dict[str, Any], dst_path: str) -> None:
+        """Stream the archive holding the virtual environment, parts are downloaded using range requests."""
+        reader = RangeReader(
+            self.client,
+            self.bucket,
+            data["key"],
+            data["size"],
+            part_size=self.part_size,
+            workers=self.workers,
+        )
+        with io.BufferedReader(reader, buffer_size=1024 * 1024) as f:
+            read_archive(f, dst_path, compression=data["compression"])
+
+    def _get_chunks(
+        self, entry_id: str, content: Dict[str, Any], dst_path: str
+    ) -> None:
+        """Reassemble files of the virtual environment from chunks, packs are downloaded using range requests."""
+        locations: Dict[str, ChunkLocation] = content["locations"]
+        # Chunks are written to all the files (and offsets) they are part of.
+        targets: Dict[str, List[Tuple[str, int]]] = {}
+        files = []
+        directories = []
+        os.makedirs(dst_path)
+        for item in content["records"]:
+            record = ManifestRecord(**{k: v for k, v in item.items() if k != "chunks"})
+            target_path = os.path.join(dst_path, *record.path.split("/"))
+            if record.type == ManifestRecord.DIRECTORY:
+                os.makedirs(target_path, exist_ok=True)
+                directories.append((target_path, record.mode))
+            elif record.type == ManifestRecord.SYMLINK:
+                os.symlink(record.target, target_path)  # type: ignore
+            else:
+                open(target_path, "wb").close()
+                files.append((target_path, record))
+                offset = 0
+                for digest in item["chunks"]:
+                    targets.setdefault(digest, []).append((target_path, offset))
+                    offset += locations[digest][3]
+
+        packs: Dict[str, List[Tuple[int, int, str]]] = {}
+        for digest in targets:
+            pack, offset, length, _ = locations[digest]
+            packs.setdefault(pack, []).append((offset, length, digest))
+
+        ranges = []
+        for pack, chunks in packs.items():
+            chunks.sort()
+            current = [chunks[0]]
+            for chunk in chunks[1:]:
+                end = current[-1][0] + current[-1][1]
+                if (
+                    chunk[0] - end > self._MAX_RANGE_GAP
+                    or chunk[0] + chunk[1] - current[0][0] > self.part_size
+                ):
+                    ranges.append((pack, current))
+                    current = []
+                current.append(chunk)
+            ranges.append((pack, current))
+
+        def _download(item: Tuple[str, List[Tuple[int, int, str]]]) -> None:
+            pack, chunks = item
+            start = chunks[0][0]
+            body = self.client.get_object(
+                self.bucket,
+                self._key(_PACKS_DIR, pack),
+                byte_range=(start, chunks[-1][0] + chunks[-1][1] - 1),
+            )
+            if body is None:
+                raise VirtualenvCacheStorageError(
+                    f"Pack {pack!r} referenced by cache entry {entry_id!r} not found"
+                )
+
+            view = memoryview(body)
+            for offset, length, digest in chunks:
+                chunk = zlib.decompress(view[offset - start : offset - start + length])
+                if compute_chunk_digest(chunk) != digest:
+                    raise VirtualenvCacheStorageError(
+                        f"Chunk {digest!r} referenced by cache entry {entry_id!r} is corrupted"
+                    )
+
+                for target_path, target_offset in targets[digest]:
+                    with open(target_path, "r+b") as f:
+                        f.seek(target_offset)
+                        f.write(chunk)
+
+        parallel_map(_download, ranges, self.workers)
+
+        for target_path, record in files:
+            os.chmod(target_path, record.mode)
+            os.utime(target_path, ns=(record.mtime_ns, record.mtime_ns))
+
+        # Adjust permissions once directories are populated, they can be read-only.
+        for directory_path, mode in reversed(directories):
+            os.chmod(directory_path, mode)
+
+    def put(
+        self,
+        entry_id: str,
+        src_path: str,
+        *,
+        packages: Dict[str, str],
+        exclude: Collection[str] = (),
+        base: Optional[str] = None,
+    ) -> int:
+        """Stream the given virtual environment directly to the object store in the configured format."""
+        data_name = (
+            _CHUNKS_FILE
+            if self.entry_format == "chunks"
+            else get_archive_name(self.compression)
+        )
+        # Data stored in a different format or compression are not overwritten.
+        stale_keys = [
+            o["key"]
+            for name, o in self._list_entry_objects(entry_id).items()
+            if name != data_name
+        ]
+        self.client.delete_objects(self.bucket, stale_keys)
+
+        if self.entry_format == "chunks":
+            size = self._put_chunks(entry_id, src_path, exclude=exclude, base=base)
+        else:
+            size = self._put_archive(
+                self._key(entry_id, data_name), src_path, exclude=exclude
+            )
+
+        self.client.put_object(
+            self.bucket,
+            self._key(entry_id, _PACKAGES_FILE),
+            json.dumps(packages, sort_keys=True).encode(),
+        )
+        self._write_usage(
+            entry_id, hits=0, size=size if self.entry_format == "chunks" else None
+        )
+        return size
+
+    def _put_archive(self, key: str, src_path: str, *, exclude: Collection[str]) -> int:
+        """Stream the given virtual environment as an archive uploaded in parts, return the archive size."""
+        writer = MultipartWriter(
+            self.client,
+            self.bucket,
+            key,
+            part_size=self.part_size,
+            workers=self.workers,
+        )
+        try:
+            write_archive(
+                src_path,
+                writer,  # type: ignore
+                compression=self.compression,
+                level=self.compression_level,
+                threads=self.workers,
+                exclude=exclude,
+            )
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close()
+        return writer.size
+
+    def _put_chunks(
+        self,
+        entry_id: str,
+        src_path: str,
+        *,
+        exclude: Collection[str],
+        base: Optional[str],
+    ) -> int:
+        """Upload chunks of files not stored yet and a listing of files and their chunks, return the entry size.
+
+        Chunks stored in the base entry, or in the most recently used entry if no base is stored, are reused. Other
+        entries are not looked up, loading their listings would cost a request per entry on each store.
+        """
+        locations: Dict[str, ChunkLocation] = {}
+        for candidate in dict.fromkeys(i for i in (base, entry_id) if i):
+            content = self._load_chunks(candidate)
+            if content is not None:
+                locations.update(content["locations"])
+
+        if not locations:
+            entries = self.list()
+            content = self._load_chunks(entries[0]["id"]) if entries else None
+            if content is not None:
+                locations.update(content["locations"])
+
+        known = len(locations)
+        writer = PackWriter(
+            self.client,
+            self.bucket,
+            self._key(_PACKS_DIR, ""),
+            locations=locations,
+            pack_size=self.part_size,
+            compression_level=(
+                max(min(self.compression_level, 9), 0)
+                if self.compression != "none"
+                else 0
+            ),
+            workers=self.workers,
+        )
+
+        manifest = Manifest.from_directory(src_path, digests=False, exclude=exclude)
+        files = list(manifest.files())
+
+        def _chunk_file(record: ManifestRecord) -> List[str]:
+            with open(os.path.join(src_path, *record.path.split("/")), "rb") as f:
+                return [writer.add(chunk) for chunk in iter_chunks(f)]
+
+        try:
+            file_chunks = dict(
+                zip(
+                    (r.path for r in files),
+                    parallel_map(_chunk_file, files, self.workers),
+                )
+            )
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close()
+
+        used = {digest for chunks in file_chunks.values() for digest in chunks}
+        content = {
+            "records": [
+                (
+                    {**r.to_dict(), "chunks": file_chunks[r.path]}
+                    if r.path in file_chunks
+                    else r.to_dict()
+                )
+                for r in manifest.records.values()
+            ],
+            "locations": {digest: locations[digest] for digest in sorted(used)},
+        }
+        body = gzip.compress(json.dumps(content).encode())
+        self.client.put_object(self.bucket, self._key(entry_id, _CHUNKS_FILE), body)
+        _LOGGER.info(
+            "Uploaded %d new chunks (%d bytes), %d chunks were already stored",
+            len(locations) - known,
+            writer.size,
+            known,
+        )
+        return len(body) + sum(locations[digest][2] for digest in used)
+
+    def _write_usage(
+        self, entry_id: str, *, hits: int, size: Optional[int] = None
+    ) -> None:
+        """Write metadata about usage of the given entry, the size is recorded if not computed from listing."""
+        content: Dict[str, Any] = {
+            "hostname": socket.gethostname(),
+            "datetime": datetime.datetime.now(tz=datetime.timezone.utc).isoformat(),
+            "hits": hits,
+        }
+        if size is not None:
+            content["size"] = size
+
+        self.client.put_object(
+            self.bucket,
+            self._key(entry_id, _USAGE_FILE),
+            json.dumps(content).encode(),
+        )
+
+    def delete(self, entry_id: str) -> None:
+        """Delete all the objects stored in the given entry, usage is removed first."""
+        keys = [o["key"] for o in self._list_entry_objects(entry_id).values()]
+        keys.sort(key=lambda k: os.path.basename(k) != _USAGE_FILE)
+        self.client.delete_objects(self.bucket, keys)
+
+    def touch(self, entry_id: str, *, hit: bool = False) -> None:
+        """Record use of the given entry, concurrent updates of the number of hits can be lost."""
+        usage = self._load_json(self._key(entry_id, _USAGE_FILE)) or {}
+        self._write_usage(
+            entry_id, hits=usage.get("hits", 0) + int(hit), size=usage.get("size")
+        )
+
+    def get_packages(self, entry_id: str) -> Optional[Dict[str, str]]:
+        """Get packages recorded for the given entry, if any."""
+        return self._load_json(self._key(entry_id, _PACKAGES_FILE))  # type: ignore
+
+    def collect_garbage(self, *, min_age: float = 3600.0) -> int:
+        """Remove packs not referenced by any entry for at least min_age seconds.
+
+        Packs found unreferenced are recorded with the time they were found and removed by a later collection, so that
+        a pack is kept while an entry being stored references it - even a pack stored long ago by an entry removed
+        meanwhile. Stores are expected to finish within min_age.
+        """
+        packs = []
+        entry_ids = set()
+        unreferenced_key = f"{self.prefix}{_UNREFERENCED_PACKS_FILE}"
+        recorded = False
+        for item in self.client.list_objects(self.bucket, self.prefix):
+            entry_id, _, name = item["key"][len(self.prefix) :].partition("/")
+            if entry_id == _PACKS_DIR:
+                packs.append(item)
+            elif name == _CHUNKS_FILE:
+                entry_ids.add(entry_id)
+            elif item["key"] == unreferenced_key:
+                recorded = True
+
+        if not packs:
+            if recorded:
+                self.client.delete_objects(self.bucket, [unreferenced_key])
+            return 0
+
+        referenced = set()
+        for content in parallel_map(self._load_chunks, sorted(entry_ids), self.workers):
+            if content is not None:
+                referenced.update(
+                    location[0] for location in content["locations"].values()
+                )
+
+        now = time.time()
+        found: Dict[str, float] = (
+            self._load_json(unreferenced_key) or {} if recorded else {}
+        )
+        unused = []
+        pending = {}
+        for item in packs:
+            pack = os.path.basename(item["key"])
+            if pack in referenced:
+                continue
+
+            if min_age <= 0 or now - found.get(pack, now) >= min_age:
+                unused.append(item["key"])
+            else:
+                pending[pack] = found.get(pack, now)
+
+        if pending:
+            self.client.put_object(
+                self.bucket,
+                unreferenced_key,
+                json.dumps(pending, sort_keys=True).encode(),
+            )
+        elif recorded:
+            self.client.delete_objects(self.bucket, [unreferenced_key])
+
+        self.client.delete_objects(self.bucket, unused)
+        return len(unused)
+
+
+_StorageBackendFactory = Callable[[str, "Config"], StorageBackend]
+
+# Backends are picked based on the URL scheme stated in the cache path.
+STORAGE_BACKENDS: Dict[str, _StorageBackendFactory] = {
+    "s3": S3Backend.from_config,
+}
+
+
+def register_storage_backend(scheme: str, factory: _StorageBackendFactory) -> None:
+    """Register a custom storage backend used for cache paths with the given URL scheme."""
+    STORAGE_BACKENDS[scheme] = factory
+
+
+def is_storage_url(url: str) -> bool:
+    """Check whether the given cache path is a URL of a storage backend rather than a local path."""
+    # Windows drive letters are parsed as a scheme.
+    return len(urllib.parse.urlsplit(url).scheme) > 1
+
+
+def get_storage_backend(url: str, config: "Config") -> Optional[StorageBackend]:
+    """Get a backend for the given cache path, None if the cache path is a local path."""
+    if not is_storage_url(url):
+        return None
+
+    scheme = urllib.parse.urlsplit(url).scheme
+    if scheme not in STORAGE_BACKENDS:
+        raise VirtualenvCacheConfigError(
+            f"No storage backend for cache path {url!r}, known URL schemes: {', '.join(STORAGE_BACKENDS)}"
+        )
+
+    return STORAGE_BACKENDS[scheme](url, config)
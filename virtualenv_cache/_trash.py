@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+import argparse
+import errno
+import logging
+import os
+import subprocess
+import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from typing import Optional
+
+# The module is run as a script by spawn_purge(), it does not import the rest of the package to start fast.
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore
+
+_LOGGER = logging.getLogger(__name__)
+
+PURGE_MODES = ("background", "inline")
+
+# Serializes purges of the same trash directory, the file is kept in the trash directory.
+_LOCK_FILE = ".lock"
+
+
+def _scan_tree(path: str, files: List[str], directories: List[str]) -> None:
+    """Collect files and directories in the given tree, directories are listed parents first."""
+    directories.append(path)
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    _scan_tree(entry.path, files, directories)
+                else:
+                    files.append(entry.path)
+    except FileNotFoundError:
+        pass
+
+
+def _unlink(path: str) -> None:
+    """Remove the given file, a file removed meanwhile is not an error."""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def remove_tree(path: str, *, workers: int = 1) -> None:
+    """Remove a directory tree, files are unlinked by a pool of worker threads.
+
+    Unlike `shutil.rmtree', files of large trees are unlinked in parallel which pays off especially on network
+    filesystems. A tree removed concurrently by another process is not an error.
+    """
+    if not os.path.isdir(path) or os.path.islink(path):
+        _unlink(path)
+        return
+
+    files: List[str] = []
+    directories: List[str] = []
+    _scan_tree(path, files, directories)
+    if workers <= 1:
+        for file_path in files:
+            _unlink(file_path)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(_unlink, files))
+    for directory in reversed(directories):
+        try:
+            os.rmdir(directory)
+        except FileNotFoundError:
+            pass
+        except OSError as exc:
+            # Items left behind by a concurrent removal are removed by the next purge.
+            if exc.errno != errno.ENOTEMPTY:
+                raise
+
+
+def move_to_trash(path: str, trash_path: str) -> bool:
+    """Atomically move the given path into the trash directory, return False if it cannot be moved there."""
+    try:
+        os.makedirs(trash_path, exist_ok=True)
+        os.rename(path, os.path.join(trash_path, uuid.uuid4().hex))
+    except FileNotFoundError:
+        # Nothing to be removed.
+        return True
+    except OSError as exc:
+        if exc.errno not in (errno.EXDEV, errno.EACCES, errno.EPERM, errno.EBUSY):
+            raise
+        _LOGGER.debug("Cannot move %r to trash %r: %s", path, trash_path, exc)
+        return False
+
+    return True
+
+
+def get_erased_pattern(cache_path: str) -> str:
+    """Get a glob pattern matching erased caches placed next to the given cache until they are purged."""
+    cache_path = os.path.abspath(cache_path)
+    return os.path.join(
+        os.path.dirname(cache_path), f".{os.path.basename(cache_path)}.erased-*"
+    )
+
+
+def move_erased(cache_path: str) -> Optional[str]:
+    """Atomically move the whole cache next to it so it can be purged, return None if it cannot be moved."""
+    erased_path = get_erased_pattern(cache_path).replace("*", uuid.uuid4().hex)
+    try:
+        os.rename(cache_path, erased_path)
+    except OSError as exc:
+        _LOGGER.debug("Cannot move cache %r to %r: %s", cache_path, erased_path, exc)
+        return None
+
+    return erased_path
+
+
+def purge(trash_path: str, *, workers: int = 1) -> int:
+    """Remove everything placed in the given trash directory, return number of items removed.
+
+    Purges of the same trash directory are serialized, so that items are not removed by multiple processes at once.
+    """
+    if not os.path.isdir(trash_path):
+        return 0
+
+    with open(os.path.join(trash_path, _LOCK_FILE), "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+
+        items = [i for i in os.listdir(trash_path) if i != _LOCK_FILE]
+        for item in items:
+            remove_tree(os.path.join(trash_path, item), workers=workers)
+
+    _LOGGER.debug("Purged %d items from trash %r", len(items), trash_path)
+    return len(items)
+
+
+def spawn_purge(
+    paths: List[str], *, workers: int = 1, trash: bool = True
+) -> "subprocess.Popen[bytes]":
+    """Remove the given trash directories (or whole trees if not trash) in a detached background process."""
+    args = [sys.executable, os.path.abspath(__file__), "--workers", str(workers)]
+    if not trash:
+        args.append("--trees")
+
+    _LOGGER.debug("Purging %r in background", paths)
+    return subprocess.Popen(
+        [*args, *paths],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        close_fds=True,
+        start_new_session=True,
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Purge the given trash directories or remove the given trees, run by spawn_purge()."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--trees", action="store_true")
+    parser.add_argument("paths", nargs="+")
+    args = parser.parse_args(argv)
+    for path in args.paths:
+        if args.trees:
+            remove_tree(path, workers=args.workers)
+        else:
+            purge(path, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import logging
+import math
+import os
+import random
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from ._manifest import ManifestRecord
+from ._manifest import hash_file
+from .utils import parallel_map
+
+_LOGGER = logging.getLogger(__name__)
+
+VERIFY_MODES = ("none", "digest")
+
+
+def sample_files(
+    records: Iterable[ManifestRecord], sample: float
+) -> List[ManifestRecord]:
+    """Pick a random subset of the given file records of the given ratio, at least one file is picked if any given."""
+    records = list(records)
+    if sample >= 1:
+        return records
+
+    count = min(len(records), max(1, math.ceil(len(records) * sample)))
+    return random.sample(records, count)
+
+
+def _check_file(path: str, record: ManifestRecord, check_digest: bool) -> bool:
+    """Check the given file matches its record - its size always, its digest if requested."""
+    try:
+        if os.lstat(path).st_size != record.size:
+            return False
+    except FileNotFoundError:
+        return False
+
+    if not check_digest or record.digest is None:
+        return True
+
+    return hash_file(path) == record.digest
+
+
+def verify_files(
+    records: Iterable[ManifestRecord],
+    get_path: Callable[[ManifestRecord], str],
+    *,
+    sample: float = 1.0,
+    workers: int = 1,
+) -> List[str]:
+    """Verify files described by the given records, return relative paths of files that are missing or corrupt.
+
+    Sizes of all the files are checked, digests only of the given ratio of files picked at random.
+    """
+    records = list(records)
+    sampled = {r.path for r in sample_files(records, sample)}
+    results = parallel_map(
+        lambda r: _check_file(get_path(r), r, r.path in sampled), records, workers
+    )
+    _LOGGER.debug(
+        "Checked sizes of %d files and digests of %d files", len(records), len(sampled)
+    )
+    return [r.path for r, ok in zip(records, results) if not ok]
+
+
+def verify_archive_files(
+    records: Iterable[ManifestRecord],
+    archive_files: Dict[str, Tuple[int, Optional[str]]],
+) -> List[str]:
+    """Verify files stored in an archive, given sizes and digests (if computed) of its members; return corrupt paths."""
+    corrupt = []
+    for record in records:
+        size, digest = archive_files.get(record.path, (None, None))
+        if size != record.size or (
+            digest is not None and record.digest is not None and digest != record.digest
+        ):
+            corrupt.append(record.path)
+
+    return corrupt
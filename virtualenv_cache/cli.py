@@ -3,12 +3,14 @@
 import json
 import logging
 import os
+import signal
 import sys
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
 
 import click
-import daiquiri
-from rich.console import Console
-from rich.table import Table
 
 from virtualenv_cache import Cache
 from virtualenv_cache import Config
@@ -16,13 +18,94 @@ from virtualenv_cache import __title__
 from virtualenv_cache import __version__
 from virtualenv_cache import VirtualenvCacheException
 from virtualenv_cache import VirtualenvCacheMiss
+from virtualenv_cache import VirtualenvCachePartialHit
+from virtualenv_cache._metrics import METRICS_FORMATS
+from virtualenv_cache._metrics import Metrics
 from virtualenv_cache.utils import cwd
 
-daiquiri.setup(level=logging.INFO)
+# Modules needed only by some of the commands (rich, daiquiri, the daemon) are imported lazily to keep start-up fast.
+
+_LOG_FORMAT = "%(asctime)s [%(process)d] %(levelname)-8.8s %(name)s: %(message)s"
+
+
+def _setup_logging() -> None:
+    """Set up logging to the standard error output, daiquiri is used only to produce colored output in a terminal."""
+    if sys.stderr.isatty():
+        import daiquiri
+
+        daiquiri.setup(level=logging.INFO)
+        return
+
+    # Handlers are removed by hand, the force argument of basicConfig is not available before Python 3.8.
+    root_logger = logging.getLogger()
+    for handler in root_logger.handlers[:]:
+        root_logger.removeHandler(handler)
+        handler.close()
+
+    # The same output daiquiri produces when not writing to a terminal.
+    logging.basicConfig(level=logging.INFO, format=_LOG_FORMAT, stream=sys.stderr)
+    logging.captureWarnings(True)
+
+
+_setup_logging()
 
 _LOGGER = logging.getLogger(__title__)
 
 
+def _run_command(
+    command: str, config_path: str, metrics: Optional[Metrics] = None
+) -> Any:
+    """Run the given command in the daemon if it is running, in this process otherwise."""
+    from virtualenv_cache._daemon import DaemonClient
+    from virtualenv_cache._daemon import run_command
+
+    client = DaemonClient.connect()
+    if client is not None:
+        return client.call(
+            command,
+            config_path=config_path,
+            work_dir=os.getcwd(),
+            verbose=_LOGGER.isEnabledFor(logging.DEBUG),
+            metrics=metrics,
+        )
+
+    return run_command(
+        Cache(config=Config.load(config_path), metrics=metrics or Metrics()), command
+    )
+
+
+def _write_metrics(
+    metrics: Metrics, metrics_file: Optional[str], metrics_format: str
+) -> None:
+    """Write metrics collected to the given file, if requested; a failure to do so does not fail the command."""
+    if not metrics_file:
+        return
+
+    try:
+        metrics.dump(metrics_file, format=metrics_format)
+    except OSError as exc:
+        _LOGGER.warning("Failed to write metrics to %r: %s", metrics_file, exc)
+
+
+def _report_environments(reports: List[Dict[str, Any]], error_exit_code: int) -> None:
+    """Print reports about environments restored or stored in JSON and exit with the most severe exit code.
+
+    Exit codes match the ones used for a single environment - the given one for an error, 1 for a cache miss and 3
+    for a partial hit.
+    """
+    json.dump(reports, sys.stdout, sort_keys=True, indent=2)
+    click.echo()
+
+    outcomes = {report["outcome"] for report in reports}
+    for outcome, exit_code in (
+        ("error", error_exit_code),
+        ("miss", 1),
+        ("partial_hit", 3),
+    ):
+        if outcome in outcomes:
+            sys.exit(exit_code)
+
+
 @click.group()
 @click.option(
     "--verbose",
@@ -96,22 +179,60 @@ def init(config_path: str, work_dir: str) -> None:
     help="Use the specified working directory as project root.",
     envvar="VIRTUALENV_CACHE_WORK_DIR",
 )
-def restore(config_path: str, work_dir: str) -> None:
+@click.option(
+    "--metrics-file",
+    type=str,
+    default=None,
+    metavar="FILE",
+    help="Write durations of phases, files and bytes copied and the outcome of the command to the given file.",
+    envvar="VIRTUALENV_CACHE_METRICS_FILE",
+)
+@click.option(
+    "--metrics-format",
+    type=click.Choice(METRICS_FORMATS),
+    default="json",
+    show_default=True,
+    help="Format of the metrics file.",
+    envvar="VIRTUALENV_CACHE_METRICS_FORMAT",
+)
+def restore(
+    config_path: str, work_dir: str, metrics_file: Optional[str], metrics_format: str
+) -> None:
     """Restore a Python environment from the cache.
 
     Check requirements files present in the project and pick a cached virtual environment, if available.
-    If no virtual environment is available, signalize it with exit code 1 (cache miss).
+    If no virtual environment is available, signalize it with exit code 1 (cache miss). If the nearest cached
+    virtual environment was restored instead, packages that need to be installed and removed are printed in
+    JSON and exit code 3 is used (partial hit).
+
+    If environments are stated in the configuration file, all of them are restored concurrently and a report
+    stating the outcome of each environment is printed in JSON.
     """
+    metrics = Metrics()
     with cwd(work_dir):
         try:
-            config = Config.load(config_path)
-            Cache(config=config).restore()
+            result = _run_command("restore", config_path, metrics)
+        except VirtualenvCachePartialHit as exc:
+            _LOGGER.warning(str(exc))
+            json.dump(
+                {"install": exc.install, "remove": exc.remove},
+                sys.stdout,
+                sort_keys=True,
+                indent=2,
+            )
+            click.echo()
+            sys.exit(3)
         except VirtualenvCacheMiss as exc:
             _LOGGER.error(str(exc))
             sys.exit(1)
         except Exception as exc:
             _LOGGER.exception(str(exc))
             sys.exit(2)
+        finally:
+            _write_metrics(metrics, metrics_file, metrics_format)
+
+        if result is not None:
+            _report_environments(result, 2)
 
 
 @cli.command()
@@ -135,15 +256,54 @@ def restore(config_path: str, work_dir: str) -> None:
     help="Use the specified working directory as project root.",
     envvar="VIRTUALENV_CACHE_WORK_DIR",
 )
-def store(config_path: str, work_dir: str) -> None:
-    """Store the current state of virtual environment to the cache."""
+@click.option(
+    "--metrics-file",
+    type=str,
+    default=None,
+    metavar="FILE",
+    help="Write durations of phases, files and bytes copied and the outcome of the command to the given file.",
+    envvar="VIRTUALENV_CACHE_METRICS_FILE",
+)
+@click.option(
+    "--metrics-format",
+    type=click.Choice(METRICS_FORMATS),
+    default="json",
+    show_default=True,
+    help="Format of the metrics file.",
+    envvar="VIRTUALENV_CACHE_METRICS_FORMAT",
+)
+@click.option(
+    "--base",
+    is_flag=True,
+    help="Store the virtual environment as the base layer keyed by lock files stated in base_lock_paths.",
+)
+def store(
+    config_path: str,
+    work_dir: str,
+    metrics_file: Optional[str],
+    metrics_format: str,
+    base: bool,
+) -> None:
+    """Store the current state of virtual environment to the cache.
+
+    If base lock files are configured and the base layer is stored, only changes done on top of it are stored.
+    If environments are stated in the configuration file, all of them are stored concurrently and a report
+    stating the outcome of each environment is printed in JSON.
+    """
+    metrics = Metrics()
     with cwd(work_dir):
         try:
-            config = Config.load(config_path)
-            Cache(config=config).store()
+            result = _run_command(
+                "store-base" if base else "store", config_path, metrics
+            )
         except VirtualenvCacheException as exc:
             _LOGGER.error(str(exc))
             sys.exit(1)
+        finally:
+            _write_metrics(metrics, metrics_file, metrics_format)
+
+        if result is not None:
+            _report_environments(result, 1)
 
 
 @cli.command()
@@ -167,15 +327,35 @@ def store(config_path: str, work_dir: str) -> None:
     help="Use the specified working directory as project root.",
     envvar="VIRTUALENV_CACHE_WORK_DIR",
 )
-def erase(config_path: str, work_dir: str) -> None:
+@click.option(
+    "--metrics-file",
+    type=str,
+    default=None,
+    metavar="FILE",
+    help="Write durations of phases, files and bytes copied and the outcome of the command to the given file.",
+    envvar="VIRTUALENV_CACHE_METRICS_FILE",
+)
+@click.option(
+    "--metrics-format",
+    type=click.Choice(METRICS_FORMATS),
+    default="json",
+    show_default=True,
+    help="Format of the metrics file.",
+    envvar="VIRTUALENV_CACHE_METRICS_FORMAT",
+)
+def erase(
+    config_path: str, work_dir: str, metrics_file: Optional[str], metrics_format: str
+) -> None:
     """Erase the cache."""
+    metrics = Metrics()
     with cwd(work_dir):
         try:
-            config = Config.load(config_path)
-            Cache(config=config).erase()
+            _run_command("erase", config_path, metrics)
         except VirtualenvCacheException as exc:
             _LOGGER.error(str(exc))
             sys.exit(1)
+        finally:
+            _write_metrics(metrics, metrics_file, metrics_format)
 
 
 @cli.command("list")
@@ -212,8 +392,7 @@ def list_(config_path: str, format: str, work_dir: str) -> None:
     """List available cached virtual environments."""
     with cwd(work_dir):
         try:
-            config = Config.load(config_path)
-            result = Cache(config=config).list()
+            result = _run_command("list", config_path)
         except VirtualenvCacheException as exc:
             _LOGGER.error(str(exc))
             sys.exit(1)
@@ -222,14 +401,25 @@ def list_(config_path: str, format: str, work_dir: str) -> None:
             if not result:
                 return
 
+            from rich.console import Console
+            from rich.table import Table
+
             table = Table(title="Cached Python environments")
 
             table.add_column("ID", justify="center", style="cyan", no_wrap=True)
             table.add_column("Hostname", style="magenta")
             table.add_column("Last used", justify="left", style="green")
+            table.add_column("Size", justify="right", style="yellow")
+            table.add_column("Hits", justify="right")
 
             for entry in result:
-                table.add_row(entry["id"], entry["hostname"], entry["datetime"])
+                table.add_row(
+                    entry["id"],
+                    entry["hostname"],
+                    entry["datetime"],
+                    str(entry["size"]) if entry["size"] is not None else "-",
+                    str(entry["hits"]),
+                )
 
             console = Console()
             console.print(table)
@@ -240,4 +430,130 @@ def list_(config_path: str, format: str, work_dir: str) -> None:
             raise NotImplementedError(f"Unknown output format {format!r}")
 
 
+@cli.command()
+@click.option(
+    "--config-path",
+    "-c",
+    type=str,
+    default=Config.DEFAULT_CONFIG_PATH,
+    metavar="CONFIG.toml",
+    show_default=True,
+    help="A path to the virtualenv-cache configuration file.",
+    envvar="VIRTUALENV_CACHE_CONFIG_PATH",
+)
+@click.option(
+    "--format",
+    type=click.Choice(["table", "json"]),
+    default="table",
+    metavar="FMT",
+    show_default=True,
+    help="Format used to report verified environments.",
+    envvar="VIRTUALENV_CACHE_FORMAT",
+)
+@click.option(
+    "--work-dir",
+    "-w",
+    type=str,
+    default=os.getcwd(),
+    metavar="DIR",
+    show_default=True,
+    help="Use the specified working directory as project root.",
+    envvar="VIRTUALENV_CACHE_WORK_DIR",
+)
+@click.option(
+    "--metrics-file",
+    type=str,
+    default=None,
+    metavar="FILE",
+    help="Write durations of phases, files and bytes checked and the outcome of the command to the given file.",
+    envvar="VIRTUALENV_CACHE_METRICS_FILE",
+)
+@click.option(
+    "--metrics-format",
+    type=click.Choice(METRICS_FORMATS),
+    default="json",
+    show_default=True,
+    help="Format of the metrics file.",
+    envvar="VIRTUALENV_CACHE_METRICS_FORMAT",
+)
+def verify(
+    config_path: str,
+    format: str,
+    work_dir: str,
+    metrics_file: Optional[str],
+    metrics_format: str,
+) -> None:
+    """Verify cached virtual environments against digests recorded in their manifests.
+
+    Corrupt cache entries are moved to quarantine and signalized with exit code 1. Digests of the ratio of files
+    stated in the `verify_sample' configuration option are checked.
+    """
+    metrics = Metrics()
+    with cwd(work_dir):
+        try:
+            result = _run_command("verify", config_path, metrics)
+        except VirtualenvCacheException as exc:
+            _LOGGER.error(str(exc))
+            sys.exit(1)
+        finally:
+            _write_metrics(metrics, metrics_file, metrics_format)
+
+        if format == "table":
+            if result:
+                from rich.console import Console
+                from rich.table import Table
+
+                table = Table(title="Verified Python environments")
+
+                table.add_column("ID", justify="center", style="cyan", no_wrap=True)
+                table.add_column("Files", justify="right")
+                table.add_column("Corrupt", justify="right", style="red")
+
+                for entry in result:
+                    table.add_row(
+                        entry["id"], str(entry["files"]), str(len(entry["corrupt"]))
+                    )
+
+                console = Console()
+                console.print(table)
+        elif format == "json":
+            json.dump(result, sys.stdout, sort_keys=True, indent=2)
+            click.echo("\n")
+        else:
+            raise NotImplementedError(f"Unknown output format {format!r}")
+
+        if any(entry["corrupt"] for entry in result):
+            sys.exit(1)
+
+
+@cli.command()
+@click.option(
+    "--socket-path",
+    type=str,
+    default=None,
+    metavar="PATH",
+    show_default="$XDG_RUNTIME_DIR/virtualenv-cache-$UID.sock",
+    help="A path to the Unix socket the daemon listens on.",
+    envvar="VIRTUALENV_CACHE_SOCKET",
+)
+def daemon(socket_path: Optional[str]) -> None:
+    """Run a daemon serving cache commands over a Unix socket.
+
+    While the daemon is running, the restore, store, list, erase and verify commands are served by it - digests of lock
+    files are kept in memory across commands and commands are run one at a time.
+    """
+    # Make sure the socket gets removed on termination.
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    from virtualenv_cache._daemon import CacheDaemon
+    from virtualenv_cache._daemon import get_socket_path
+
+    try:
+        CacheDaemon(socket_path or get_socket_path()).serve_forever()
+    except VirtualenvCacheException as exc:
+        _LOGGER.error(str(exc))
+        sys.exit(1)
+    except KeyboardInterrupt:
+        pass
+
+
 __name__ == "__main__" and cli()
@@ -1,10 +1,18 @@
 #!/usr/bin/env python3
 
 import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
 from typing import Generator
+from typing import Iterable
+from typing import List
 from typing import Optional
+from typing import TypeVar
 from contextlib import contextmanager
 
+_T = TypeVar("_T")
+_R = TypeVar("_R")
+
 
 @contextmanager
 def cwd(target_dir: Optional[str]) -> Generator[None, None, None]:
@@ -16,3 +24,14 @@ def cwd(target_dir: Optional[str]) -> Generator[None, None, None]:
         yield
     finally:
         os.chdir(old_dir)
+
+
+def parallel_map(
+    func: Callable[[_T], _R], items: Iterable[_T], workers: int
+) -> List[_R]:
+    """Apply the function on all the items using a pool of worker threads, results keep order of items."""
+    if workers <= 1:
+        return [func(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(func, items))